@@ -11,21 +11,29 @@ Description and explanations for the code will be placed her.
 """
 
 
+from uuid import uuid4
 from dash import Dash, html, Input, Output, State, callback, ctx, no_update
 from dash.exceptions import PreventUpdate
 #import dash_bootstrap_components as dbc
 
-from units import css, header, unit_0, unit_1, unit_2, unit_3, unit_4, unit_5, unit_6, unit_7, unit_8, footer
-from data_access import check_account
-from data_processing import get_dataframes
+from units import css, header, unit_0, unit_1, unit_2, unit_3, unit_4, unit_5, unit_6, unit_7, unit_8, footer, UNIT_COLUMNS
+from data_access import fetch_date_range, fetch_statistics
+from data_processing import get_dataframes, get_timeline_data
+from data_caching import account_index
+from data_cancellation import superseding_load, check_cancelled, LoadCancelled
 from data_filtering import subset_data_by_dates, subset_data_by_selector_values
 from table_toolkit import read_json, to_json, to_list_of_dicts
-from table_toolkit import make_statistics_table, make_diary_table, prettify_diary_table, make_probably_bad_foods_table
-from developer_toolkit import get_callback_args, get_default_values, make_handy_namespace
+from table_toolkit import make_statistics_table, make_statistics_table_from_counts, make_diary_table, prettify_diary_table, make_probably_bad_foods_table
+from table_toolkit import finish_diary_table, make_probably_bad_foods_table_from_counts, make_counts_table
+from data_out_of_core import (spill_account, read_date_range, read_statistics, read_diary, read_timeline, read_foodstuff_counts,
+                              read_meal_counts, read_combination_counts, read_foodstuff_flags)
+from index_advisor import print_index_report
+from developer_toolkit import get_callback_args, get_default_values, make_handy_namespace, get_columns_needed
 from computations import get_dates_range
-from plotting_toolkit import make_figure
+from plotting_toolkit import make_figure, make_figure_from_counts, UNIT_TOP_N
 
 from constants import DEBUG, ERR_PREFIX, ACCOUNT, A, B, C, D, E  # values of selectors for reference
+from constants import LAZY_HISTORY, RECENT_WINDOW_DAYS, STATISTICS_IN_SQL, LAZY_COLUMNS, OUT_OF_CORE_DIR, DAILY_SUMMARY
 
 
 # Instantiate an application object
@@ -46,10 +54,159 @@ app.layout = html.Div([header,
                        footer], 
                        style=css)
 
+# The engineered columns of the eating data which the units of the layout read (the debugging tables show all of them)
+eating_columns = get_columns_needed(UNIT_COLUMNS, app.layout.children) if LAZY_COLUMNS and not DEBUG else None
+
+# In the out-of-core mode the units receive only the account and its dates (store_4) and query its DuckDB file
+# (see data_out_of_core.py), the stores of the df's (store_1, store_2, store_3) stay empty
+stores = ['store_4'] if OUT_OF_CORE_DIR else None
+stores_names = ['loaded_dates'] if OUT_OF_CORE_DIR else None
+
 
 
 ##### CALLBACK FUNCTIONS #####
 
+def make_stores_data(df_eating, df_symptoms):
+    """
+    Makes the data which is saved in the "store" dash-components (and the "Probably bad foods table")
+    Used by `update_unit_0` and `update_history`
+
+    Returns:
+        (data_probably_bad_foods, json_eating, json_symptomreport, json_diary)
+    """
+    # Make the diary table 
+    df_diary = make_diary_table(df_eating, df_symptoms)
+    check_cancelled()  # superseded by a newer search? (see data_cancellation.py)
+
+    # Get the data for the "Probably bad foods table"
+    data_probably_bad_foods = to_list_of_dicts(make_probably_bad_foods_table(df_eating))
+
+    # Store the data (as str in json format) in the user's browser session
+    json_eating = to_json(df_eating)  # str in json format
+    json_symptomreport = to_json(df_symptoms)  # str in json format
+    json_diary = to_json(df_diary)
+    return (data_probably_bad_foods, json_eating, json_symptomreport, json_diary)
+
+
+
+def search_account(value):
+    """
+    Searches for the passed in account (value) - the load of `update_unit_0`
+    Returns the values for the Output objects of `update_unit_0`
+
+    value: int
+    """
+    # Unknown account -> answered without a query (see `AccountIndex` on data_caching.py)
+    if account_index is not None and not account_index.exists(value):
+        unit_0_message_1 = f"{ACCOUNT} {value} nicht gefunden"
+        return (unit_0_message_1, *([no_update]*9))  # count the Output objects
+
+    # The data goes into the account's DuckDB file instead (see data_out_of_core.py)
+    if OUT_OF_CORE_DIR:
+        return search_account_out_of_core(value)
+
+    # Only the most recent weeks first (the older history is loaded by `update_history`)
+    start_date = None
+    if LAZY_HISTORY:
+        history_min_date, history_max_date = fetch_date_range(value)
+        if history_max_date:
+            start_date, _ = get_dates_range(history_max_date, RECENT_WINDOW_DAYS)
+
+    # Check the account and get the data from the data base (one query)
+    df_eating, df_symptoms, res = get_dataframes(account_id=value, start_date=start_date,  # two df's and the status
+                                                 columns=eating_columns)
+
+    if res is ValueError:  # will not be raised - just to tell that the input is bad - to avoid SQl injection
+        unit_0_message_1 = "Ungültige Eingabe"
+        return (unit_0_message_1, *([no_update]*9))  # count the Output objects
+    elif res is None:
+        unit_0_message_1 = f"{ACCOUNT} {value} nicht gefunden"
+        return (unit_0_message_1, *([no_update]*9))  # count the Output objects
+    elif res is False:
+        unit_0_message_1 = f"Keine Informationen für {ACCOUNT} {value} vorhanden"
+        return (unit_0_message_1, *([no_update]*9))  # count the Output objects
+    else:
+        unit_0_message_1 = ""
+        unit_0_message_2 = f"Informationen über {ACCOUNT} {value}"  # h-tag header
+
+    # Make the diary table, the "Probably bad foods table" and the data (json) for the stores
+    data_probably_bad_foods, json_eating, json_symptomreport, json_diary = make_stores_data(df_eating, df_symptoms)
+
+    # Get min max dates to prettify the date picker
+    min_date, max_date = get_dates_range(df_eating, df_symptoms)
+
+    # The dates loaded so far (the date picker allows the whole history)
+    if LAZY_HISTORY:
+        min_date = history_min_date
+    loaded_dates = {'account_id': value, 'start_date': start_date, 'min_date': str(min_date)[:10]}
+
+    # Update the corresponding dash components with these values:
+    # (must correspond to the `Output` arguments in the decorator of `update_unit_0`)
+    return (unit_0_message_1,         #Output(component_id='unit_0_message_1', component_property='children')
+            unit_0_message_2,         #Output(component_id='unit_0_message_2', component_property='children')
+            min_date,                 #Output(component_id='unit_1_selector_1', component_property='min_date_allowed')
+            max_date,                 #Output(component_id='unit_1_selector_1', component_property='max_date_allowed')
+            max_date,                 #Output(component_id='unit_1_selector_1', component_property='initial_visible_month')
+            data_probably_bad_foods,  #Output(component_id='unit_8_table_1', component_property='data')
+            json_eating,              #Output(component_id='store_1', component_property='data')
+            json_symptomreport,       #Output(component_id='store_2', component_property='data')
+            json_diary,               #Output(component_id='store_3', component_property='data')
+            loaded_dates)             #Output(component_id='store_4', component_property='data')
+
+
+
+def search_account_out_of_core(value):
+    """
+    `search_account` in the out-of-core mode (OUT_OF_CORE_DIR):
+    the data of the account is spilled into its DuckDB file (unless the file is up to date),
+    only the "Probably bad foods table" and the account with its dates (store_4) are sent to the browser
+
+    value: int
+    """
+    # Check the account and write its file (the eating data in chunks)
+    res = spill_account(value)
+
+    if res is ValueError:  # will not be raised - just to tell that the input is bad - to avoid SQl injection
+        unit_0_message_1 = "Ungültige Eingabe"
+        return (unit_0_message_1, *([no_update]*9))  # count the Output objects
+    elif res is None:
+        unit_0_message_1 = f"{ACCOUNT} {value} nicht gefunden"
+        return (unit_0_message_1, *([no_update]*9))  # count the Output objects
+    elif res is False:
+        unit_0_message_1 = f"Keine Informationen für {ACCOUNT} {value} vorhanden"
+        return (unit_0_message_1, *([no_update]*9))  # count the Output objects
+    else:
+        unit_0_message_1 = ""
+        unit_0_message_2 = f"Informationen über {ACCOUNT} {value}"  # h-tag header
+
+    # The "Probably bad foods table" from the numbers per foodstuff
+    data_probably_bad_foods = to_list_of_dicts(make_probably_bad_foods_table_from_counts(read_foodstuff_flags(value)))
+
+    # Get min max dates to prettify the date picker (and for the dropdown on unit_1)
+    min_date, max_date = read_date_range(value)
+    loaded_dates = {'account_id': value, 'start_date': None, 'min_date': str(min_date)[:10], 'max_date': str(max_date)[:10]}
+
+    # (must correspond to the `Output` arguments in the decorator of `update_unit_0`)
+    return (unit_0_message_1, unit_0_message_2,
+            min_date, max_date, max_date,
+            data_probably_bad_foods,
+            no_update, no_update, no_update,   # store_1, store_2, store_3
+            loaded_dates)                      # store_4
+
+
+
+# The id of the user's browser session (to cancel the superseded searches, see data_cancellation.py)
+@callback(
+    Output(component_id='store_session', component_property='data'),
+    Input(component_id='store_session', component_property='modified_timestamp'),
+    State(component_id='store_session', component_property='data'))
+def init_session(modified_timestamp, session_id):
+    if session_id:
+        raise PreventUpdate
+    return uuid4().hex
+
+
+
 # UNIT 0: the "Konto Suchen" section
 @callback(  #this is a plotly-dash decorator
     Output(component_id='unit_0_message_1', component_property='children'), # not found message
@@ -61,76 +218,98 @@ app.layout = html.Div([header,
     Output(component_id='store_1', component_property='data'),
     Output(component_id='store_2', component_property='data'),
     Output(component_id='store_3', component_property='data'),
+    Output(component_id='store_4', component_property='data'),
     Input(component_id='unit_0_button', component_property='n_clicks'),
     State(component_id='unit_0_inputbox', component_property='value'),
+    State(component_id='store_session', component_property='data'),
     prevent_initial_call=True)
-def update_unit_0(n_clicks, value):
+def update_unit_0(n_clicks, value, session_id):
     """
     TODO: docs
 
-    Searches for the passed in account (value)
+    Searches for the passed in account (value), see `search_account`
     Returns messages (not found / no data / yes data)
     Saves the data in the "store" dash-components (basically in the user's browser session)
+    A newer search of the same session cancels this one (its queries and the pandas work, see data_cancellation.py),
+    each query of the search is limited by STATEMENT_TIMEOUT (constants.py).
 
     n_clicks: int (just a placeholder, i.e. will not be used in this function at all)
     value: None or int
+    session_id: str (see `init_session`)
     """
     # the ´value´ is the value of the dcc.Input-box i.e. the account number
     if not value:
         raise PreventUpdate  # plotly-dash thing
-    
-    # Check the account
-    res = check_account(account_id=value)
-
-    if res is ValueError:  # will not be raised - just to tell that the input is bad - to avoid SQl injection
-        unit_0_message_1 = "Ungültige Eingabe"
-        return (unit_0_message_1, *([no_update]*8))  # count the Output objects
-    elif res is None:
-        unit_0_message_1 = f"{ACCOUNT} {value} nicht gefunden"
-        return (unit_0_message_1, *([no_update]*8))  # count the Output objects
-    elif res is False:
-        unit_0_message_1 = f"Keine Informationen für {ACCOUNT} {value} vorhanden"
-        return (unit_0_message_1, *([no_update]*8))  # count the Output objects
-    else:
-        unit_0_message_1 = ""
-        unit_0_message_2 = f"Informationen über {ACCOUNT} {value}"  # h-tag header
 
+    try:
+        with superseding_load(session_id):   # cancels the search still running for this session (e.g. a second click)
+            return search_account(value)
+    except LoadCancelled:
+        raise PreventUpdate  # the newer search updates the page
+    except TimeoutError:
+        unit_0_message_1 = f"Zeitüberschreitung beim Laden von {ACCOUNT} {value}"
+        return (unit_0_message_1, *([no_update]*9))  # count the Output objects
+
+
+
+# The older history (LAZY_HISTORY mode only)
+@callback(
+    Output(component_id='unit_8_table_1', component_property='data', allow_duplicate=True),
+    Output(component_id='store_1', component_property='data', allow_duplicate=True),
+    Output(component_id='store_2', component_property='data', allow_duplicate=True),
+    Output(component_id='store_3', component_property='data', allow_duplicate=True),
+    Output(component_id='store_4', component_property='data', allow_duplicate=True),
+    Input(component_id='unit_1_selector_1', component_property='start_date'),   # date picker
+    Input(component_id='unit_1_selector_2', component_property='value'),        # dropdown
+    State(component_id='store_4', component_property='data'),
+    State(component_id='store_session', component_property='data'),
+    prevent_initial_call=True)
+def update_history(start_date, dropdown_value, loaded_dates, session_id):
+    """
+    Loads the older history of the account when the user widens the date picker range
+    beyond the loaded dates (or selects "Gesamter Zeitraum" in the dropdown)
+    and replaces the data in the "store" dash-components.
+    The units are then updated as after a search (i.e. the date picker is reset to the loaded dates).
+
+    start_date: str (date picker)
+    dropdown_value: the value of the dropdown on unit_1
+    loaded_dates: dict saved by `update_unit_0` (start_date is None if the whole history is loaded)
+    session_id: str (a newer search of the session cancels this load, see `update_unit_0`)
+    """
+    # The whole history is loaded already
+    if not LAZY_HISTORY or not loaded_dates or not loaded_dates['start_date']:
+        raise PreventUpdate
+    
+    # "Gesamter Zeitraum"
+    if dropdown_value == B:
+        start_date = loaded_dates['min_date']
 
-    # Get the data from the data base
-    df_eating, df_symptoms, *_ = get_dataframes(account_id=value)  # returns two df's
+    # Within the loaded dates
+    if not start_date or str(start_date)[:10] >= loaded_dates['start_date']:
+        raise PreventUpdate
     
-    # Make the diary table 
-    df_diary = make_diary_table(df_eating, df_symptoms)
+    # None = the whole history
+    start_date = str(start_date)[:10] if str(start_date)[:10] > loaded_dates['min_date'] else None
+    try:
+        with superseding_load(session_id):
+            df_eating, df_symptoms, res = get_dataframes(account_id=loaded_dates['account_id'], start_date=start_date,
+                                                         columns=eating_columns)
 
-    # Get min max dates to prettify the date picker
-    min_date, max_date = get_dates_range(df_eating, df_symptoms)
+            if res is not True:  # e.g. the account has been deleted in the meantime
+                raise PreventUpdate
 
-    # Get the data for the "Probably bad foods table"
-    data_probably_bad_foods = to_list_of_dicts(make_probably_bad_foods_table(df_eating))
+            stores_data = make_stores_data(df_eating, df_symptoms)
+    except (LoadCancelled, TimeoutError):
+        raise PreventUpdate  # the loaded dates stay as they are
 
-    # Store the data (as str in json format) in the user's browser session
-    json_eating = to_json(df_eating)  # str in json format
-    json_symptomreport = to_json(df_symptoms)  # str in json format
-    json_diary = to_json(df_diary)
-
-    # Update the corresponding dash components with these values:
-    # (must correspond to the `Output` arguments in the decorator above)
-    return (unit_0_message_1,         #Output(component_id='unit_0_message_1', component_property='children')
-            unit_0_message_2,         #Output(component_id='unit_0_message_2', component_property='children')
-            min_date,                 #Output(component_id='unit_1_selector_1', component_property='min_date_allowed')
-            max_date,                 #Output(component_id='unit_1_selector_1', component_property='max_date_allowed')
-            max_date,                 #Output(component_id='unit_1_selector_1', component_property='initial_visible_month')
-            data_probably_bad_foods,  #Output(component_id='unit_8_table_1', component_property='data')
-            json_eating,              #Output(component_id='store_1', component_property='data')
-            json_symptomreport,       #Output(component_id='store_2', component_property='data')
-            json_diary)               #Output(component_id='store_3', component_property='data')
+    return (*stores_data, {**loaded_dates, 'start_date': start_date})
 
 
 
 
 
 # UNIT 1: Zeitraum wählen
-@callback(get_callback_args(unit_1, parent=None))
+@callback(get_callback_args(unit_1, parent=None, stores=stores))
 def update_unit_1(*components):
     """
     TODO: docs
@@ -146,11 +325,7 @@ def update_unit_1(*components):
         raise PreventUpdate
 
     # convert to namespace obejct for handy indexing, attr get/set, mutability and iterability
-    components = make_handy_namespace(components)  # for mutability, attr-access etc, iterability...
- 
-    # Read data fom json stored in user's browser session
-    df_eating = read_json(components.json_eating)
-    df_symptoms = read_json(components.json_symptomreport)
+    components = make_handy_namespace(components, stores=stores_names)  # for mutability, attr-access etc, iterability...
 
 
     ##### Updating the selectors (date range picker and dropdown) #####
@@ -163,11 +338,17 @@ def update_unit_1(*components):
     i = len(components) - len(default_values)  # will be used as index later
 
     # min and max dates of the user's history for the date picker selector
-    min_date, max_date = get_dates_range(df_eating, df_symptoms)
+    if OUT_OF_CORE_DIR:
+        min_date, max_date = components.loaded_dates['min_date'], components.loaded_dates['max_date']
+    else:
+        # Read data fom json stored in user's browser session
+        df_eating = read_json(components.json_eating)
+        df_symptoms = read_json(components.json_symptomreport)
+        min_date, max_date = get_dates_range(df_eating, df_symptoms)
 
     ### If the function call is triggered by data being saved in the dcc.Store ###
     # i.e. the user clicked the "Suchen" button and data was saved by `update_unit_0` unction
-    if ctx.triggered_id == 'store_1':
+    if ctx.triggered_id in ('store_1', 'store_4'):
         components[i:] = default_values
         # update the date range picker to the min/max of the df at hand
         components.start_date, components.end_date  = min_date, max_date
@@ -205,7 +386,8 @@ def update_unit_1(*components):
 
 
 # UNIT 2: UNIT 2: Statistics / Usage overview
-@callback(get_callback_args(unit_2, parent=unit_1))
+# With STATISTICS_IN_SQL (or OUT_OF_CORE_DIR) only the account and its loaded dates (store_4) are sent, not the df's
+@callback(get_callback_args(unit_2, parent=unit_1, stores=['store_4'] if STATISTICS_IN_SQL or OUT_OF_CORE_DIR else None))
 def update_unit_2(*components):
     """
     output: 1 element (unit_2_table_1.data)
@@ -218,16 +400,34 @@ def update_unit_2(*components):
         raise PreventUpdate
 
     # for mutability, attr-access etc, iterability
-    components = make_handy_namespace(components)
+    components = make_handy_namespace(components, stores=['loaded_dates'] if STATISTICS_IN_SQL or OUT_OF_CORE_DIR else None)
  
     # Get the default values for the selectors (this code block is not needed - just for consistency)
     default_values = get_default_values(UNIT)
     i = len(components) - len(default_values)
     
     # Reset the selectors  (this code block is not needed - just for consistency)
-    if ctx.triggered_id == 'store_1':
+    if ctx.triggered_id in ('store_1', 'store_4'):
         components[i:] = default_values
 
+    # Compute the statistics on the account's DuckDB file (see data_out_of_core.py)
+    if OUT_OF_CORE_DIR:
+        statistics = read_statistics(components.loaded_dates['account_id'],
+                                     start_date=components.start_date,
+                                     end_date=components.end_date)
+        data_statistics_table = to_list_of_dicts(make_statistics_table_from_counts(statistics)) if statistics else []
+        return (*components[i:],        # []  but is there for consistency
+                data_statistics_table)
+
+    # Compute the statistics in the database (GROUP BY) 
+    if STATISTICS_IN_SQL:
+        res, statistics = fetch_statistics(components.loaded_dates['account_id'],
+                                           start_date=components.start_date,
+                                           end_date=components.end_date)
+        data_statistics_table = to_list_of_dicts(make_statistics_table_from_counts(statistics)) if res is True else []
+        return (*components[i:],        # []  but is there for consistency
+                data_statistics_table)
+
 
     # Read data fom json stored in user's browser session
     df_eating = read_json(components.json_eating)
@@ -254,7 +454,9 @@ def update_unit_2(*components):
 
 
 # UNIT3: Diary (graph + table)
-@callback(get_callback_args(unit_3, parent=unit_1))
+# With DAILY_SUMMARY the timeline comes from the daily_summary table (see daily_summary.py), only the diary is sent
+stores_unit_3 = ['store_3', 'store_4'] if DAILY_SUMMARY and not OUT_OF_CORE_DIR else stores
+@callback(get_callback_args(unit_3, parent=unit_1, stores=stores_unit_3))
 def update_unit_3(*components):
     """
     TODO docs
@@ -268,12 +470,8 @@ def update_unit_3(*components):
         raise PreventUpdate  # not actually raise but cought by plotly-dash
 
     # for mutability, attr get/set etc
-    components = make_handy_namespace(components)  # for mutability, attr-access etc, iterability...
- 
-    # Read data fom json stored in user's browser session
-    df_eating = read_json(components.json_eating)
-    df_symptoms = read_json(components.json_symptomreport)
-    df_diary = read_json(components.json_diary)
+    components = make_handy_namespace(components, stores=['json_diary', 'loaded_dates'] if stores_unit_3 != stores
+                                      else stores_names)  # for mutability, attr-access etc, iterability...
 
     # Get the default values for the selectors
     default_values = get_default_values(unit)   # len(default_values) == 0
@@ -282,6 +480,36 @@ def update_unit_3(*components):
     # This section would deal with updateing the selectors / setting their default values
     # but on this unit there are no selectors
 
+    # Query the account's DuckDB file (see data_out_of_core.py): the meals per date and the dates with symptoms
+    if OUT_OF_CORE_DIR:
+        account_id = components.loaded_dates['account_id']
+        df_eating_timeline, df_symptoms_timeline = read_timeline(account_id,
+                                                                 start_date=components.start_date,
+                                                                 end_date=components.end_date)
+        fig = make_figure(unit, df_eating_timeline, df_symptoms_timeline, debugging_info=components)
+        df_diary = read_diary(account_id, start_date=components.start_date, end_date=components.end_date)
+        data_diary = to_list_of_dicts(prettify_diary_table(finish_diary_table(df_diary)))
+        return (*components[i:], fig, data_diary, to_list_of_dicts(df_eating_timeline))
+
+    # The timeline from the daily summary of the account (the meals per date and the dates with symptoms)
+    if stores_unit_3 != stores:
+        df_eating_timeline, df_symptoms_timeline = get_timeline_data(components.loaded_dates['account_id'],
+                                                                     start_date=components.start_date,
+                                                                     end_date=components.end_date)
+        if df_eating_timeline is None:
+            raise PreventUpdate
+        fig = make_figure(unit, df_eating_timeline, df_symptoms_timeline, debugging_info=components)
+        df_diary = subset_data_by_dates(read_json(components.json_diary),
+                                        start_date=components.start_date,
+                                        end_date=components.end_date)
+        data_diary = to_list_of_dicts(prettify_diary_table(df_diary))
+        return (*components[i:], fig, data_diary, to_list_of_dicts(df_eating_timeline))
+
+    # Read data fom json stored in user's browser session
+    df_eating = read_json(components.json_eating)
+    df_symptoms = read_json(components.json_symptomreport)
+    df_diary = read_json(components.json_diary)
+
     # Filter the data in the df's
     df_eating_subset_by_dates = subset_data_by_dates(df_eating, 
                                                      start_date=components.start_date,
@@ -314,7 +542,7 @@ def update_unit_3(*components):
 
 
 # UNIT 4: Welche Lebensmittel sind am meisten konsumiert
-@callback(get_callback_args(unit_4, parent=unit_1))
+@callback(get_callback_args(unit_4, parent=unit_1, stores=stores))
 def update_unit_4(*components):
     """
     Use this code block as a template.
@@ -349,19 +577,30 @@ def update_unit_4(*components):
         raise PreventUpdate
 
     # for mutability, attr-access etc, iterability
-    components = make_handy_namespace(components)
- 
-    # Read data fom json stored in user's browser session
-    df_eating = read_json(components.json_eating)
+    components = make_handy_namespace(components, stores=stores_names)
 
     # Get the default values for the selectors
     default_values = get_default_values(unit)
     i = len(components) - len(default_values)  # will be used as index later
     
     # Reset the selectors if ‘store‘ is the trigger
-    if ctx.triggered_id == 'store_1':
+    if ctx.triggered_id in ('store_1', 'store_4'):
         components[i:] = default_values
 
+    # Query the account's DuckDB file (see data_out_of_core.py), only the counts of the plot are returned
+    if OUT_OF_CORE_DIR:
+        counts = read_foodstuff_counts(components.loaded_dates['account_id'],
+                                       start_date=components.start_date,
+                                       end_date=components.end_date,
+                                       top_n=UNIT_TOP_N[4],
+                                       meals_selector=components.selector1,
+                                       symptom_selector=components.selector2)
+        fig = make_figure_from_counts(unit, counts, color=components.selector2, debugging_info=components)
+        return (*components[i:], fig, to_list_of_dicts(make_counts_table(counts)))
+
+    # Read data fom json stored in user's browser session
+    df_eating = read_json(components.json_eating)
+
     # Subset the data by dates
     df_subset_dates = subset_data_by_dates(df_eating,
                                            start_date=components.start_date,
@@ -387,7 +626,7 @@ def update_unit_4(*components):
 
 
 # UNIT 5: Welche Lebensmittel wurden unmittelbar vor der Symptomentstehung gegessen
-@callback(get_callback_args(unit_5, parent=unit_1))
+@callback(get_callback_args(unit_5, parent=unit_1, stores=stores))
 def update_unit_5(*components):
     """
     You can use this as a template fro a new unit
@@ -401,19 +640,30 @@ def update_unit_5(*components):
         raise PreventUpdate
 
     # for mutability, attr-access etc, iterability
-    components = make_handy_namespace(components)
- 
-    # Read data fom json stored in user's browser session
-    df_eating = read_json(components.json_eating)
+    components = make_handy_namespace(components, stores=stores_names)
 
     # Get the default values for the selectors
     default_values = get_default_values(unit)
     i = len(components) - len(default_values)  # will be used as index later
     
     # Reset the selectors if ‘store‘ is the trigger
-    if ctx.triggered_id == 'store_1':
+    if ctx.triggered_id in ('store_1', 'store_4'):
         components[i:] = default_values
 
+    # Query the account's DuckDB file (see data_out_of_core.py), only the counts of the plot are returned
+    if OUT_OF_CORE_DIR:
+        counts = read_foodstuff_counts(components.loaded_dates['account_id'],
+                                       start_date=components.start_date,
+                                       end_date=components.end_date,
+                                       top_n=UNIT_TOP_N[5],
+                                       meals_selector=components.selector1,
+                                       grade_selector=components.selector2)
+        fig = make_figure_from_counts(unit, counts, color='red', debugging_info=components)
+        return (*components[i:], fig, to_list_of_dicts(make_counts_table(counts)))
+
+    # Read data fom json stored in user's browser session
+    df_eating = read_json(components.json_eating)
+
     # Subset the data by dates
     df_subset_dates = subset_data_by_dates(df_eating,
                                            start_date=components.start_date,
@@ -439,7 +689,7 @@ def update_unit_5(*components):
 
 
 # UNIT 6: Wie sieht ein typisches Frühstück, Mittagessen oder Abendessen aus
-@callback(get_callback_args(unit_6, parent=unit_1))
+@callback(get_callback_args(unit_6, parent=unit_1, stores=stores))
 def update_unit_6(*components):
     """
     TODO: docs
@@ -453,19 +703,30 @@ def update_unit_6(*components):
         raise PreventUpdate
 
     # for mutability, attr-access etc, iterability
-    components = make_handy_namespace(components)
- 
-    # Read data fom json stored in user's browser session
-    df_eating = read_json(components.json_eating)
+    components = make_handy_namespace(components, stores=stores_names)
 
     # Get the default values for the selectors
     default_values = get_default_values(unit)
     i = len(components) - len(default_values)  # will be used as index later
     
     # Reset the selectors if ‘store‘ is the trigger
-    if ctx.triggered_id == 'store_1':
+    if ctx.triggered_id in ('store_1', 'store_4'):
         components[i:] = default_values
 
+    # Query the account's DuckDB file (see data_out_of_core.py), only the counts of the plot are returned
+    if OUT_OF_CORE_DIR:
+        counts = read_meal_counts(components.loaded_dates['account_id'],
+                                  start_date=components.start_date,
+                                  end_date=components.end_date,
+                                  top_n=UNIT_TOP_N[6],
+                                  meals_selector=components.selector1,
+                                  symptom_selector=components.selector2)
+        fig = make_figure_from_counts(unit, counts, color=components.selector2, debugging_info=components)
+        return (*components[i:], fig, to_list_of_dicts(make_counts_table(counts)))
+
+    # Read data fom json stored in user's browser session
+    df_eating = read_json(components.json_eating)
+
     # Subset the data by dates
     df_subset_dates = subset_data_by_dates(df_eating,
                                            start_date=components.start_date,
@@ -490,7 +751,7 @@ def update_unit_6(*components):
 
 
 # UNIT 7: Welche Lebensmittel werden (in einer bestimmten Mahlzeit) kombiniert
-@callback(get_callback_args(unit_7, parent=unit_1))
+@callback(get_callback_args(unit_7, parent=unit_1, stores=stores))
 def update_unit_7(*components):
     """
     TODO: docs
@@ -504,19 +765,31 @@ def update_unit_7(*components):
         raise PreventUpdate
 
     # for mutability, attr-access etc, iterability
-    components = make_handy_namespace(components)
- 
-    # Read data fom json stored in user's browser session
-    df_eating = read_json(components.json_eating)
+    components = make_handy_namespace(components, stores=stores_names)
 
     # Get the default values for the selectors
     default_values = get_default_values(unit)
     i = len(components) - len(default_values)  # will be used as index later
     
     # Reset the selectors if ‘store‘ is the trigger
-    if ctx.triggered_id == 'store_1':
+    if ctx.triggered_id in ('store_1', 'store_4'):
         components[i:] = default_values
 
+    # Query the account's DuckDB file (see data_out_of_core.py), only the counts of the plot are returned
+    if OUT_OF_CORE_DIR:
+        counts = read_combination_counts(components.loaded_dates['account_id'],
+                                         n_components=components.selector3,
+                                         start_date=components.start_date,
+                                         end_date=components.end_date,
+                                         top_n=UNIT_TOP_N[7],
+                                         meals_selector=components.selector1,
+                                         symptom_selector=components.selector2)
+        fig = make_figure_from_counts(unit, counts, color=components.selector2, debugging_info=components)
+        return (*components[i:], fig, to_list_of_dicts(make_counts_table(counts)))
+
+    # Read data fom json stored in user's browser session
+    df_eating = read_json(components.json_eating)
+
     # Subset the data by dates
     df_subset_dates = subset_data_by_dates(df_eating,
                                            start_date=components.start_date,
@@ -573,6 +846,10 @@ if __name__ == '__main__':
             print(f"default values for the selectors: {get_default_values(unit)}")
             print("-" * 50)
 
+    # The indexes missing for the queries on data_access.py (see index_advisor.py)
+    if DEBUG:
+        print_index_report()
+
     # comment the next line out when deploying on a server
     app.run(debug=DEBUG)
 
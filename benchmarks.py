@@ -0,0 +1,1262 @@
+"""
+Benchmarks for the data access and data processing functions.
+
+They run against a local stand-in for the database:
+a SQLite file with the tables from assets/toy_data.zip, attached under the name of SCHEMA
+(so that the queries on data_access.py run unchanged), or a copy of a SQLite file made by toy_data.py (--database).
+A network round trip time can be simulated with --rtt-ms (a sleep before each query).
+
+$ python benchmarks.py account_load --rtt-ms 5
+$ python toy_data.py large.db --accounts 3000 && python benchmarks.py account_load --database large.db
+"""
+
+import os
+import shutil
+import sqlite3
+import zipfile
+import tempfile
+import tracemalloc
+from time import perf_counter, sleep
+from collections import Counter
+from threading import Thread
+from argparse import ArgumentParser
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, text
+
+from data_access import make_local_engine, check_account, fetch_eating_data, fetch_symptoms_data, load_account, fetch_statistics
+from data_access import fetch_daily_summary, STATEMENT_HAS_ACCOUNT, _make_load_account_statement, run_query, ALL
+from data_access import fetch_date_range, fetch_change_token, STATEMENT_DATE_RANGE, STATEMENT_CHANGE_TOKEN
+from data_access import _make_eating_data_statement, _make_symptoms_data_statement
+from index_advisor import check_indexes, create_indexes, MISSING, NOT_COVERING
+from data_cancellation import superseding_load, LoadCancelled
+from daily_summary import create_tables, refresh_daily_summary
+from foodstuff_names import refresh_foodstuff_names, create_table as create_foodstuff_name_table
+import data_access
+import data_processing
+import data_filtering
+import table_toolkit
+from data_processing import get_dataframes, clean_eating_data, clean_symptoms_data, add_columns_to_eating_data
+from data_processing import add_columns_to_symptoms_data
+from data_processing import regex_foodstuff_name, FOODSTUFF_NAME_PATTERN, LazyEatingData, ENGINEERED_COLUMNS
+from data_caching import DataFrameCache, FoodstuffDictionary, AccountIndex
+from data_filtering import subset_data_by_dates, subset_data_by_selector_values
+from developer_toolkit import get_columns_needed
+from units import UNIT_COLUMNS, unit_2, unit_3
+from toy_data import FOODS, SYMPTOMS, TIMINGS, TIMING_UNKNOWN, TIMING_UNKNOWN_SHARE
+from table_toolkit import make_statistics_table, make_statistics_table_from_counts
+from table_toolkit import make_diary_table, prettify_diary_table, make_probably_bad_foods_table
+from table_toolkit import finish_diary_table, make_probably_bad_foods_table_from_counts, to_json
+from plotting_toolkit import make_figure, make_figure_from_counts, UNIT_TOP_N
+from computations import compute_combination_occurrence, get_dates_range
+import data_out_of_core
+from constants import A, B, C, D
+from constants import SCHEMA, TABLE_ACCOUNT, TABLE_MEAL, TABLE_MEAL_FOODSTUFF, TABLE_REPORT, TABLE_FOODSTUFF, TABLE_FOODSTUFF_NAME
+from constants import COLUMN_ACCOUNT_ID, COLUMN_MEAL_ID, COLUMN_DATE, COLUMN_MEAL, COLUMN_FOODSTUFF_ID, COLUMN_FOODSTUFF_IDS
+from constants import COLUMN_NAME, COLUMN_NAME_REGEX, COLUMN_TIMING, COLUMN_SYMPTOM, COLUMN_GRADE, MEALS_MAPPING
+from constants import COLUMN_WEEKDAY, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY, COLUMN_SYMPTOMS, COLUMN_AVG_GRADE
+
+
+TOY_DATA_PATH = "assets/toy_data.zip"
+
+# A query which runs for seconds on sqlite (for `benchmark_cancellation`)
+SQL_SLOW = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000000) SELECT COUNT(*) FROM c;"
+
+
+
+def make_standin_database(path, toy_data_path=TOY_DATA_PATH):
+    """
+    Writes the csv files from the toy data (zip) into a SQLite file
+    and makes the indexes which the production database has on the foreign keys.
+    """
+    with zipfile.ZipFile(toy_data_path) as zf, sqlite3.connect(path) as connection:
+        for filename in zf.namelist():
+            with zf.open(filename) as f:
+                pd.read_csv(f).to_sql(os.path.splitext(filename)[0], connection, index=False, if_exists='replace')
+
+        connection.execute(f"CREATE INDEX IF NOT EXISTS ix_meal_account ON {TABLE_MEAL} ({COLUMN_ACCOUNT_ID})")
+        connection.execute(f"CREATE INDEX IF NOT EXISTS ix_report_account ON {TABLE_REPORT} ({COLUMN_ACCOUNT_ID})")
+        connection.execute(f"CREATE INDEX IF NOT EXISTS ix_meal_foodstuff_meal ON {TABLE_MEAL_FOODSTUFF} ({COLUMN_MEAL_ID})")
+    return path
+
+
+
+def make_standin_engine(path, rtt=0.0):
+    """
+    sqlalchemy engine for the stand-in database (the file is attached as SCHEMA)
+
+    Args:
+        path: path to the SQLite file made by `make_standin_database`
+        rtt: simulated network round trip time in seconds (added to every query)
+    """
+    engine = make_local_engine(path, 'sqlite')
+
+    if rtt:
+        @event.listens_for(engine, "before_cursor_execute")
+        def simulate_round_trip(*args):
+            sleep(rtt)
+
+    return engine
+
+
+
+def get_account_ids(engine):
+    """All account ids in the stand-in database"""
+    with engine.connect() as connection:
+        return pd.read_sql_query(f"SELECT {COLUMN_ACCOUNT_ID} FROM {SCHEMA}.{TABLE_ACCOUNT}", connection)[COLUMN_ACCOUNT_ID].tolist()
+
+
+
+def _time(func, account_ids, repeat):
+    """Best (minimum) total time over `repeat` runs of func(account_id) for all account_ids"""
+    timings = []
+    for _ in range(repeat):
+        time_start = perf_counter()
+        for account_id in account_ids:
+            func(account_id)
+        timings.append(perf_counter() - time_start)
+    return min(timings)
+
+
+
+def _time_call(func):
+    """Time of one call of func()"""
+    time_start = perf_counter()
+    func()
+    return perf_counter() - time_start
+
+
+
+def benchmark_account_load(engine, account_ids, repeat=3):
+    """
+    The four-query path (`check_account`, `fetch_eating_data`, `fetch_symptoms_data`)
+    versus the single query in `load_account`.
+    Both must return the same data.
+    """
+    def four_queries(account_id):
+        status = check_account(account_id, engine)
+        if status is not True:
+            return (status, None, None)
+        return (status, fetch_eating_data(account_id, engine), fetch_symptoms_data(account_id, engine))
+
+    def one_query(account_id):
+        return load_account(account_id, engine)
+
+    # Same results?
+    for account_id in account_ids:
+        expected, actual = four_queries(account_id), one_query(account_id)
+        assert expected[0] is actual[0], f"status differs for account {account_id}"
+        for df_expected, df_actual in zip(expected[1:], actual[1:]):
+            if df_expected is not None:
+                pd.testing.assert_frame_equal(df_actual, df_expected, check_dtype=False)
+
+    time_four = _time(four_queries, account_ids, repeat)
+    time_one = _time(one_query, account_ids, repeat)
+    n = len(account_ids)
+    print(f"account load ({n} accounts, best of {repeat}):")
+    print(f"  four queries: {time_four / n * 1000:8.2f} ms per account")
+    print(f"  one query:    {time_one / n * 1000:8.2f} ms per account  ({time_four / time_one:.2f}x)")
+
+
+
+def benchmark_concurrent_load(engine, account_ids, repeat=3):
+    """
+    Account load with the sequential queries (the account check, then one table after the other),
+    with the one combined query and with the concurrent queries (see `load_dataframes_concurrently`).
+    """
+    def sequential(account_id):
+        status = check_account(account_id, engine)
+        if status is not True:
+            return (None, None, status)
+        df_eating = clean_eating_data(fetch_eating_data(account_id, engine))
+        df_symptoms = clean_symptoms_data(fetch_symptoms_data(account_id, engine))
+        return (add_columns_to_eating_data(df_eating, df_symptoms), df_symptoms, status)
+
+    def one_query(account_id):
+        return get_dataframes(account_id, engine, concurrent=False, cache=None, snapshots=None)
+
+    def concurrent(account_id):
+        return get_dataframes(account_id, engine, concurrent=True, cache=None, snapshots=None)
+
+    # Same results?
+    for account_id in account_ids:
+        expected, actual = one_query(account_id), concurrent(account_id)
+        assert expected[2] is actual[2], f"status differs for account {account_id}"
+        for df_expected, df_actual in zip(expected[:2], actual[:2]):
+            if df_expected is not None:
+                pd.testing.assert_frame_equal(df_actual.reset_index(drop=True), df_expected.reset_index(drop=True),
+                                              check_dtype=False)  # empty df's from separate queries are object dtype
+
+    n = len(account_ids)
+    print(f"account load incl. processing ({n} accounts, best of {repeat}):")
+    for name, func in [('sequential', sequential), ('one query', one_query), ('concurrent', concurrent)]:
+        print(f"  {name + ':':<12} {_time(func, account_ids, repeat) / n * 1000:8.2f} ms per account")
+
+
+
+def benchmark_statistics(engine, account_ids, repeat=3):
+    """
+    The statistics table of unit_2 from the df's (`make_statistics_table`, the df's are loaded beforehand)
+    versus the GROUP BY queries in the database (`fetch_statistics`).
+    Both must return the same table - for the whole history and for a window of 4 weeks.
+    """
+    dataframes = {account_id: get_dataframes(account_id, engine, cache=None) for account_id in account_ids}
+    account_ids = [account_id for account_id in account_ids if dataframes[account_id][2] is True]
+
+    def get_dates(account_id):
+        df_eating = dataframes[account_id][0]
+        end_date = df_eating['date'].max()
+        return [(None, None), (str(end_date - pd.Timedelta(days=7*4))[:10], str(end_date)[:10])]
+
+    def in_pandas(account_id, start_date=None, end_date=None):
+        df_eating, df_symptoms, _ = dataframes[account_id]
+        if start_date:
+            df_eating = subset_data_by_dates(df_eating, start_date, end_date)
+            df_symptoms = subset_data_by_dates(df_symptoms, start_date, end_date)
+        return make_statistics_table(df_eating, df_symptoms)
+
+    def in_sql(account_id, start_date=None, end_date=None):
+        status, statistics = fetch_statistics(account_id, engine, start_date, end_date)
+        return make_statistics_table_from_counts(statistics)
+
+    # Same results? (within a window without symptoms the pandas version fails)
+    n_compared = 0
+    for account_id in account_ids:
+        for start_date, end_date in get_dates(account_id):
+            try:
+                expected = in_pandas(account_id, start_date, end_date)
+            except (ZeroDivisionError, ValueError, TypeError):
+                continue
+            pd.testing.assert_frame_equal(in_sql(account_id, start_date, end_date), expected, check_dtype=False)
+            n_compared += 1
+
+    n = len(account_ids)
+    print(f"statistics table ({n} accounts, {n_compared} tables compared, best of {repeat}):")
+    for name, func in [('pandas', in_pandas), ('sql', in_sql)]:
+        print(f"  {name + ':':<8} {_time(func, account_ids, repeat) / n * 1000:8.2f} ms per account")
+
+
+
+def benchmark_daily_summary(engine, account_ids, repeat=3):
+    """
+    Refreshes the daily_summary table (full, then incremental after a meal was added to one account)
+    and compares the statistics from the summary with the statistics from the raw tables
+    and the foodstuff ids per day and the timeline of unit_3 (`get_timeline_data`) with the eating data.
+    Note: adds a meal to the stand-in database.
+    """
+    create_tables(engine)
+    time_start = perf_counter()
+    n_refreshed = refresh_daily_summary(engine, full=True)
+    time_full = perf_counter() - time_start
+
+    def check(account_id):
+        expected, actual = fetch_statistics(account_id, engine), fetch_statistics(account_id, engine, from_summary=True)
+        assert expected == actual, f"statistics differ for account {account_id}: {expected} != {actual}"
+
+        # The raw eating data (the cleaning drops foodstuffs with a duplicated name within a meal)
+        status, df_eating, _ = load_account(account_id, engine)
+        if status is True:
+            df_eating[COLUMN_DATE] = df_eating[COLUMN_DATE].astype(str).str[:10]
+            expected = (df_eating.dropna(subset=[COLUMN_FOODSTUFF_ID]).groupby(COLUMN_DATE)[COLUMN_FOODSTUFF_ID]
+                        .agg(lambda ids: sorted(set(int(i) for i in ids))))
+            df_summary = fetch_daily_summary(account_id, engine)
+            actual = df_summary.set_index(df_summary[COLUMN_DATE].astype(str).str[:10])[COLUMN_FOODSTUFF_IDS]
+            assert actual[actual.str.len() > 0].to_dict() == expected.to_dict(), f"foodstuff ids differ for account {account_id}"
+
+            # The timeline: the names per date and meal (their order within a meal is arbitrary) and the dates with symptoms
+            df_eating, df_symptoms, _ = get_dataframes(account_id, engine, chunksize=None, concurrent=False, cache=None,
+                                                       snapshots=None)
+            df_timeline, df_symptoms_timeline = data_processing.get_timeline_data(account_id, engine)
+
+            def names_per_meal(df):
+                meals = {}
+                for key in zip(df[COLUMN_DATE].astype(str).str[:10], df[COLUMN_MEAL].astype(str),
+                               df[COLUMN_NAME_REGEX].astype(object).fillna('')):
+                    meals.setdefault(key[:2], []).extend(name for name in key[2].split(", ") if name)
+                return {key: Counter(names) for key, names in meals.items()}
+
+            assert names_per_meal(df_timeline) == names_per_meal(df_eating), f"timeline differs for account {account_id}"
+            assert (sorted(set(df_symptoms[COLUMN_DATE].astype(str).str[:10]))
+                    == sorted(df_symptoms_timeline[COLUMN_DATE].astype(str).str[:10])), f"symptom dates differ for account {account_id}"
+
+    for account_id in account_ids:
+        check(account_id)
+
+    # No changes -> nothing to refresh
+    assert refresh_daily_summary(engine) == 0
+
+    # A meal added -> only this account is refreshed
+    account_id = account_ids[0]
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"""INSERT INTO {SCHEMA}.{TABLE_MEAL} ({COLUMN_MEAL_ID}, {COLUMN_ACCOUNT_ID}, {COLUMN_DATE}, {COLUMN_MEAL})
+                                      SELECT MAX({COLUMN_MEAL_ID}) + 1, {account_id}, '2099-01-01', 'LUNCH' FROM {SCHEMA}.{TABLE_MEAL}""")
+    time_start = perf_counter()
+    assert refresh_daily_summary(engine) == 1
+    time_incremental = perf_counter() - time_start
+    check(account_id)
+
+    n = len(account_ids)
+    print(f"daily_summary ({n} accounts, best of {repeat}):")
+    print(f"  full refresh:        {time_full * 1000:8.2f} ms ({n_refreshed} accounts)")
+    print(f"  incremental refresh: {time_incremental * 1000:8.2f} ms (1 account)")
+    for name, from_summary in [('statistics (raw)', False), ('statistics (summary)', True)]:
+        time = _time(lambda account_id: fetch_statistics(account_id, engine, from_summary=from_summary), account_ids, repeat)
+        print(f"  {name + ':':<21}{time / n * 1000:8.2f} ms per account")
+    time = _time(lambda account_id: load_account(account_id, engine), account_ids, repeat)
+    print(f"  {'timeline (raw):':<21}{time / n * 1000:8.2f} ms per account (the whole load)")
+    time = _time(lambda account_id: data_processing.get_timeline_data(account_id, engine), account_ids, repeat)
+    print(f"  {'timeline (summary):':<21}{time / n * 1000:8.2f} ms per account")
+
+
+
+def benchmark_statements(engine, account_ids, repeat=3, n_calls=5_000):
+    """
+    Per-call overhead of building the statements (f-string + text() on every call, as before)
+    versus the statements built once on data_access.py.
+    The small query of `check_account` is executed on one connection (no pool, best without --rtt-ms),
+    of the big query of `load_account` only the building is timed (the part which is saved per call,
+    sqlalchemy's compiled cache is hit either way, its key is the SQL text).
+    """
+    def has_account_per_call():
+        return text(f"SELECT COUNT({COLUMN_ACCOUNT_ID}) FROM {SCHEMA}.{TABLE_ACCOUNT} WHERE {COLUMN_ACCOUNT_ID} = :account_id;")
+
+    def has_account_prebuilt():
+        return STATEMENT_HAS_ACCOUNT
+
+    def load_account_per_call():
+        return _make_load_account_statement.__wrapped__(False, False, False, False)   # without the lru_cache
+
+    def load_account_prebuilt():
+        return _make_load_account_statement(False, False, False, False)
+
+    def time_calls(func):
+        timings = []
+        for _ in range(repeat):
+            time_start = perf_counter()
+            for i in range(n_calls):
+                func(account_ids[i % len(account_ids)])
+            timings.append(perf_counter() - time_start)
+        return min(timings) / n_calls
+
+    with engine.connect() as connection:
+        def execute(get_statement):
+            return lambda account_id: connection.execute(get_statement(), {'account_id': account_id}).scalar()
+
+        def build(get_statement):
+            return lambda account_id: get_statement()
+
+        cases = [('check_account, executed', execute(has_account_per_call), execute(has_account_prebuilt)),
+                 ('load_account, built', build(load_account_per_call), build(load_account_prebuilt))]
+
+        print(f"statements ({n_calls} calls, best of {repeat}):")
+        for name, per_call, prebuilt in cases:
+            time_per_call, time_prebuilt = time_calls(per_call), time_calls(prebuilt)
+            print(f"  {name + ':':<26} built per call {time_per_call * 1e6:7.1f} µs, prebuilt {time_prebuilt * 1e6:7.1f} µs "
+                  f"(saves {(time_per_call - time_prebuilt) * 1e6:.1f} µs per call, {1 / time_prebuilt:,.0f} calls/s)")
+
+
+
+def benchmark_foodstuffs(engine, account_ids, repeat=3):
+    """
+    The meals fetched with the foodstuff names (the join) versus as ids only with the names from the
+    foodstuff dictionary (see FOODSTUFF_DICTIONARY on constants.py): the size of the fetched eating data and
+    the time of a load incl. the cleaning and the added columns (no cache, the dictionary is loaded beforehand).
+    The three load paths (one query, concurrent, chunks) must return the same df's either way.
+    """
+    dictionary = FoodstuffDictionary(600, regex_foodstuff_name)
+    dictionary_before = data_processing.foodstuff_dictionary
+
+    def load(account_id, **kwargs):
+        return get_dataframes(account_id, engine, cache=None, snapshots=None, **kwargs)
+
+    def with_names(account_id, **kwargs):
+        data_processing.foodstuff_dictionary = None
+        return load(account_id, **kwargs)
+
+    def ids_only(account_id, **kwargs):
+        data_processing.foodstuff_dictionary = dictionary
+        return load(account_id, **kwargs)
+
+    try:
+        # The same df's?
+        for kwargs in [{}, {'concurrent': True}, {'chunksize': 500}]:
+            for account_id in account_ids:
+                expected, actual = with_names(account_id, **kwargs), ids_only(account_id, **kwargs)
+                assert expected[2] is actual[2], f"status differs for account {account_id}"
+                for df_expected, df_actual in zip(expected[:2], actual[:2]):
+                    if df_expected is not None:
+                        pd.testing.assert_frame_equal(df_actual, df_expected)
+
+        # An id above the known ones which isn't in the foodstuff table is looked up once only
+        extensions, unknown_ids = dictionary.extensions, pd.Series([dictionary._state['max_id'] + 1000])
+        for _ in range(3):
+            assert (dictionary.resolve(unknown_ids, engine)[0] == -1).all()
+        assert dictionary.extensions == extensions + 1, dictionary
+
+        # The size of the eating data as fetched
+        n_bytes = {}
+        for name, kwargs in [('with names', {}), ('ids only', {'ids_only': True})]:
+            n_bytes[name] = sum(int(df.memory_usage(deep=True).sum())
+                                for account_id in account_ids
+                                for df in [load_account(account_id, engine, **kwargs)[1]] if df is not None)
+
+        time_names, time_ids = _time(with_names, account_ids, repeat), _time(ids_only, account_ids, repeat)
+    finally:
+        data_processing.foodstuff_dictionary = dictionary_before
+
+    n = len(account_ids)
+    print(f"foodstuff dictionary ({n} accounts, best of {repeat}; {dictionary}):")
+    print(f"  eating data fetched: with names {n_bytes['with names'] / 2**20:6.2f} MiB, "
+          f"ids only {n_bytes['ids only'] / 2**20:6.2f} MiB ({n_bytes['with names'] / n_bytes['ids only']:.1f}x smaller)")
+    print(f"  load incl. processing: with names {time_names / n * 1000:6.2f} ms, "
+          f"ids only {time_ids / n * 1000:6.2f} ms per account ({time_names / time_ids:.2f}x)")
+
+
+
+def benchmark_foodstuff_names(engine, account_ids, repeat=3):
+    """
+    The regex'ed foodstuff names stored by foodstuff_names.py (STORED_FOODSTUFF_NAMES on constants.py)
+    versus the regex at runtime: the time of a load incl. the cleaning and the added columns.
+    Both must return the same df's, also when a foodstuff has not been processed yet (the regex is applied then).
+    The refresh only processes the new/renamed foodstuffs.
+    Note: the foodstuff_name table is dropped at the end.
+    """
+    def load(account_id, stored_names):
+        status, df_eating, df_symptoms = load_account(account_id, engine, stored_names=stored_names)
+        if status is not True:
+            return (None, None, status)
+        df_eating, df_symptoms = clean_eating_data(df_eating), clean_symptoms_data(df_symptoms)
+        return (add_columns_to_eating_data(df_eating, df_symptoms), df_symptoms, status)
+
+    def check(account_ids):
+        for account_id in account_ids:
+            expected, actual = load(account_id, False), load(account_id, True)
+            assert expected[2] is actual[2], f"status differs for account {account_id}"
+            for df_expected, df_actual in zip(expected[:2], actual[:2]):
+                if df_expected is not None:
+                    pd.testing.assert_frame_equal(df_actual, df_expected)
+
+    def rename_foodstuff(foodstuff_id, name):
+        with engine.begin() as connection:
+            connection.execute(text(f"UPDATE {SCHEMA}.{TABLE_FOODSTUFF} SET {COLUMN_NAME} = :name "
+                                    f"WHERE {COLUMN_FOODSTUFF_ID} = :foodstuff_id"), {'name': name, 'foodstuff_id': foodstuff_id})
+
+    create_foodstuff_name_table(engine)
+    try:
+        time_start = perf_counter()
+        n_refreshed = refresh_foodstuff_names(engine, full=True)
+        time_full = perf_counter() - time_start
+        check(account_ids)
+
+        # No changes -> nothing to refresh
+        assert refresh_foodstuff_names(engine) == 0
+
+        # A foodstuff renamed -> its stored name is outdated (not selected, the regex is applied at runtime)
+        # until the refresh, which processes only this foodstuff
+        account_id = account_ids[0]
+        foodstuff_id, name = load_account(account_id, engine)[1][[COLUMN_FOODSTUFF_ID, COLUMN_NAME]].dropna().iloc[0]
+        rename_foodstuff(int(foodstuff_id), "2 Scheiben Vollkornbrot")
+        check([account_id])
+        time_start = perf_counter()
+        assert refresh_foodstuff_names(engine) == 1
+        time_incremental = perf_counter() - time_start
+        check([account_id])
+        rename_foodstuff(int(foodstuff_id), name)
+        assert refresh_foodstuff_names(engine) == 1
+
+        # Not processed yet -> the regex is applied at runtime
+        with engine.begin() as connection:
+            connection.execute(text(f"DELETE FROM {SCHEMA}.{TABLE_FOODSTUFF_NAME} WHERE {COLUMN_FOODSTUFF_ID} = :foodstuff_id"),
+                               {'foodstuff_id': int(foodstuff_id)})
+        check([account_id])
+
+        time_runtime = _time(lambda account_id: load(account_id, False), account_ids, repeat)
+        time_stored = _time(lambda account_id: load(account_id, True), account_ids, repeat)
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {SCHEMA}.{TABLE_FOODSTUFF_NAME}"))
+
+    n = len(account_ids)
+    print(f"stored foodstuff names ({n} accounts, best of {repeat}):")
+    print(f"  full refresh:        {time_full * 1000:8.2f} ms ({n_refreshed} foodstuffs)")
+    print(f"  incremental refresh: {time_incremental * 1000:8.2f} ms (1 foodstuff)")
+    print(f"  load incl. processing: regex at runtime {time_runtime / n * 1000:6.2f} ms, "
+          f"stored names {time_stored / n * 1000:6.2f} ms per account ({time_runtime / time_stored:.2f}x)")
+
+
+
+def benchmark_name_regex(engine, account_ids, repeat=3, sizes=(10_000, 100_000, 1_000_000)):
+    """
+    `regex_foodstuff_name` (the regex once per distinct name, with the process-wide memo) versus the regex on every row,
+    on name columns sampled from the eating data of all accounts (i.e. with the real frequencies of the names).
+    Cold: the memo is cleared before each run, warm: the names are known from a previous run (e.g. other accounts).
+    Both must return the same Series (also for a categorical column).
+    """
+    def per_row(sr):
+        return sr.str.strip().str.replace(FOODSTUFF_NAME_PATTERN, '', regex=True).str.strip().str.lower().str.title()
+
+    def cold(sr):
+        data_processing._name_memo.clear()
+        return regex_foodstuff_name(sr)
+
+    names = pd.concat([df[COLUMN_NAME] for account_id in account_ids
+                       for df in [load_account(account_id, engine)[1]] if df is not None], ignore_index=True)
+    memo_before = dict(data_processing._name_memo)
+
+    print(f"name regex (best of {repeat}):")
+    try:
+        for size in sizes:
+            sr = names.sample(size, replace=True, random_state=0).reset_index(drop=True)
+            pd.testing.assert_series_equal(cold(sr), per_row(sr))
+            pd.testing.assert_series_equal(regex_foodstuff_name(sr), per_row(sr))   # warm
+            pd.testing.assert_series_equal(regex_foodstuff_name(sr.astype('category')), per_row(sr).astype('category'),
+                                           check_categorical=False)   # COMPACT_SCHEMA: new categories
+
+            timings = {}
+            for name, func in [('per row', per_row), ('cold', cold), ('warm', regex_foodstuff_name)]:
+                timings[name] = min(_time_call(lambda: func(sr)) for _ in range(repeat))
+            print(f"  {size:>9,} rows ({sr.nunique():>6,} names): per row {timings['per row'] * 1000:8.2f} ms, "
+                  f"unique values cold {timings['cold'] * 1000:7.2f} ms ({timings['per row'] / timings['cold']:5.1f}x), "
+                  f"warm {timings['warm'] * 1000:7.2f} ms ({timings['per row'] / timings['warm']:5.1f}x)")
+    finally:
+        data_processing._name_memo.clear()
+        data_processing._name_memo.update(memo_before)
+
+
+
+def benchmark_compact_schema(engine, account_ids, repeat=3):
+    """
+    The processed df's with the compact dtypes (COMPACT_SCHEMA on constants.py) versus the default dtypes:
+    the memory of the df's (e.g. in the cache) and the time of the tables made from them after a search
+    (the diary table, the "probably bad foods" table, the statistics table).
+    The tables must be the same either way.
+    """
+    def load(account_id, compact):
+        data_processing.COMPACT_SCHEMA = compact
+        return get_dataframes(account_id, engine, cache=None, snapshots=None)
+
+    def make_bad_foods_table(df_eating):
+        try:
+            return make_probably_bad_foods_table(df_eating)
+        except ValueError:  # no foodstuffs on days with symptoms (either way)
+            return pd.DataFrame()
+
+    def make_tables(df_eating, df_symptoms):
+        return (make_diary_table(df_eating, df_symptoms),
+                make_bad_foods_table(df_eating),
+                make_statistics_table(df_eating, df_symptoms))
+
+    compact_before = data_processing.COMPACT_SCHEMA
+    try:
+        dataframes = {compact: {account_id: load(account_id, compact) for account_id in account_ids} for compact in (False, True)}
+    finally:
+        data_processing.COMPACT_SCHEMA = compact_before
+    loaded = [account_id for account_id in account_ids if dataframes[False][account_id][2] is True]
+
+    # The same tables? (the diary table's columns are object either way, the rows must match)
+    for account_id in loaded:
+        expected, actual = make_tables(*dataframes[False][account_id][:2]), make_tables(*dataframes[True][account_id][:2])
+        for df_expected, df_actual in zip(expected, actual):
+            pd.testing.assert_frame_equal(df_actual.astype(object), df_expected.astype(object))
+
+    n_bytes, timings = {}, {}
+    for compact, name in [(False, 'default'), (True, 'compact')]:
+        n_bytes[name] = sum(int(df.memory_usage(deep=True).sum()) for account_id in loaded for df in dataframes[compact][account_id][:2])
+        timings[name] = _time(lambda account_id: make_tables(*dataframes[compact][account_id][:2]), loaded, repeat)
+
+    n = len(loaded)
+    print(f"compact schema ({n} accounts, best of {repeat}):")
+    print(f"  memory of the df's: default {n_bytes['default'] / 2**20:6.2f} MiB, compact {n_bytes['compact'] / 2**20:6.2f} MiB "
+          f"({n_bytes['default'] / n_bytes['compact']:.1f}x smaller)")
+    print(f"  tables after a search: default {timings['default'] / n * 1000:6.2f} ms, compact {timings['compact'] / n * 1000:6.2f} ms "
+          f"per account ({timings['default'] / timings['compact']:.2f}x)")
+
+
+
+def make_synthetic_account(n_rows, seed=0):
+    """
+    The cleaned df's (eating data with name_regex, symptoms) of one synthetic account with n_rows eating rows:
+    ~10 rows per day, a report for every 25 rows (most of them without timing and grade, see toy_data.py)
+    """
+    rng = np.random.default_rng(seed)
+    n_days, n_reports = max(1, n_rows // 10), max(1, n_rows // 25)
+    start = np.datetime64('1900-01-01')
+
+    names = rng.choice(FOODS, n_rows)
+    df_eating = pd.DataFrame({COLUMN_ACCOUNT_ID: 1,
+                              COLUMN_DATE: pd.to_datetime(start + np.sort(rng.integers(0, n_days, n_rows))),
+                              COLUMN_MEAL_ID: np.arange(n_rows) // 4,
+                              COLUMN_MEAL: rng.choice(list(MEALS_MAPPING), n_rows),
+                              COLUMN_NAME: names,
+                              COLUMN_FOODSTUFF_ID: rng.integers(1, 10_000, n_rows),
+                              COLUMN_NAME_REGEX: names})
+
+    unknown = rng.random(n_reports) < TIMING_UNKNOWN_SHARE
+    df_symptoms = pd.DataFrame({COLUMN_ACCOUNT_ID: 1,
+                                COLUMN_DATE: pd.to_datetime(start + np.sort(rng.integers(0, n_days + 1, n_reports))),
+                                COLUMN_TIMING: np.where(unknown, TIMING_UNKNOWN, rng.choice(TIMINGS, n_reports)),
+                                COLUMN_SYMPTOM: rng.choice(SYMPTOMS, n_reports),
+                                COLUMN_GRADE: np.where(unknown, np.nan, rng.integers(1, 11, n_reports))})
+    return (df_eating, df_symptoms)
+
+
+
+def _add_columns_with_merge(df_eating, df_symptoms):
+    """`add_columns_to_eating_data` as it was: isin on the dates, a groupby of the symptoms and a merge (the reference)"""
+    df_eating[COLUMN_WEEKDAY] = df_eating[COLUMN_DATE].dt.weekday
+    df_eating[COLUMN_NAME_REGEX] = df_eating.pop(COLUMN_NAME_REGEX)
+
+    df_eating[COLUMN_SYMPTOM_SAME_DAY] = df_eating[COLUMN_DATE].isin(df_symptoms[COLUMN_DATE])
+    df_eating[COLUMN_SYMPTOM_NEXT_DAY] = (df_eating[COLUMN_DATE] + pd.Timedelta(1, unit='D')).isin(df_symptoms[COLUMN_DATE])
+
+    unique_values = tuple(df_symptoms[COLUMN_TIMING].unique())
+    try:
+        mapping = {[v for v in unique_values if e.lower() in v.lower()][0]: e for e in sorted(MEALS_MAPPING.keys())}
+    except IndexError:
+        mapping = {'AFTER_BREAKFAST': 'BREAKFAST', 'AFTER_DINNER': 'DINNER', 'AFTER_LUNCH': 'LUNCH'}
+
+    df_symptoms[COLUMN_MEAL] = df_symptoms[COLUMN_TIMING].map(mapping)
+    df_symptoms_agg = (df_symptoms[[COLUMN_DATE, COLUMN_MEAL, COLUMN_SYMPTOM, COLUMN_GRADE]].groupby([COLUMN_DATE, COLUMN_MEAL])
+                       .agg({COLUMN_SYMPTOM: ", ".join, COLUMN_GRADE: 'mean'}).reset_index())
+    df_symptoms_agg.columns = [COLUMN_DATE, COLUMN_MEAL, COLUMN_SYMPTOMS, COLUMN_AVG_GRADE]
+    return df_eating.merge(df_symptoms_agg, how='left', on=[COLUMN_DATE, COLUMN_MEAL])
+
+
+
+def benchmark_add_columns(engine, account_ids, repeat=3, sizes=(100_000, 300_000, 1_000_000)):
+    """
+    `add_columns_to_eating_data` (day numbers looked up in a table, the symptoms keyed by (day, meal code))
+    versus the merge it replaced, on the accounts of the database and on synthetic accounts with long histories.
+    Both must return the same df's (the merge added the 'meal' column to the symptoms, now `add_columns_to_symptoms_data`).
+    """
+    def check(df_eating, df_symptoms):
+        expected = _add_columns_with_merge(df_eating.copy(), df_symptoms_expected := df_symptoms.copy())
+        actual = add_columns_to_eating_data(df_eating, df_symptoms)
+        # the merge returned avg_grade as object when the grades were all None (no timing), now always float
+        expected[COLUMN_AVG_GRADE] = expected[COLUMN_AVG_GRADE].astype('float64')
+        pd.testing.assert_frame_equal(actual, expected)
+        pd.testing.assert_frame_equal(add_columns_to_symptoms_data(actual, df_symptoms), df_symptoms_expected)
+
+    def time_func(func, df_eating, df_symptoms):
+        timings = []
+        for _ in range(repeat):
+            df_eating_copy, df_symptoms_copy = df_eating.copy(), df_symptoms.copy()
+            timings.append(_time_call(lambda: func(df_eating_copy, df_symptoms_copy)))
+        return min(timings)
+
+    def get_lazy_columns(df_eating, df_symptoms):
+        return LazyEatingData(df_eating, df_symptoms).get()
+
+    n_checked = 0
+    for account_id in account_ids:
+        status, df_eating, df_symptoms = load_account(account_id, engine)
+        if status is True:
+            df_eating = clean_eating_data(df_eating)
+            df_eating[COLUMN_NAME_REGEX] = regex_foodstuff_name(df_eating[COLUMN_NAME])
+            check(df_eating, clean_symptoms_data(df_symptoms))
+            n_checked += 1
+
+    print(f"add columns ({n_checked} accounts compared, best of {repeat}):")
+    for size in sizes:
+        df_eating, df_symptoms = make_synthetic_account(size)
+        check(df_eating, df_symptoms)
+        time_merge = time_func(_add_columns_with_merge, df_eating, df_symptoms)
+        time_sorted = time_func(add_columns_to_eating_data, df_eating, df_symptoms)
+        print(f"  {size:>9,} rows: merge {time_merge * 1000:8.2f} ms, keyed {time_sorted * 1000:8.2f} ms "
+              f"({time_merge / time_sorted:.2f}x)")
+
+
+
+def benchmark_lazy_columns(engine, account_ids, repeat=3, size=1_000_000):
+    """
+    The engineered columns on demand (LAZY_COLUMNS, see `LazyEatingData`) versus all of them on the load:
+    the account loads with the columns which the units of the app read, and the columns alone on a synthetic account.
+    The columns asked for must be the same as the ones computed on the load (also with COMPACT_SCHEMA),
+    a second call must not compute them again.
+    """
+    columns = get_columns_needed(UNIT_COLUMNS)
+
+    def load(account_id, columns):
+        return get_dataframes(account_id, engine, cache=None, snapshots=None, columns=columns)
+
+    def check(df_expected, df_actual, columns):
+        base = [column for column in df_expected.columns if column not in ENGINEERED_COLUMNS]
+        pd.testing.assert_frame_equal(df_actual, df_expected[base + columns])
+
+    compact_before = data_processing.COMPACT_SCHEMA
+    try:
+        for compact in (False, True):
+            data_processing.COMPACT_SCHEMA = compact
+            for account_id in account_ids:
+                df_expected, df_symptoms_expected, status = load(account_id, None)
+                if status is True:
+                    check(df_expected, load(account_id, columns)[0], columns)
+                    check(df_expected, load(account_id, [])[0], [])
+                    df_actual, df_symptoms, _ = load(account_id, list(ENGINEERED_COLUMNS))
+                    pd.testing.assert_frame_equal(df_actual, df_expected)
+                    pd.testing.assert_frame_equal(df_symptoms, df_symptoms_expected)
+    finally:
+        data_processing.COMPACT_SCHEMA = compact_before
+
+    # A cached entry keeps the computed columns (the cache returns the object itself), the others aren't computed
+    cache = DataFrameCache(max_bytes=2**30)
+    account_id = next(account_id for account_id in account_ids if load(account_id, [])[2] is True)
+    get_dataframes(account_id, engine, cache=cache, snapshots=None, columns=columns)
+    entry = next(iter(cache._entries.values()))[1][0]
+    assert set(columns) <= set(entry.computed_columns) and COLUMN_WEEKDAY not in entry.computed_columns, entry
+    # ...and the cache counts their bytes (also the ones computed for a later call)
+    def count_bytes():
+        return sum(int(df.memory_usage(deep=True).sum()) for df in next(iter(cache._entries.values()))[1])
+    n_bytes = cache.n_bytes
+    assert n_bytes == count_bytes(), cache
+    get_dataframes(account_id, engine, cache=cache, snapshots=None, columns=[COLUMN_WEEKDAY])
+    assert cache.n_bytes == count_bytes() > n_bytes, cache
+
+    time_eager = _time(lambda account_id: load(account_id, None), account_ids, repeat)
+    time_lazy = _time(lambda account_id: load(account_id, columns), account_ids, repeat)
+
+    df_eating, df_symptoms = make_synthetic_account(size)
+    time_all = min(_time_call(lambda: add_columns_to_eating_data(df_eating, df_symptoms)) for _ in range(repeat))
+    time_needed = min(_time_call(lambda: LazyEatingData(df_eating, df_symptoms).get(columns)) for _ in range(repeat))
+    columns_few = get_columns_needed(UNIT_COLUMNS, [unit_2, unit_3])   # e.g. a layout with the statistics and the diary only
+    time_few = min(_time_call(lambda: LazyEatingData(df_eating, df_symptoms).get(columns_few)) for _ in range(repeat))
+
+    n = len(account_ids)
+    print(f"lazy columns (the units read {columns}, best of {repeat}):")
+    print(f"  account load: all columns {time_eager / n * 1000:6.2f} ms, on demand {time_lazy / n * 1000:6.2f} ms "
+          f"per account ({time_eager / time_lazy:.2f}x)")
+    print(f"  {size:,} rows: all columns {time_all * 1000:7.2f} ms, on demand {time_needed * 1000:7.2f} ms "
+          f"({time_all / time_needed:.2f}x), units 2 and 3 only {time_few * 1000:7.2f} ms ({time_all / time_few:.2f}x)")
+
+
+
+def benchmark_copy_on_write(engine, account_ids, repeat=3, size=100_000, n_units=7):
+    """
+    The pipeline doesn't change the df's passed in (data_processing.py, data_filtering.py, table_toolkit.py and the plots):
+    every function is run on the df's of each account, which must be the same afterwards.
+    Then the bytes allocated when one cached entry feeds all units:
+    a copy per unit (as the cache and the callers did before) versus the shallow copies (Copy-on-Write).
+    """
+    def call(func, *args, **kwargs):
+        """func(*args, **kwargs), the df's among the args must be unchanged afterwards"""
+        dfs = [arg for arg in args if isinstance(arg, pd.DataFrame)]
+        snapshots = [df.copy() for df in dfs]
+        result = func(*args, **kwargs)
+        for df, df_snapshot in zip(dfs, snapshots):
+            try:
+                pd.testing.assert_frame_equal(df, df_snapshot)
+            except AssertionError as e:
+                raise AssertionError(f"{func.__name__} changed a df passed in: {e}") from None
+        return result
+
+    def run_units(df_eating, df_symptoms):
+        start_date, end_date = df_eating[COLUMN_DATE].min(), df_eating[COLUMN_DATE].max()
+        df_eating_dates = call(subset_data_by_dates, df_eating, start_date, end_date)
+        df_symptoms_dates = call(subset_data_by_dates, df_symptoms, start_date, end_date)
+        call(make_statistics_table, df_eating_dates, df_symptoms_dates)
+        call(make_figure, 3, df_eating_dates, df_symptoms_dates)
+        df_diary = call(subset_data_by_dates, call(make_diary_table, df_eating, df_symptoms), start_date, end_date)
+        call(prettify_diary_table, df_diary)
+        for unit, selectors in [(4, {'symptom_selector': C}), (5, {'grade_selector': 1}), (6, {'meals_selector': B}),
+                                (7, {'symptom_selector': D})]:
+            df = call(subset_data_by_selector_values, df_eating_dates, **selectors)
+            call(make_figure, unit, df, *([2] if unit == 7 else []))
+        try:
+            call(make_probably_bad_foods_table, df_eating)
+        except ValueError:  # no foodstuffs on days with symptoms
+            pass
+
+    def get_lazy_columns(df_eating, df_symptoms):
+        return LazyEatingData(df_eating, df_symptoms).get()
+
+    n_checked = 0
+    for account_id in account_ids:
+        status, df_eating, df_symptoms = load_account(account_id, engine)
+        if status is not True:
+            continue
+        df_eating, df_symptoms = call(clean_eating_data, df_eating), call(clean_symptoms_data, df_symptoms)
+        call(get_lazy_columns, df_eating, df_symptoms)
+        df_eating = call(add_columns_to_eating_data, df_eating, df_symptoms)
+        df_symptoms = call(add_columns_to_symptoms_data, df_eating, df_symptoms)
+        run_units(df_eating, df_symptoms)
+        n_checked += 1
+
+    # The bytes allocated (numpy via tracemalloc, the arrow strings via the pool of pyarrow)
+    try:
+        import pyarrow
+        arrow_bytes = pyarrow.total_allocated_bytes
+    except ImportError:
+        arrow_bytes = lambda: 0
+
+    def allocated():
+        return tracemalloc.get_traced_memory()[0] + arrow_bytes()
+
+    df_eating, df_symptoms = make_synthetic_account(size)
+    df_eating = add_columns_to_eating_data(df_eating, df_symptoms)
+    df_symptoms = add_columns_to_symptoms_data(df_eating, df_symptoms)
+    cache = DataFrameCache(max_bytes=2**30)
+    cache.put((1, None, None), 'token', (df_eating, df_symptoms))
+
+    def feed_units(copy):
+        held = []
+        bytes_start = allocated()
+        for _ in range(n_units):
+            dataframes = cache.get((1, None, None), 'token')
+            held.append(tuple(df.copy() for df in dataframes) if copy else dataframes)
+        return allocated() - bytes_start
+
+    tracemalloc.start()
+    try:
+        n_bytes = {copy: min(feed_units(copy) for _ in range(repeat)) for copy in (True, False)}
+    finally:
+        tracemalloc.stop()
+
+    print(f"copy-on-write ({n_checked} accounts: the df's passed in are unchanged by every function):")
+    print(f"  {n_units} units fed by one cached entry ({size:,} rows): a copy per unit {n_bytes[True] / 2**20:7.2f} MiB, "
+          f"shared {n_bytes[False] / 2**20:7.2f} MiB")
+
+
+
+def benchmark_polars(engine, account_ids, repeat=3, sizes=(100_000, 1_000_000)):
+    """
+    The Polars engine (ENGINE = 'polars', see polars_engine.py) versus pandas: the account loads (also with COMPACT_SCHEMA)
+    and each function it covers - the cleaning, the engineered columns, the filters by dates and by the selectors,
+    the diary and the statistics tables - on the accounts of the database and on synthetic accounts with long histories.
+    The parity check: the df's must be the same with either engine. The timings are per function.
+    """
+    modules = (data_processing, data_filtering, table_toolkit)
+    selectors = [(meals, symptoms, grade) for meals in (None, A, B, D) for symptoms in (None, A, B, C, D) for grade in (None, 3, 10)]
+
+    def run(engine_name, func, *args, **kwargs):
+        engines_before = [module.ENGINE for module in modules]
+        for module in modules:
+            module.ENGINE = engine_name
+        try:
+            return func(*args, **kwargs)
+        finally:
+            for module, engine_before in zip(modules, engines_before):
+                module.ENGINE = engine_before
+
+    def load(account_id, engine_name, compact):
+        compact_before, data_processing.COMPACT_SCHEMA = data_processing.COMPACT_SCHEMA, compact
+        try:
+            return run(engine_name, get_dataframes, account_id, engine, cache=None, snapshots=None)
+        finally:
+            data_processing.COMPACT_SCHEMA = compact_before
+
+    def get_calls(df_raw, df_eating, df_symptoms):
+        """The functions (by name) with their arguments, as the app calls them after a search"""
+        dates = df_eating[COLUMN_DATE].dropna()
+        date_ranges = [(dates.min(), dates.max()), (dates.quantile(0.25), dates.quantile(0.75)), ('2000-01-01', '2000-01-31')]
+        date_ranges = [(str(pd.Timestamp(start).date()), str(pd.Timestamp(end).date())) for start, end in date_ranges]
+        df_clean = df_eating[df_raw.columns.tolist() + [COLUMN_NAME_REGEX]]
+        return {'clean_eating_data': [(clean_eating_data, df_raw)],
+                'add_columns': [(add_columns_to_eating_data, df_clean, df_symptoms)],
+                'subset_by_dates': [(subset_data_by_dates, df, *dates) for df in (df_eating, df_symptoms) for dates in date_ranges],
+                'subset_by_selectors': [(subset_data_by_selector_values, df_eating, *values) for values in selectors],
+                'diary_table': [(make_diary_table, df_eating, df_symptoms)],
+                'statistics_table': [(make_statistics_table, df_eating, df_symptoms)]}
+
+    def check_and_time(calls, timings):
+        for name, function_calls in calls.items():
+            for engine_name in ('pandas', 'polars'):
+                timings[engine_name].setdefault(name, 0.0)
+                timings[engine_name][name] += min(_time_call(lambda: [run(engine_name, func, *args) for func, *args in function_calls])
+                                                  for _ in range(repeat))
+            for func, *args in function_calls:
+                pd.testing.assert_frame_equal(run('polars', func, *args), run('pandas', func, *args))
+
+    def print_timings(timings):
+        for name in timings['pandas']:
+            time_pandas, time_polars = timings['pandas'][name], timings['polars'][name]
+            print(f"    {name:<20} pandas {time_pandas * 1000:9.2f} ms, polars {time_polars * 1000:9.2f} ms "
+                  f"({time_pandas / time_polars:.2f}x)")
+
+    # The loads: the same df's from either engine (also with the compact dtypes)
+    loaded = []
+    for account_id in account_ids:
+        for compact in (False, True):
+            expected, actual = load(account_id, 'pandas', compact), load(account_id, 'polars', compact)
+            assert actual[2] == expected[2], f"status: {actual[2]} != {expected[2]}"
+            if expected[2] is True:
+                pd.testing.assert_frame_equal(actual[0], expected[0])
+                pd.testing.assert_frame_equal(actual[1], expected[1])
+        if expected[2] is True:
+            loaded.append(account_id)
+
+    timings = {'pandas': {}, 'polars': {}}
+    for account_id in loaded:
+        status, df_raw, _ = load_account(account_id, engine)
+        df_eating, df_symptoms, _ = load(account_id, 'pandas', False)
+        check_and_time(get_calls(df_raw, df_eating, df_symptoms), timings)
+    print(f"polars engine ({len(loaded)} accounts compared, also with the compact schema, best of {repeat}):")
+    print_timings(timings)
+
+    for size in sizes:
+        df_clean, df_symptoms = make_synthetic_account(size)
+        df_symptoms = add_columns_to_symptoms_data(df_clean, df_symptoms)
+        df_eating = add_columns_to_eating_data(df_clean, df_symptoms)
+        timings = {'pandas': {}, 'polars': {}}
+        check_and_time(get_calls(df_clean.drop(columns=COLUMN_NAME_REGEX), df_eating, df_symptoms), timings)
+        print(f"  {size:>9,} rows:")
+        print_timings(timings)
+
+
+
+def benchmark_account_index(engine, account_ids, repeat=3, n_calls=1_000):
+    """
+    The answer for an unknown account: `check_account` (a query) versus the account index (see `AccountIndex`
+    on data_caching.py). The index must give the same answer as `check_account` for all ids around the known ones,
+    an account added after the index was loaded must be found (also within the check interval), but the searches for
+    the ids above the indexed ones must not fetch the new accounts each time.
+    """
+    index = AccountIndex(max_age=600, check_interval=0.5)
+
+    # The same answers?
+    for account_id in range(0, max(account_ids) + 100):
+        assert index.exists(account_id, engine) == (check_account(account_id, engine) is not None), account_id
+    assert index.extensions <= 2, index
+
+    # A new account (above the indexed ids)
+    account_id_new = max(account_ids) + 1000
+    with engine.begin() as connection:
+        connection.execute(text(f"INSERT INTO {SCHEMA}.{TABLE_ACCOUNT} ({COLUMN_ACCOUNT_ID}) VALUES (:account_id)"),
+                           {'account_id': account_id_new})
+    try:
+        extensions, index.check_interval = index.extensions, 600
+        assert index.exists(account_id_new, engine), "the new account was not found within the check interval"
+        assert index.extensions == extensions, index
+        index.check_interval = 0.5
+        sleep(index.check_interval)
+        assert index.exists(account_id_new, engine), "the new account was not found"
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text(f"DELETE FROM {SCHEMA}.{TABLE_ACCOUNT} WHERE {COLUMN_ACCOUNT_ID} = :account_id"),
+                               {'account_id': account_id_new})
+
+    unknown_ids = [account_id for account_id in range(1, 101)]   # below the toy data's ids
+    def time_calls(func):
+        timings = []
+        for _ in range(repeat):
+            time_start = perf_counter()
+            for i in range(n_calls):
+                func(unknown_ids[i % len(unknown_ids)])
+            timings.append(perf_counter() - time_start)
+        return min(timings) / n_calls
+
+    time_query = time_calls(lambda account_id: check_account(account_id, engine))
+    time_index = time_calls(lambda account_id: index.exists(account_id, engine))
+    print(f"account index ({n_calls} unknown accounts, best of {repeat}; {index}):")
+    print(f"  check_account: {time_query * 1e6:8.1f} µs, index: {time_index * 1e6:6.1f} µs per search "
+          f"({time_query / time_index:.0f}x)")
+
+
+
+def benchmark_cancellation(engine, account_ids, repeat=3, timeout=0.2, delay=0.2):
+    """
+    The statement timeout of a load and the cancellation of a load superseded by a newer load of the same session
+    (see data_cancellation.py), on a slow query (seconds without a timeout).
+    Timed: until the query gives up, i.e. until its connection is back in the pool.
+    Also checks that a search within a load returns the same df's as without.
+    """
+    def run_slow_query():
+        return run_query('slow', text(SQL_SLOW), engine=engine, fetch=ALL)
+
+    # Timeout
+    timings = []
+    for _ in range(repeat):
+        time_start = perf_counter()
+        try:
+            with superseding_load(None, timeout=timeout):
+                run_slow_query()
+        except TimeoutError:
+            timings.append(perf_counter() - time_start)
+    assert len(timings) == repeat, "the slow query was not stopped by the statement timeout"
+    print(f"cancellation:\n  statement timeout {timeout:.2f} s:      query stopped after {min(timings):.3f} s (best of {repeat})")
+
+    # Superseded: a second load of the same session starts while the first one's query is running
+    def first_load():
+        try:
+            with superseding_load('session', timeout=None):
+                run_slow_query()
+        except LoadCancelled:
+            results['time_cancelled'] = perf_counter()
+
+    timings = []
+    for _ in range(repeat):
+        results = {}
+        thread = Thread(target=first_load)
+        thread.start()
+        sleep(delay)
+        time_start = perf_counter()
+        with superseding_load('session', timeout=None):
+            pass
+        thread.join()
+        assert 'time_cancelled' in results, "the superseded load was not cancelled"
+        timings.append(results['time_cancelled'] - time_start)
+    print(f"  superseded after {delay:.2f} s:       query stopped after {min(timings):.3f} s (best of {repeat}), "
+          f"connections checked out: {engine.pool.checkedout()}")
+
+    # The same df's within a load
+    for account_id in account_ids[:10]:
+        with superseding_load('session'):
+            df_eating, df_symptoms, status = get_dataframes(account_id, engine, cache=None, snapshots=None)
+        df_eating_expected, df_symptoms_expected, status_expected = get_dataframes(account_id, engine, cache=None, snapshots=None)
+        assert status == status_expected, account_id
+        if status is True:
+            pd.testing.assert_frame_equal(df_eating, df_eating_expected)
+            pd.testing.assert_frame_equal(df_symptoms, df_symptoms_expected)
+    print(f"  the same df's within a load: ok ({min(len(account_ids), 10)} accounts)")
+
+
+
+def benchmark_indexes(engine, account_ids, repeat=3):
+    """
+    The plans (EXPLAIN QUERY PLAN) and the timings of the queries before and after the indexes
+    recommended by index_advisor.py are made on the stand-in database (they are dropped afterwards).
+    """
+    statements = {'fetch_eating_data': (fetch_eating_data, _make_eating_data_statement(False, False)),
+                  'fetch_symptoms_data': (fetch_symptoms_data, _make_symptoms_data_statement(False, False)),
+                  'load_account': (load_account, _make_load_account_statement(False, False, False, False)),
+                  'fetch_date_range': (fetch_date_range, STATEMENT_DATE_RANGE),
+                  'fetch_change_token': (fetch_change_token, STATEMENT_CHANGE_TOKEN)}
+
+    def get_plans():
+        with engine.connect() as connection:
+            return {name: [row[-1] for row in connection.execute(text("EXPLAIN QUERY PLAN " + statement.text.strip()),
+                                                                   {'account_id': account_ids[0]})]
+                    for name, (_, statement) in statements.items()}
+
+    def get_timings():
+        return {name: _time(lambda account_id: func(account_id, engine), account_ids, repeat) / len(account_ids)
+                for name, (func, _) in statements.items()}
+
+    plans_before, timings_before = get_plans(), get_timings()
+    indexes = create_indexes(engine)
+    assert not [index for index, status, _ in check_indexes(engine) if status in (MISSING, NOT_COVERING)]
+    plans_after, timings_after = get_plans(), get_timings()
+
+    print(f"indexes ({len(indexes)} made: {', '.join(index['name'] for index in indexes)}; {len(account_ids)} accounts, best of {repeat}):")
+    for name in statements:
+        print(f"  {name + ':':<21} {timings_before[name] * 1000:6.2f} ms -> {timings_after[name] * 1000:6.2f} ms per account "
+              f"({timings_before[name] / timings_after[name]:.1f}x)")
+        print("    before: " + "\n            ".join(plans_before[name]))
+        print("    after:  " + "\n            ".join(plans_after[name]))
+
+    with engine.begin() as connection:
+        for index in indexes:
+            connection.execute(text(f"DROP INDEX {SCHEMA}.{index['name']}"))
+
+
+
+def benchmark_out_of_core(engine, account_ids, repeat=3):
+    """
+    The out-of-core mode (OUT_OF_CORE_DIR, see data_out_of_core.py) versus the df's in memory:
+    each unit's data queried from the account's DuckDB file must be the same as computed from the df's
+    (the statistics, the diary, the timeline, the counts of the units 4-7 and the "probably bad foods"),
+    for several date ranges and all values of the selectors.
+    The counts of the unit 7 are compared by value (the order of the ties is arbitrary with the df's).
+    Then the timings of a search and of the units, the peak memory (python heap) and the bytes sent to the browser.
+    """
+    if data_out_of_core.duckdb is None:
+        print("out-of-core mode: requires duckdb (pip install duckdb)")
+        return
+
+    selectors = {4: [(meals, symptoms) for meals in (A, B, C, D) for symptoms in (A, B, C, D)],
+                 5: [(meals, grade) for meals in (A, B, C, D) for grade in range(1, 11)],
+                 6: [(meals, symptoms) for meals in (A, B, C, D) for symptoms in (A, B, C, D)],
+                 7: [(A, A, 2), (D, C, 3), (B, A, 4), (C, A, 5)]}   # (slow with the df's)
+
+    def get_date_ranges(df_eating):
+        dates = df_eating[COLUMN_DATE].dropna()
+        date_ranges = [(dates.min(), dates.max()), (dates.quantile(0.25), dates.quantile(0.75)), ('2000-01-01', '2000-01-31')]
+        return [(str(pd.Timestamp(start).date()), str(pd.Timestamp(end).date())) for start, end in date_ranges]
+
+    def value_counts(df, top_n):
+        sr = df[COLUMN_NAME_REGEX].value_counts()
+        return sr[sr > 0].head(top_n)
+
+    def meal_counts(df):
+        arr = (df[[COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME_REGEX]].astype({COLUMN_NAME_REGEX: object})
+               .groupby([COLUMN_DATE, COLUMN_MEAL], observed=True).agg(list).values.ravel())
+        return Counter(frozenset(e) for e in arr)
+
+    def probably_bad_foods(func, *args):
+        try:
+            return func(*args)
+        except ValueError as e:   # no days with symptoms (raised by either version)
+            return str(e)
+
+    def check_unit(unit, account_id, df_dates, dates, values):
+        """The counts of the unit from the file versus from the df"""
+        kwargs = dict(start_date=dates[0], end_date=dates[1], top_n=UNIT_TOP_N[unit], meals_selector=values[0],
+                      directory=directory, **{'grade_selector' if unit == 5 else 'symptom_selector': values[1]})
+        df = subset_data_by_selector_values(df_dates, **{k: v for k, v in kwargs.items() if k.endswith('selector')})
+        if unit in (4, 5):
+            counts, expected = data_out_of_core.read_foodstuff_counts(account_id, **kwargs), value_counts(df, UNIT_TOP_N[unit])
+            assert counts.tolist() == expected.tolist() and dict(counts) == dict(expected), (account_id, unit, dates, values)
+        elif unit == 6:
+            counts, expected = data_out_of_core.read_meal_counts(account_id, **kwargs), meal_counts(df)
+            assert counts.most_common() == expected.most_common(UNIT_TOP_N[6]), (account_id, unit, dates, values)
+        else:
+            counts = data_out_of_core.read_combination_counts(account_id, values[2], **kwargs)
+            expected = compute_combination_occurrence(list(meal_counts(df).elements()), values[2])
+            assert ([count for _, count in counts.most_common()] == [count for _, count in expected.most_common(UNIT_TOP_N[7])]
+                    and all(expected[frozenset(names)] == count for names, count in counts.items())), (account_id, unit, dates, values)
+
+    with tempfile.TemporaryDirectory() as directory:
+        n_compared, loaded = 0, []
+        for account_id in account_ids:
+            status = data_out_of_core.spill_account(account_id, engine, directory=directory)
+            df_eating, df_symptoms, res = get_dataframes(account_id, engine, cache=None, snapshots=None)
+            assert status == res, f"status: {status} != {res}"
+            if res is not True:
+                continue
+            loaded.append(account_id)
+
+            # the whole history: the date range and the "probably bad foods"
+            assert data_out_of_core.read_date_range(account_id, directory) == get_dates_range(df_eating, df_symptoms)
+            expected = probably_bad_foods(make_probably_bad_foods_table, df_eating)
+            actual = probably_bad_foods(make_probably_bad_foods_table_from_counts,
+                                        data_out_of_core.read_foodstuff_flags(account_id, directory))
+            assert actual == expected if isinstance(expected, str) else actual.equals(expected), account_id
+
+            df_diary = make_diary_table(df_eating, df_symptoms)
+            for dates in get_date_ranges(df_eating):
+                df_eating_dates = subset_data_by_dates(df_eating, *dates)
+                df_symptoms_dates = subset_data_by_dates(df_symptoms, *dates)
+
+                # unit 2 (within a window without data the pandas version fails)
+                statistics = data_out_of_core.read_statistics(account_id, *dates, directory=directory)
+                assert (statistics is None) == (len(df_eating_dates) + len(df_symptoms_dates) == 0), account_id
+                if statistics and len(df_symptoms_dates):
+                    pd.testing.assert_frame_equal(make_statistics_table_from_counts(statistics),
+                                                  make_statistics_table(df_eating_dates, df_symptoms_dates), check_dtype=False)
+
+                # unit 3: the diary table and the timeline
+                pd.testing.assert_frame_equal(
+                    prettify_diary_table(finish_diary_table(data_out_of_core.read_diary(account_id, *dates, directory=directory))),
+                    prettify_diary_table(subset_data_by_dates(df_diary, *dates).reset_index(drop=True)), check_dtype=False)
+                df_eating_timeline, df_symptoms_timeline = data_out_of_core.read_timeline(account_id, *dates, directory=directory)
+                assert (make_figure(3, df_eating_timeline, df_symptoms_timeline).to_json()
+                        == make_figure(3, df_eating_dates, df_symptoms_dates).to_json()), (account_id, dates)
+
+                # units 4-7
+                for unit, unit_selectors in selectors.items():
+                    for values in unit_selectors:
+                        check_unit(unit, account_id, df_eating_dates, dates, values)
+                        n_compared += 1
+
+        # A file removed while a session still shows the account (see `remove_old_files`): the units write it again,
+        # an account without data (anymore) gets an empty file, i.e. the units show no data
+        engine_before = data_access._engine
+        data_access._engine = engine   # the units use the engine of the app
+        try:
+            account_id = loaded[0]
+            statistics = data_out_of_core.read_statistics(account_id, directory=directory)
+            os.remove(data_out_of_core._get_path(account_id, directory))
+            assert data_out_of_core.read_statistics(account_id, directory=directory) == statistics, account_id
+            account_id_unknown = min(account_ids) - 1
+            assert data_out_of_core.read_statistics(account_id_unknown, directory=directory) is None
+            assert all(len(df) == 0 for df in data_out_of_core.read_timeline(account_id_unknown, directory=directory))
+        finally:
+            data_access._engine = engine_before
+
+        n = len(loaded)
+        print(f"out-of-core mode ({n} accounts, {n_compared} plots compared, best of {repeat}):")
+
+        # A search: the file is written (first search) or its token checked (the same data) versus the df's and the stores
+        def search_in_memory(account_id):
+            df_eating, df_symptoms, _ = get_dataframes(account_id, engine, cache=None, snapshots=None)
+            return (probably_bad_foods(make_probably_bad_foods_table, df_eating),
+                    to_json(df_eating), to_json(df_symptoms), to_json(make_diary_table(df_eating, df_symptoms)))
+
+        def spill(account_id, directory):
+            data_out_of_core.spill_account(account_id, engine, directory=directory)
+            return data_out_of_core.read_foodstuff_flags(account_id, directory)
+
+        with tempfile.TemporaryDirectory() as directory_new:
+            time_spill = _time_call(lambda: [spill(account_id, directory_new) for account_id in loaded])
+        print(f"  search in memory (df's + json):  {_time(search_in_memory, loaded, repeat) / n * 1000:8.2f} ms per account")
+        print(f"  search, file written:            {time_spill / n * 1000:8.2f} ms per account")
+        print(f"  search, file up to date:         {_time(lambda a: spill(a, directory), loaded, repeat) / n * 1000:8.2f} ms per account")
+
+        # The units after a search (the whole history, the default selectors), the df from the json in the store
+        json_eating = {account_id: to_json(get_dataframes(account_id, engine, cache=None, snapshots=None)[0]) for account_id in loaded}
+
+        def units_in_memory(account_id):
+            df_eating = table_toolkit.read_json(json_eating[account_id])
+            for unit, values in [(4, (A, A)), (5, (A, 1)), (6, (A, A)), (7, (A, A))]:
+                df = subset_data_by_selector_values(df_eating, values[0], *(values[1:] if unit != 5 else (None, values[1])))
+                make_figure(unit, df, *([2] if unit == 7 else []))
+
+        def units_out_of_core(account_id):
+            for unit in (4, 5, 6, 7):
+                kwargs = dict(top_n=UNIT_TOP_N[unit], meals_selector=A, directory=directory,
+                              **{'grade_selector' if unit == 5 else 'symptom_selector': 1 if unit == 5 else A})
+                counts = (data_out_of_core.read_foodstuff_counts(account_id, **kwargs) if unit in (4, 5) else
+                          data_out_of_core.read_meal_counts(account_id, **kwargs) if unit == 6 else
+                          data_out_of_core.read_combination_counts(account_id, 2, **kwargs))
+                make_figure_from_counts(unit, counts)
+
+        print(f"  units 4-7 in memory (json read): {_time(lambda a: units_in_memory(a), loaded, repeat) / n * 1000:8.2f} ms per account")
+        print(f"  units 4-7 out-of-core:           {_time(units_out_of_core, loaded, repeat) / n * 1000:8.2f} ms per account")
+
+        # The peak of the python heap of a search (DuckDB's own memory is bounded by OUT_OF_CORE_MEMORY_LIMIT)
+        # and the bytes of the stores sent to the browser
+        account_id = max(loaded, key=lambda a: len(get_dataframes(a, engine, cache=None, snapshots=None)[0]))
+        for name in ('in memory', 'out-of-core'):
+            with tempfile.TemporaryDirectory() as directory_new:
+                tracemalloc.start()
+                try:
+                    result = search_in_memory(account_id) if name == 'in memory' else spill(account_id, directory_new)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            n_bytes = sum(len(e) for e in result[1:]) if name == 'in memory' else 0
+            print(f"  longest account, {name + ':':<12} peak {peak / 2**20:7.2f} MB, stores {n_bytes / 2**10:8.1f} KB")
+
+
+
+BENCHMARKS = {'account_load': benchmark_account_load,
+              'concurrent_load': benchmark_concurrent_load,
+              'statistics': benchmark_statistics,
+              'statements': benchmark_statements,
+              'foodstuffs': benchmark_foodstuffs,
+              'foodstuff_names': benchmark_foodstuff_names,
+              'name_regex': benchmark_name_regex,
+              'compact_schema': benchmark_compact_schema,
+              'add_columns': benchmark_add_columns,
+              'lazy_columns': benchmark_lazy_columns,
+              'copy_on_write': benchmark_copy_on_write,
+              'polars': benchmark_polars,
+              'out_of_core': benchmark_out_of_core,
+              'account_index': benchmark_account_index,
+              'cancellation': benchmark_cancellation,
+              'indexes': benchmark_indexes,
+              'daily_summary': benchmark_daily_summary}   # last: adds a meal
+
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description="benchmarks on a local SQLite stand-in for the database")
+    parser.add_argument('benchmark', choices=list(BENCHMARKS) + ['all'])
+    parser.add_argument('--rtt-ms', type=float, default=0.0, help="simulated network round trip time per query")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database', help="SQLite file made by toy_data.py (copied, default: assets/toy_data.zip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"{SCHEMA}.db")
+        if args.database:  # a copy, some benchmarks write into the database
+            shutil.copyfile(args.database, path)
+        else:
+            make_standin_database(path)
+        engine = make_standin_engine(path, rtt=args.rtt_ms / 1000)
+        account_ids = get_account_ids(engine)
+
+        for name, benchmark in BENCHMARKS.items():
+            if args.benchmark in (name, 'all'):
+                benchmark(engine, account_ids, repeat=args.repeat)
+        engine.dispose()
@@ -7,7 +7,7 @@ from itertools import combinations
 from math import sqrt, ceil
 from collections import Counter
 from datetime import date, timedelta
-from pandas import DataFrame, date_range
+from pandas import DataFrame, Series, date_range
 
 
 
@@ -43,8 +43,9 @@ def get_dates_range(arg1, arg2, return_min_max_only=True):
     # case args are df's
     if type(arg1) is type(arg2) is DataFrame:
         df_eating, df_symptomreport = arg1, arg2
-        min_date = min(df_eating['date'].min().to_pydatetime(), df_symptomreport['date'].min().to_pydatetime())
-        max_date = max(df_eating['date'].max().to_pydatetime(), df_symptomreport['date'].max().to_pydatetime())
+        # NaT (of an empty df) is skipped by pandas' min/max
+        min_date = Series([df_eating['date'].min(), df_symptomreport['date'].min()]).min().to_pydatetime()
+        max_date = Series([df_eating['date'].max(), df_symptomreport['date'].max()]).max().to_pydatetime()
 
         if return_min_max_only:
             return min_date, max_date  # pandas objects?
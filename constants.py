@@ -22,12 +22,109 @@ ERR_PREFIX = "dashboard-app:"
 DRIVER = 'postgresql'                 # maybe 'postgresql+psycopg2' or 'mysql'
 SCHEMA = 'data'
 
+# With DRIVER = 'sqlite' or 'duckdb' the app runs on a local file instead, e.g. synthetic data made by toy_data.py
+# $ python toy_data.py toy_data.db --accounts 100   (see `make_local_engine` on data_access.py)
+LOCAL_DATABASE = "toy_data.db"   # e.g. "toy_data.duckdb" for DuckDB
+
+# Connection pool of the (one per process) sqlalchemy engine - see `get_sqlalchemy_engine` on data_access.py
+POOL_SIZE = 5            # number of connections kept open
+POOL_MAX_OVERFLOW = 10   # additional connections allowed under load (closed when returned)
+POOL_TIMEOUT = 30        # seconds to wait for a free connection before an error is raised
+POOL_PRE_PING = True     # test a connection before handing it out (replaces connections dropped by the server)
+POOL_RECYCLE = 1800      # seconds after which a connection is replaced (managed databases drop idle connections)
+
+# Statement timeout for each query of a search in the app (seconds, None = no timeout) - see data_cancellation.py
+# A newer search of the same browser session cancels the queries of the older one in any case
+STATEMENT_TIMEOUT = 30
+
+# Stream the eating data of an account in chunks of this many rows (None = fetch it in one go)
+# Each chunk is cleaned as it arrives, i.e. the raw result is never held in memory as a whole
+FETCH_CHUNKSIZE = None   # e.g. 50_000 for very long account histories
+
+# Fetch the eating and the symptoms data at the same time (on two connections from the pool)
+# instead of in one combined query (useful if one of the two tables is much larger than the other)
+CONCURRENT_FETCH = False
+
+# Cache of the processed df's of the recently loaded accounts (in the memory of this process)
+# An entry is reused as long as the account's data hasn't changed (see `fetch_change_token` on data_access.py)
+CACHE_MAX_BYTES = 256 * 2**20   # max memory for the cached df's (0 = no caching)
+CACHE_DIR = None                # directory shared by all processes, e.g. "cache" (None = memory only), see warm_up.py
+CACHE_DIR_MAX_BYTES = 2**30     # max size of the files in CACHE_DIR (the least recently used files are removed first)
+
+# Fetch the meals as ids only (meal_id, date, meal, foodstuff_id) and resolve the foodstuff names (and the regex'ed names)
+# from a dictionary of all foodstuffs in the memory of this process (see `FoodstuffDictionary` on data_caching.py)
+# i.e. the names are neither sent by the database nor compared when the duplicated rows are dropped
+FOODSTUFF_DICTIONARY = False
+FOODSTUFF_DICTIONARY_MAX_AGE = 600   # seconds after which the dictionary is reloaded (new foodstuffs are fetched on demand)
+
+# Index of the account ids in the memory of this process (see `AccountIndex` on data_caching.py)
+# a search for an unknown account is answered without a query, new accounts (ids above the indexed ones) are looked up
+ACCOUNT_INDEX = False
+ACCOUNT_INDEX_MAX_AGE = 300   # seconds after which the index is reloaded (e.g. to drop the deleted accounts)
+ACCOUNT_INDEX_CHECK_INTERVAL = 5   # min seconds between the fetches of the new accounts (in between an id above the indexed ones is looked up)
+
+# Compact dtypes for the processed df's (see `apply_compact_schema` on data_processing.py): categoricals for
+# meal/timing (ordered), names and symptoms, the smallest int types for the ids - i.e. less memory in the cache
+COMPACT_SCHEMA = False
+
+# Compute the engineered columns of the eating data on demand (see `LazyEatingData` on data_processing.py):
+# only the columns which the units in the layout need (UNIT_COLUMNS on units.py), all of them in the DEBUG mode
+LAZY_COLUMNS = False
+
+# The engine of the processing, the filters and the tables: 'pandas' or 'polars' (requires: pip install polars)
+# the same df's either way, with Polars the long tables are deduplicated, joined and aggregated multi-threaded (see polars_engine.py)
+ENGINE = 'pandas'
+
+# Max number of regex'ed foodstuff names kept in the memory of this process (see `regex_foodstuff_name` on data_processing.py)
+NAME_MEMO_MAX_SIZE = 100_000
+
+# Select the regex'ed foodstuff names stored in the database by foodstuff_names.py (see `fetch_eating_data` on data_access.py)
+# instead of running the regex on the account load (only the names of foodstuffs not yet processed are regex'ed then)
+# (the table must exist and be refreshed regularly: $ python foodstuff_names.py)
+# Note: it doesn't pay off as long as the names are memoized (NAME_MEMO_MAX_SIZE), the regex then runs once per name and process
+# while the stored names are fetched (the join and the bytes) on every load, i.e. the loads are slower (0.8-0.95x, see benchmarks.py)
+STORED_FOODSTUFF_NAMES = False
+
+# Directory for the local snapshots of the accounts' data (None = no snapshots), see data_snapshots.py
+# Only the rows added since the snapshot are fetched from the database (requires: pip install pyarrow)
+SNAPSHOT_DIR = None   # e.g. "snapshots"
+
+# Out-of-core mode for the accounts too large for memory (see data_out_of_core.py, requires: pip install duckdb):
+# a search spills the account's long tables into a local DuckDB file (one per account, streamed in chunks of
+# OUT_OF_CORE_CHUNKSIZE rows), the units query it and receive only the small aggregated results they plot
+OUT_OF_CORE_DIR = None              # e.g. "out_of_core" (None = the df's in memory and in the browser session)
+OUT_OF_CORE_CHUNKSIZE = 50_000
+OUT_OF_CORE_MEMORY_LIMIT = '512MB'  # DuckDB's memory per process (larger intermediate results are spilled to disk)
+OUT_OF_CORE_MAX_AGE = 24 * 3600    # seconds after which an unused file is removed (by the next search, None = never)
+
+# Load only the most recent weeks of an account first (the longest preset of the unit_1 dropdown)
+# the older history is loaded when the user widens the date picker range (or selects "Gesamter Zeitraum")
+LAZY_HISTORY = False
+RECENT_WINDOW_DAYS = 7*4*3
+
+# Compute the statistics table of unit_2 in the database (GROUP BY queries, see `fetch_statistics` on data_access.py)
+# instead of from the df's in the user's browser session
+STATISTICS_IN_SQL = False
+
+# Read the per-day facts from the daily_summary table (see daily_summary.py) instead of aggregating the raw tables
+# for the statistics of unit_2 (with STATISTICS_IN_SQL) and the timeline of unit_3 (the foodstuff ids per meal of each day)
+# (the table must exist and be refreshed regularly: $ python daily_summary.py)
+DAILY_SUMMARY = False
+
+# With DEBUG the plans (EXPLAIN ANALYZE) of the queries slower than QUERY_PLAN_THRESHOLD seconds are written 
+# into QUERY_PLAN_DIR, see `run_query` on data_access.py (the metrics of all queries: `get_query_metrics`)
+QUERY_PLAN_DIR = None           # e.g. "query_plans"
+QUERY_PLAN_THRESHOLD = 1.0
+
 # Table names
 TABLE_ACCOUNT = 'account'
 TABLE_MEAL = 'meal'
 TABLE_MEAL_FOODSTUFF = 'meal_foodstuff'
 TABLE_FOODSTUFF = 'foodstuff'
 TABLE_REPORT = 'report'
+TABLE_DAILY_SUMMARY = 'daily_summary'               # see daily_summary.py
+TABLE_DAILY_SUMMARY_STATE = 'daily_summary_state'   # the change token of each account at its last refresh
+TABLE_FOODSTUFF_NAME = 'foodstuff_name'             # the regex'ed foodstuff names, see foodstuff_names.py
 
 # Column names
 COLUMN_ACCOUNT_ID = 'account_id'
@@ -41,6 +138,12 @@ COLUMN_GRADE = 'grade'
 COLUMN_TIMING = 'timing'
 COLUMN_NAME = 'name'
 
+# Column names of the daily_summary table (besides account_id, date), see daily_summary.py
+# plus one flag column per meal: breakfast, lunch, dinner (the keys of MEALS_MAPPING in lower case) and COLUMN_AVG_GRADE
+COLUMN_N_MEALS = 'n_meals'
+COLUMN_SYMPTOM_COUNT = 'symptom_count'
+COLUMN_FOODSTUFF_IDS = 'foodstuff_ids'
+
 # Names of the added columns
 COLUMN_WEEKDAY = 'weekday'   # a new (engineered) column
 COLUMN_SYMPTOMS = 'symptoms' # concatenated strings (after grouping) 
@@ -0,0 +1,227 @@
+"""
+The daily_summary table: the per-day facts of each account materialized in the database
+(meal flags, number of meals, symptom count, average grade, foodstuff ids of the day and of each meal),
+so that the queries which only need days don't scan the raw meal/meal_foodstuff/foodstuff join
+(the statistics of unit_2, see `fetch_statistics`, and the timeline of unit_3, see `fetch_daily_summary` on data_access.py
+and `get_timeline_data` on data_processing.py).
+
+The refresh is incremental: the change token of every account (counts and max ids, as in `fetch_change_token`)
+is compared with the token stored at the last refresh, only the changed accounts are recomputed.
+Note: edits of an existing row which keep its id are not detected (run a full refresh now and then).
+
+$ python daily_summary.py --create     # create the tables (once)
+$ python daily_summary.py              # refresh the changed accounts (e.g. every few minutes from cron)
+$ python daily_summary.py --full       # recompute all accounts
+
+Note: after a change of the columns drop both tables, then --create and --full.
+"""
+
+from time import perf_counter
+from argparse import ArgumentParser
+from sqlalchemy import text, bindparam
+from data_access import get_sqlalchemy_engine, pooled_connection
+from constants import DEBUG, SCHEMA, MEALS_MAPPING
+from constants import TABLE_ACCOUNT, TABLE_MEAL, TABLE_MEAL_FOODSTUFF, TABLE_FOODSTUFF, TABLE_REPORT
+from constants import TABLE_DAILY_SUMMARY, TABLE_DAILY_SUMMARY_STATE
+from constants import (COLUMN_ACCOUNT_ID, COLUMN_DATE, COLUMN_MEAL_ID, COLUMN_MEAL, COLUMN_FOODSTUFF_ID,
+                       COLUMN_NAME, COLUMN_REPORT_ID, COLUMN_GRADE)
+from constants import COLUMN_N_MEALS, COLUMN_SYMPTOM_COUNT, COLUMN_AVG_GRADE, COLUMN_FOODSTUFF_IDS
+
+
+# One flag column per meal (1 if the meal was logged on the day)
+MEAL_FLAGS = {meal: meal.lower() for meal in MEALS_MAPPING}   # {'BREAKFAST': 'breakfast', ...}
+
+# One column per meal with the foodstuff ids of the meals of this kind on the day (a name once per meal as in
+# the cleaning of the eating data, a foodstuff eaten at two lunches twice), i.e. the timeline of unit_3
+MEAL_FOODSTUFF_IDS = {meal: f"{flag}_{COLUMN_FOODSTUFF_IDS}" for meal, flag in MEAL_FLAGS.items()}   # {'BREAKFAST': 'breakfast_foodstuff_ids', ...}
+
+# Accounts refreshed per transaction
+REFRESH_BATCH_SIZE = 500
+
+# The parts which differ between the dialects (sqlite: the stand-in database on benchmarks.py)
+# the foodstuff ids of a day: an array on postgres, a comma separated string on sqlite
+# (of a meal: in the order of the meals, NULL's skipped)
+SQL_FOODSTUFF_IDS = {'postgresql': {'type': "INTEGER[]",
+                                    'aggregate': "ARRAY_REMOVE(ARRAY_AGG(DISTINCT {column} ORDER BY {column}), NULL)",
+                                    'aggregate_meal': "ARRAY_REMOVE(ARRAY_AGG({column} ORDER BY {order}), NULL)"},
+                     'sqlite': {'type': "TEXT",
+                                'aggregate': "GROUP_CONCAT(DISTINCT {column})",
+                                'aggregate_meal': "GROUP_CONCAT({column})"}}
+
+
+
+def _get_dialect(connection):
+    return SQL_FOODSTUFF_IDS.get(connection.dialect.name, SQL_FOODSTUFF_IDS['postgresql'])
+
+
+
+def create_tables(engine=None):
+    """Creates the daily_summary table and the table with the change tokens (if they don't exist)"""
+    with pooled_connection(engine) as connection:
+        flags = "".join(f"\t{flag} SMALLINT NOT NULL,\n" for flag in MEAL_FLAGS.values())
+        meal_foodstuff_ids = "".join(f"\t{column} {_get_dialect(connection)['type']},\n" for column in MEAL_FOODSTUFF_IDS.values())
+
+        connection.execute(text(f"""
+CREATE TABLE IF NOT EXISTS {SCHEMA}.{TABLE_DAILY_SUMMARY} (
+	{COLUMN_ACCOUNT_ID} INTEGER NOT NULL,
+	{COLUMN_DATE} DATE NOT NULL,
+{flags}	{COLUMN_N_MEALS} INTEGER NOT NULL,
+	{COLUMN_SYMPTOM_COUNT} INTEGER NOT NULL,
+	{COLUMN_AVG_GRADE} REAL,
+	{COLUMN_FOODSTUFF_IDS} {_get_dialect(connection)['type']},
+{meal_foodstuff_ids}	PRIMARY KEY ({COLUMN_ACCOUNT_ID}, {COLUMN_DATE})
+)"""))
+        connection.execute(text(f"""
+CREATE TABLE IF NOT EXISTS {SCHEMA}.{TABLE_DAILY_SUMMARY_STATE} (
+	{COLUMN_ACCOUNT_ID} INTEGER PRIMARY KEY,
+	token TEXT NOT NULL,
+	refreshed_at TIMESTAMP NOT NULL
+)"""))
+        connection.commit()
+
+
+
+def fetch_changed_accounts(connection, full=False):
+    """
+    The accounts whose change token differs from the token stored at their last refresh
+    (or which have never been refreshed). All accounts if full is True.
+
+    Returns:
+        list of (account_id, token) tuples, the token as a string
+    """
+    token = " || ',' || ".join(f"COALESCE(CAST({column} AS TEXT), '')" for column in
+                               ["m.n_meals", "m.max_meal_id", "f.n_meal_foodstuffs", "r.n_reports", "r.max_report_id"])
+    # All accounts or only the changed ones
+    where = "" if full else "WHERE s.token IS NULL OR s.token <> t.token"
+    query = f"""
+WITH
+meals AS (
+	SELECT {COLUMN_ACCOUNT_ID}, COUNT({COLUMN_MEAL_ID}) AS n_meals, MAX({COLUMN_MEAL_ID}) AS max_meal_id
+	FROM {SCHEMA}.{TABLE_MEAL} GROUP BY {COLUMN_ACCOUNT_ID}
+),
+meal_foodstuffs AS (
+	SELECT l.{COLUMN_ACCOUNT_ID}, COUNT(r.{COLUMN_MEAL_ID}) AS n_meal_foodstuffs
+	FROM {SCHEMA}.{TABLE_MEAL_FOODSTUFF} r JOIN {SCHEMA}.{TABLE_MEAL} l ON l.{COLUMN_MEAL_ID} = r.{COLUMN_MEAL_ID}
+	GROUP BY l.{COLUMN_ACCOUNT_ID}
+),
+reports AS (
+	SELECT {COLUMN_ACCOUNT_ID}, COUNT({COLUMN_REPORT_ID}) AS n_reports, MAX({COLUMN_REPORT_ID}) AS max_report_id
+	FROM {SCHEMA}.{TABLE_REPORT} GROUP BY {COLUMN_ACCOUNT_ID}
+),
+tokens AS (
+	SELECT a.{COLUMN_ACCOUNT_ID}, {token} AS token
+	FROM {SCHEMA}.{TABLE_ACCOUNT} a
+	LEFT JOIN meals m ON m.{COLUMN_ACCOUNT_ID} = a.{COLUMN_ACCOUNT_ID}
+	LEFT JOIN meal_foodstuffs f ON f.{COLUMN_ACCOUNT_ID} = a.{COLUMN_ACCOUNT_ID}
+	LEFT JOIN reports r ON r.{COLUMN_ACCOUNT_ID} = a.{COLUMN_ACCOUNT_ID}
+)
+SELECT t.{COLUMN_ACCOUNT_ID}, t.token
+FROM tokens t LEFT JOIN {SCHEMA}.{TABLE_DAILY_SUMMARY_STATE} s ON s.{COLUMN_ACCOUNT_ID} = t.{COLUMN_ACCOUNT_ID}
+{where}
+ORDER BY t.{COLUMN_ACCOUNT_ID}
+;"""
+    return [tuple(row) for row in connection.execute(text(query))]
+
+
+
+def refresh_accounts(connection, tokens):
+    """
+    Recomputes the rows of the accounts in the daily_summary table and stores their tokens (one transaction).
+    A row is added between fetching the token and recomputing -> the stored token is older than the rows,
+    i.e. the account is (unnecessarily) recomputed on the next refresh, never skipped.
+
+    Args:
+        tokens: list of (account_id, token) tuples (see `fetch_changed_accounts`)
+    """
+    # Bound parameters (expanding: account_id IN (...))
+    user_input = {'account_ids': [account_id for account_id, _ in tokens]}
+    account_ids = bindparam('account_ids', expanding=True)
+
+    flags = ", ".join(f"MAX({flag})" for flag in MEAL_FLAGS.values())
+    flags_meal = ", ".join(f"CASE WHEN l.{COLUMN_MEAL} = '{meal}' THEN 1 ELSE 0 END AS {flag}" for meal, flag in MEAL_FLAGS.items())
+    flags_report = ", ".join("0" for _ in MEAL_FLAGS)
+    foodstuff_ids = _get_dialect(connection)['aggregate'].format(column=COLUMN_FOODSTUFF_ID)
+    meal_foodstuff_ids = ", ".join(_get_dialect(connection)['aggregate_meal'].format(
+        column=f"CASE WHEN {COLUMN_MEAL} = '{meal}' AND name_no = 1 THEN {COLUMN_FOODSTUFF_ID} END",
+        order=f"{COLUMN_MEAL_ID}, {COLUMN_FOODSTUFF_ID}") for meal in MEAL_FOODSTUFF_IDS)
+
+    # The meals (with their foodstuffs) and the reports are stacked and aggregated per account and day
+    query = f"""
+INSERT INTO {SCHEMA}.{TABLE_DAILY_SUMMARY}
+	({COLUMN_ACCOUNT_ID}, {COLUMN_DATE}, {", ".join(MEAL_FLAGS.values())},
+	 {COLUMN_N_MEALS}, {COLUMN_SYMPTOM_COUNT}, {COLUMN_AVG_GRADE}, {COLUMN_FOODSTUFF_IDS}, {", ".join(MEAL_FOODSTUFF_IDS.values())})
+SELECT
+	{COLUMN_ACCOUNT_ID}, {COLUMN_DATE}, {flags},
+	COUNT(DISTINCT {COLUMN_MEAL_ID}), COUNT({COLUMN_REPORT_ID}), AVG({COLUMN_GRADE}), {foodstuff_ids}, {meal_foodstuff_ids}
+FROM (
+	SELECT
+		l.{COLUMN_ACCOUNT_ID} AS {COLUMN_ACCOUNT_ID}, l.{COLUMN_DATE} AS {COLUMN_DATE}, {flags_meal},
+		l.{COLUMN_MEAL} AS {COLUMN_MEAL}, l.{COLUMN_MEAL_ID} AS {COLUMN_MEAL_ID}, r.{COLUMN_FOODSTUFF_ID} AS {COLUMN_FOODSTUFF_ID},
+		ROW_NUMBER() OVER (PARTITION BY l.{COLUMN_MEAL_ID}, rr.{COLUMN_NAME} ORDER BY r.{COLUMN_FOODSTUFF_ID}) AS name_no,
+		NULL AS {COLUMN_REPORT_ID}, NULL AS {COLUMN_GRADE}
+	FROM {SCHEMA}.{TABLE_MEAL} l LEFT JOIN {SCHEMA}.{TABLE_MEAL_FOODSTUFF} r ON l.{COLUMN_MEAL_ID} = r.{COLUMN_MEAL_ID}
+	LEFT JOIN {SCHEMA}.{TABLE_FOODSTUFF} rr ON r.{COLUMN_FOODSTUFF_ID} = rr.{COLUMN_FOODSTUFF_ID}
+	WHERE l.{COLUMN_ACCOUNT_ID} IN :account_ids AND l.{COLUMN_DATE} IS NOT NULL
+	UNION ALL
+	SELECT {COLUMN_ACCOUNT_ID}, {COLUMN_DATE}, {flags_report}, NULL, NULL, NULL, NULL, {COLUMN_REPORT_ID}, {COLUMN_GRADE}
+	FROM {SCHEMA}.{TABLE_REPORT}
+	WHERE {COLUMN_ACCOUNT_ID} IN :account_ids AND {COLUMN_DATE} IS NOT NULL
+) days
+GROUP BY {COLUMN_ACCOUNT_ID}, {COLUMN_DATE}
+;"""
+
+    for table in (TABLE_DAILY_SUMMARY, TABLE_DAILY_SUMMARY_STATE):
+        connection.execute(text(f"DELETE FROM {SCHEMA}.{table} WHERE {COLUMN_ACCOUNT_ID} IN :account_ids")
+                           .bindparams(account_ids), user_input)
+    connection.execute(text(query).bindparams(account_ids), user_input)
+    connection.execute(text(f"""INSERT INTO {SCHEMA}.{TABLE_DAILY_SUMMARY_STATE} ({COLUMN_ACCOUNT_ID}, token, refreshed_at)
+                               VALUES (:account_id, :token, CURRENT_TIMESTAMP)"""),
+                       [{'account_id': account_id, 'token': token} for account_id, token in tokens])  # executemany
+
+
+
+def refresh_daily_summary(engine=None, full=False, batch_size=REFRESH_BATCH_SIZE):
+    """
+    Refreshes the daily_summary table for the accounts which have changed since the last refresh
+    (all accounts if full is True), batch_size accounts per transaction.
+    The rows of deleted accounts are deleted.
+
+    Returns:
+        the number of refreshed accounts
+    """
+    engine = engine or get_sqlalchemy_engine()
+
+    with pooled_connection(engine) as connection:
+        tokens = fetch_changed_accounts(connection, full)
+
+        for table in (TABLE_DAILY_SUMMARY, TABLE_DAILY_SUMMARY_STATE):
+            connection.execute(text(f"""DELETE FROM {SCHEMA}.{table} WHERE {COLUMN_ACCOUNT_ID} NOT IN
+                                        (SELECT {COLUMN_ACCOUNT_ID} FROM {SCHEMA}.{TABLE_ACCOUNT})"""))
+        connection.commit()
+
+    for i in range(0, len(tokens), batch_size):
+        with pooled_connection(engine) as connection:
+            refresh_accounts(connection, tokens[i:i+batch_size])
+            connection.commit()
+
+        if DEBUG:
+            print(f"daily_summary: {min(i + batch_size, len(tokens))}/{len(tokens)} accounts refreshed")
+
+    return len(tokens)
+
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description="creates/refreshes the daily_summary table")
+    parser.add_argument('--create', action='store_true', help="create the tables (if they don't exist)")
+    parser.add_argument('--full', action='store_true', help="recompute all accounts")
+    parser.add_argument('--batch-size', type=int, default=REFRESH_BATCH_SIZE, help="accounts per transaction")
+    args = parser.parse_args()
+
+    if args.create:
+        create_tables()
+
+    time_start = perf_counter()
+    n = refresh_daily_summary(full=args.full, batch_size=args.batch_size)
+    print(f"daily_summary: {n} accounts refreshed in {perf_counter() - time_start:.1f} s")
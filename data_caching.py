@@ -0,0 +1,389 @@
+"""
+Cache for the processed df's of the accounts
+(to avoid fetching, cleaning and processing the data again when an account is searched for again)
+and the dictionary of the foodstuffs (the names of the foodstuff ids of the meals, see `FoodstuffDictionary`)
+and the index of the account ids (see `AccountIndex`)
+"""
+
+import os
+import pickle
+from time import perf_counter
+from threading import Lock, get_ident
+from collections import OrderedDict
+import numpy as np
+import pandas
+from pandas import Series, factorize, concat
+from data_access import fetch_foodstuffs, fetch_account_ids
+from constants import CACHE_MAX_BYTES, CACHE_DIR, CACHE_DIR_MAX_BYTES, ACCOUNT_INDEX, ACCOUNT_INDEX_MAX_AGE, \
+    ACCOUNT_INDEX_CHECK_INTERVAL, COLUMN_FOODSTUFF_ID, COLUMN_NAME
+
+
+# Copy-on-Write (always on as of pandas 3.0): the data of a shallow copy is copied only when one of the df's is changed
+if int(pandas.__version__.split('.')[0]) < 3:
+    pandas.set_option('mode.copy_on_write', True)
+
+
+
+class DataFrameCache():
+    """
+    LRU cache (least recently used entries are evicted first) bound by the memory of the cached df's.
+
+    An entry is stored together with a change token (see `fetch_change_token` on data_access.py),
+    it is only returned if the token passed in to `get` is the same,
+    i.e. if the data in the database hasn't changed in the meantime.
+    Shallow copies of the df's are stored and returned: with Copy-on-Write the callers cannot change the cached df's,
+    and the data isn't copied (the functions of the pipeline don't change the df's passed in either).
+
+    With a directory the entries are also written to disk (one pickle file per entry),
+    i.e. they are shared by all processes (e.g. the workers of the app and warm_up.py).
+    An entry missing in memory is then looked up on disk (and kept in memory from then on).
+    The files are bound by max_dir_bytes (the least recently used, by modification time, are removed first),
+    the file of a stale entry is removed as soon as it is found.
+    Only use a directory which no one else can write to (pickle files can execute code when read).
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, directory=None, max_dir_bytes=CACHE_DIR_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_dir_bytes = max_dir_bytes
+        self._entries = OrderedDict()   # key: (token, df's, n_bytes)
+        self._lock = Lock()             # the callbacks can run in threads
+        self.n_bytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = self.disk_hits = 0
+
+    def get(self, key, token):
+        """Returns (shallow) copies of the cached df's (tuple) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            # The data has changed -> the entry is stale
+            if entry is not None and entry[0] != token:
+                self._remove(key)
+                self.invalidations += 1
+                entry = None
+
+            if entry is not None:
+                self._entries.move_to_end(key)  # most recently used
+                self.hits += 1
+                return tuple(df.copy(deep=False) for df in entry[1])
+
+        # Written by another process?
+        entry = self._read(key) if self.directory else None
+
+        if entry is not None and entry[0] != token:
+            self._delete(key)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+
+        self._put_in_memory(key, token, entry[1])
+        return tuple(df.copy(deep=False) for df in entry[1])
+
+    def put(self, key, token, dataframes):
+        """Caches (shallow) copies of the df's (tuple) and evicts the least recently used entries if necessary"""
+        dataframes = tuple(df.copy(deep=False) for df in dataframes)
+        if self.directory:
+            self._write(key, token, dataframes)
+        self._put_in_memory(key, token, dataframes)
+
+    def _put_in_memory(self, key, token, dataframes):
+        n_bytes = sum(int(df.memory_usage(deep=True).sum()) for df in dataframes)
+
+        # Too big to be cached at all
+        if n_bytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            
+            while self._entries and self.n_bytes + n_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))  # the least recently used
+                self.evictions += 1
+            
+            self._entries[key] = (token, dataframes, n_bytes)
+            self.n_bytes += n_bytes
+
+    def resize(self, key):
+        """
+        Counts the bytes of the entry again (if it is in memory) and evicts the least recently used entries if necessary,
+        for df's which have grown since they were put (e.g. the columns computed on demand of a `LazyEatingData`)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        n_bytes = sum(int(df.memory_usage(deep=True).sum()) for df in entry[1])
+
+        with self._lock:
+            if self._entries.get(key) is not entry:  # removed or replaced in the meantime
+                return
+            self._entries[key] = (*entry[:2], n_bytes)
+            self.n_bytes += n_bytes - entry[2]
+
+            while self._entries and self.n_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))  # the least recently used (the entry itself if too big)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, n_bytes = self._entries.pop(key)
+        self.n_bytes -= n_bytes
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, "_".join(str(part) for part in key) + ".pkl")
+
+    def _read(self, key):
+        """Returns (token, df's) from the file of the entry or None"""
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(path)  # most recently used
+        except FileNotFoundError:
+            pass
+        return entry
+
+    def _write(self, key, token, dataframes):
+        """Writes the entry into a temporary file first, then renames it (atomic, as in data_snapshots.py)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._get_path(key)
+        path_temp = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+        with open(path_temp, 'wb') as f:
+            pickle.dump((token, dataframes), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path_temp, path)
+        self._trim_directory()
+
+    def _delete(self, key):
+        """Removes the file of the entry (stale)"""
+        try:
+            os.remove(self._get_path(key))
+        except FileNotFoundError:  # removed by another process
+            pass
+
+    def _trim_directory(self):
+        """Removes the least recently used files (by modification time) while the files are larger than max_dir_bytes"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        n_bytes = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if n_bytes <= self.max_dir_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            n_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        """Returns a dict with the counters (hits, misses, evictions, invalidations) and the size of the cache"""
+        with self._lock:
+            return {'hits': self.hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'entries': len(self._entries),
+                    'bytes': self.n_bytes,
+                    'max_bytes': self.max_bytes}
+
+    def __len__(self):
+        return len(self._entries)
+    
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.stats()})"
+
+
+
+class FoodstuffDictionary():
+    """
+    The foodstuffs (id -> name and regex'ed name) in the memory of this process,
+    for the meals fetched as ids only (see FOODSTUFF_DICTIONARY on constants.py and `clean_eating_ids` on data_processing.py).
+
+    Each distinct name is kept once and has a code (the same name -> the same code, no name -> -1),
+    the ids of a df are resolved with numpy (a binary search in the sorted ids), i.e. without any string comparisons.
+    The regex'ed names are computed once per distinct name (with `normalize`).
+    The dictionary is reloaded when it is older than max_age seconds,
+    the foodstuffs added since the last load are fetched as soon as one of their ids shows up
+    (an id which isn't in the foodstuff table even then, e.g. a deleted foodstuff, is not looked up again until the reload).
+    """
+
+    def __init__(self, max_age, normalize):
+        self.max_age = max_age
+        self.normalize = normalize   # function: pandas.Series of names -> pandas.Series of regex'ed names
+        self._state = None           # see `_build`, replaced as a whole (the readers don't need the lock)
+        self._lock = Lock()          # only one thread fetches the foodstuffs
+        self.loads = self.extensions = 0
+
+    def resolve(self, foodstuff_ids, engine=None):
+        """
+        Returns (codes, names, names_regex) - numpy arrays aligned with foodstuff_ids (pandas.Series),
+        codes: int (-1: no foodstuff i.e. NaN, an unknown id or no name), names: object (NaN for -1)
+        """
+        ids = foodstuff_ids.to_numpy(dtype='float64', na_value=np.nan)
+        mask = ~np.isnan(ids)
+        ids = ids[mask].astype('int64')
+
+        state = self._get_state(engine)
+        if len(ids) and ids.max() > state['max_checked_id']:  # foodstuffs added since the last load
+            state = self._get_state(engine, min_id=state['max_id'], max_id=int(ids.max()))
+
+        codes = np.full(len(mask), -1, dtype='int32')
+        if len(state['ids']):
+            i = np.minimum(np.searchsorted(state['ids'], ids), len(state['ids']) - 1)
+            codes[mask] = np.where(state['ids'][i] == ids, state['codes'][i], -1)
+        return (codes, state['names'][codes], state['names_regex'][codes])  # -1 -> the last item (NaN)
+
+    def _get_state(self, engine, min_id=None, max_id=None):
+        """Returns the state, (re)loads it if it is too old (or extends it with the ids above min_id, up to max_id at least)"""
+        state = self._state
+        if state is not None and min_id is None and perf_counter() - state['time_loaded'] < self.max_age:
+            return state
+
+        with self._lock:
+            state = self._state   # another thread might have loaded it in the meantime
+            if state is None or perf_counter() - state['time_loaded'] >= self.max_age:
+                self._state = self._build(fetch_foodstuffs(engine), perf_counter())
+                self.loads += 1
+            elif min_id is not None and min_id == state['max_id'] and max_id > state['max_checked_id']:
+                df_new = fetch_foodstuffs(engine, min_id)
+                if len(df_new):
+                    state = self._build(concat([state['df'], df_new], ignore_index=True), state['time_loaded'])
+                self._state = {**state, 'max_checked_id': max(max_id, state['max_id'])}  # the ids up to max_id are known now
+                self.extensions += 1
+            return self._state
+
+    def _build(self, df, time_loaded):
+        """The arrays for `resolve` from the df of the foodstuffs (sorted by id)"""
+        codes, names = factorize(df[COLUMN_NAME])   # NaN -> -1
+        names = Series(np.asarray(names, dtype=object))
+        ids = df[COLUMN_FOODSTUFF_ID].to_numpy(dtype='int64')
+        return {'df': df,
+                'time_loaded': time_loaded,
+                'ids': ids,
+                'max_id': int(ids.max()) if len(ids) else 0,
+                'max_checked_id': int(ids.max()) if len(ids) else 0,   # the ids up to this one were looked up
+                'codes': codes.astype('int32'),
+                'names': np.append(names.to_numpy(dtype=object), np.nan),
+                'names_regex': np.append(self.normalize(names).to_numpy(dtype=object, na_value=np.nan), np.nan)}
+
+    def stats(self):
+        state = self._state
+        return {'loads': self.loads,
+                'extensions': self.extensions,
+                'foodstuffs': len(state['ids']) if state else 0,
+                'names': len(state['names']) - 1 if state else 0}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.stats()})"
+
+
+
+class AccountIndex():
+    """
+    The ids of all accounts in the memory of this process (a sorted numpy array, 8 bytes per account),
+    so that a search for an unknown account (e.g. a typo) is answered without a round trip to the database.
+
+    Only the negative answer comes from the index: a known account is loaded as usual
+    (the load checks the account and its data anyway, i.e. a deleted account is still "not found").
+    An id above the indexed ones can be a new account: the accounts added since are fetched (a range on the primary key),
+    at most once per check_interval seconds (e.g. repeated searches for a typo above the ids don't refetch the range),
+    in between such an id is looked up in the database (an account created just after the last look-up is found).
+    The index is reloaded when it is older than max_age seconds (to drop the deleted accounts).
+    """
+
+    def __init__(self, max_age=ACCOUNT_INDEX_MAX_AGE, check_interval=ACCOUNT_INDEX_CHECK_INTERVAL):
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self._state = None   # (time loaded, sorted ids, time of the last look-up of new accounts), replaced as a whole
+        self._lock = Lock()  # only one thread fetches the ids
+        self.hits = self.negatives = self.loads = self.extensions = self.lookups = 0
+
+    def exists(self, account_id, engine=None):
+        """
+        Returns False if the account doesn't exist (as of the last load of the index), True otherwise
+        (a bad input returns True as well, it is then dealt with by the load as usual)
+        """
+        try:
+            account_id = int(account_id)
+        except (TypeError, ValueError):
+            return True
+
+        _, ids, time_checked = self._get_state(engine)
+        if (len(ids) == 0 or account_id > ids[-1]) and perf_counter() - time_checked >= self.check_interval:  # a new account?
+            _, ids, _ = self._get_state(engine, min_id=ids[-1] if len(ids) else 0)
+
+        i = np.searchsorted(ids, account_id)
+        found = bool(i < len(ids) and ids[i] == account_id)
+        if not found and i == len(ids):   # above the indexed ids, the accounts added since the last look-up are unknown
+            found = fetch_account_ids(engine, account_id - 1)[:1] == [account_id]
+            self.lookups += 1
+        if found:
+            self.hits += 1
+        else:
+            self.negatives += 1
+        return found
+
+    def _get_state(self, engine, min_id=None):
+        """Returns the state, (re)loads it if it is too old (or extends it with the ids above min_id)"""
+        state = self._state
+        if state is not None and min_id is None and perf_counter() - state[0] < self.max_age:
+            return state
+
+        with self._lock:
+            state = self._state   # another thread might have loaded it in the meantime
+            if state is None or perf_counter() - state[0] >= self.max_age:
+                time_loaded = perf_counter()
+                self._state = (time_loaded, np.array(fetch_account_ids(engine), dtype='int64'), time_loaded)
+                self.loads += 1
+            elif (min_id is not None and min_id == (state[1][-1] if len(state[1]) else 0)
+                  and perf_counter() - state[2] >= self.check_interval):
+                ids_new = np.array(fetch_account_ids(engine, min_id), dtype='int64')
+                self._state = (state[0], np.concatenate([state[1], ids_new]), perf_counter())
+                self.extensions += 1
+            return self._state
+
+    def stats(self):
+        state = self._state
+        return {'hits': self.hits,
+                'negatives': self.negatives,
+                'loads': self.loads,
+                'extensions': self.extensions,
+                'lookups': self.lookups,
+                'accounts': len(state[1]) if state else 0}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.stats()})"
+
+
+
+# The cache of this process (used by `get_dataframes` on data_processing.py)
+dataframes_cache = DataFrameCache(CACHE_MAX_BYTES, CACHE_DIR) if CACHE_MAX_BYTES or CACHE_DIR else None
+
+# The account index of this process (used by `search_account` on app.py)
+account_index = AccountIndex(ACCOUNT_INDEX_MAX_AGE) if ACCOUNT_INDEX else None
+
+
+
+def get_cache_stats():
+    """Returns the counters of the cache of this process (see `DataFrameCache.stats`) or None"""
+    return dataframes_cache.stats() if dataframes_cache is not None else None
@@ -0,0 +1,133 @@
+"""
+Cancellation of superseded account loads and the statement timeout of a load
+
+A search in the app runs as a load of the user's browser session (see `superseding_load` and `update_unit_0` on app.py).
+A newer load of the same session (e.g. a second "Suchen" click or another account typed in) cancels the older one:
+ - its running queries are cancelled on the database (see `pooled_connection` on data_access.py),
+   i.e. the connections go back to the pool straight away
+ - its pandas work stops at the next `check_cancelled()` (see `load_dataframes` on data_processing.py)
+The loads are known within one process only (as the cache and the engine).
+"""
+
+from threading import Lock, Event
+from contextvars import ContextVar
+from contextlib import contextmanager
+from constants import ERR_PREFIX, STATEMENT_TIMEOUT
+
+
+# The load the current thread is working for (copied into the threads of the thread pool on data_processing.py)
+_current_load = ContextVar('current_load', default=None)
+
+# The running load of each session
+_loads = {}          # session id: Load
+_loads_lock = Lock()
+
+
+
+class LoadCancelled(Exception):
+    """The load has been superseded by a newer load of the same session"""
+
+
+
+class Load:
+    """
+    One account load of a session.
+    Knows the DBAPI connections its queries are running on (to cancel them)
+    and the statement timeout of its queries (seconds or None).
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.cancelled = Event()
+        self._connections = set()
+        self._lock = Lock()
+
+
+    def cancel(self):
+        """Cancels the load: the running queries are cancelled, the pandas work stops at the next check"""
+        with self._lock:
+            self.cancelled.set()
+            for dbapi_connection in self._connections:
+                cancel_query(dbapi_connection)
+
+
+    def check(self):
+        """Raises LoadCancelled if the load has been cancelled"""
+        if self.cancelled.is_set():
+            raise LoadCancelled(f"{ERR_PREFIX}the load has been superseded by a newer load")
+
+
+    @contextmanager
+    def running_on(self, dbapi_connection):
+        """
+        Registers the connection while the load's queries run on it.
+        The connection is unregistered before it goes back to the pool (i.e. the query of another load is never cancelled).
+        """
+        with self._lock:
+            self.check()
+            self._connections.add(dbapi_connection)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._connections.discard(dbapi_connection)
+
+
+
+def cancel_query(dbapi_connection):
+    """Cancels the query running on the DBAPI connection (thread-safe): psycopg2 cancel(), sqlite3 interrupt()"""
+    cancel = getattr(dbapi_connection, 'cancel', None) or getattr(dbapi_connection, 'interrupt', None)
+    if cancel is None:
+        return
+    try:
+        cancel()
+    except Exception as e:  # e.g. the connection has been closed in the meantime
+        print(f"{ERR_PREFIX}the query could not be cancelled: {e}")
+
+
+
+@contextmanager
+def superseding_load(session_id, timeout=STATEMENT_TIMEOUT):
+    """
+    Context manager for a load of the session: cancels the load still running for the session (if any)
+    and makes the new load the current one (see `get_current_load`).
+
+    Args:
+        session_id: id of the user's browser session (None = nothing is cancelled, only the timeout applies)
+        timeout: statement timeout in seconds for each query of the load (None = no timeout)
+
+    Yields:
+        Load
+    """
+    load = Load(timeout)
+
+    if session_id is not None:
+        with _loads_lock:
+            previous = _loads.get(session_id)
+            _loads[session_id] = load
+        if previous is not None:
+            previous.cancel()
+
+    token = _current_load.set(load)
+    try:
+        yield load
+    finally:
+        _current_load.reset(token)
+        if session_id is not None:
+            with _loads_lock:
+                if _loads.get(session_id) is load:  # not superseded in the meantime
+                    del _loads[session_id]
+
+
+
+def get_current_load():
+    """Returns the Load the current thread is working for (None outside of `superseding_load`)"""
+    return _current_load.get()
+
+
+
+def check_cancelled():
+    """Raises LoadCancelled if the current load has been superseded (no-op outside of a load)"""
+    load = _current_load.get()
+    if load is not None:
+        load.check()
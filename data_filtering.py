@@ -7,9 +7,10 @@ Filtering / Subsetting functions for pandas dataframes
 """
 
 from numpy import logical_and
-from pandas import Series
-from constants import ERR_PREFIX, MEALS_MAPPING, A, B, C, D
-from constants import COLUMN_MEAL, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY, COLUMN_AVG_GRADE
+from pandas import Series, Timestamp
+import polars_engine
+from constants import ERR_PREFIX, MEALS_MAPPING, ENGINE, A, B, C, D
+from constants import COLUMN_DATE, COLUMN_MEAL, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY, COLUMN_AVG_GRADE
 
 
 
@@ -20,6 +21,8 @@ def subset_data_by_dates(df, start_date, end_date):
     
     # Determine the name of the Date column: Date or Datum?
     COLUMN_DATE = ([col for col in df.columns if col.lower() in ("date", "datum")] + ['date'])[0]
+    if ENGINE == 'polars':
+        return df[polars_engine.mask_dates(df, COLUMN_DATE, start_date, end_date)]
     return df.query(f"'{start_date}' <= {COLUMN_DATE} <= '{end_date}'")
 
 
@@ -39,6 +42,10 @@ def subset_data_by_selector_values(df, meals_selector=None,
     assert symptom_selector in (None,A,B,C,D), f"{ERR_PREFIX}bad symptom_selector: {symptom_selector}"
     assert grade_selector in (None, *range(11)), f"{ERR_PREFIX}bad grade_selector: {grade_selector}"
 
+    # The same mask from one Polars query (see polars_engine.py)
+    if ENGINE == 'polars':
+        return df[polars_engine.mask_selector_values(df, **_get_selected_values(meals_selector, symptom_selector, grade_selector))]
+
     # Make default boolean mask (filled with all True's)
     mask_meals  = Series([True]*len(df), index=df.index)
     mask_symptoms = Series([True]*len(df), index=df.index)
@@ -86,3 +93,59 @@ def subset_data_by_selector_values(df, meals_selector=None,
     # Subset the df_subset with the universal boolean mask
     return df[mask]
 
+
+
+def _get_selected_values(meals_selector=None, symptom_selector=None, grade_selector=None):
+    """
+    The values selected by the selectors as in `subset_data_by_selector_values` (None = no condition),
+    for the masks computed elsewhere (Polars, SQL)
+
+    Returns:
+        dict: meal_values, symptom_values (of the symptom_same_day flag), next_day (the symptom_next_day flag), min_grade
+    """
+    all_values = list(MEALS_MAPPING.keys())
+    return {'meal_values': {A: all_values, B: all_values[0:1], C: all_values[1:2], D: all_values[2:3]}[meals_selector] if meals_selector else None,
+            'symptom_values': {A: [False, True], B: [False], C: [True], D: None}[symptom_selector] if symptom_selector else None,
+            'next_day': symptom_selector == D,
+            'min_grade': grade_selector if type(grade_selector) is int and 1 <= grade_selector <= 10 else None}
+
+
+
+def make_sql_filter(start_date=None, end_date=None, meals_selector=None, symptom_selector=None, grade_selector=None):
+    """
+    `subset_data_by_dates` and `subset_data_by_selector_values` as the condition of a WHERE clause
+    on the eating data with the engineered columns (the dates only: on the symptoms too), see data_out_of_core.py.
+    The values are bound parameters ($name as in DuckDB), None = no condition.
+
+    Returns:
+        (condition, params): str and dict
+    """
+    assert meals_selector in (None, A,B,C,D), f"{ERR_PREFIX}bad meals_selector: {meals_selector}"
+    assert symptom_selector in (None,A,B,C,D), f"{ERR_PREFIX}bad symptom_selector: {symptom_selector}"
+    assert grade_selector in (None, *range(11)), f"{ERR_PREFIX}bad grade_selector: {grade_selector}"
+
+    values = _get_selected_values(meals_selector, symptom_selector, grade_selector)
+    conditions, params = ["TRUE"], {}
+
+    # the dates (inclusive) as the pandas query compares them: the str's as timestamps
+    if start_date:
+        conditions.append(f"{COLUMN_DATE} >= $start_date")
+        params['start_date'] = Timestamp(str(start_date)).to_pydatetime()
+    if end_date:
+        conditions.append(f"{COLUMN_DATE} <= $end_date")
+        params['end_date'] = Timestamp(str(end_date)).to_pydatetime()
+
+    # the selectors (a NULL doesn't match, as NaN in the pandas masks)
+    if values['meal_values'] is not None:
+        conditions.append(f"list_contains($meal_values, {COLUMN_MEAL})")
+        params['meal_values'] = values['meal_values']
+    if values['next_day']:
+        conditions.append(f"{COLUMN_SYMPTOM_NEXT_DAY}")
+    elif values['symptom_values'] is not None:
+        conditions.append(f"list_contains($symptom_values, {COLUMN_SYMPTOM_SAME_DAY})")
+        params['symptom_values'] = values['symptom_values']
+    if values['min_grade'] is not None:
+        conditions.append(f"{COLUMN_AVG_GRADE} >= $min_grade")
+        params['min_grade'] = values['min_grade']
+
+    return (" AND ".join(conditions), params)
@@ -0,0 +1,493 @@
+"""
+Out-of-core mode for the accounts whose history doesn't fit into memory (or into the browser session)
+
+A search spills the long tables of the account into a local DuckDB file (one file per account):
+the eating data is streamed from the database in chunks, each chunk is cleaned and appended,
+the deduplication and the engineered columns (weekday, symptom flags, symptoms, avg_grade) are then computed by DuckDB.
+The units query the file (the filters of data_filtering.py as a WHERE clause, see `make_sql_filter`)
+and receive only the small aggregated results which they plot, i.e. no long table is ever held in memory
+(DuckDB spills the larger intermediate results to disk, see OUT_OF_CORE_MEMORY_LIMIT on constants.py).
+The file is reused as long as the data of the account doesn't change (the change token, see `fetch_change_token`).
+The files not used for OUT_OF_CORE_MAX_AGE seconds are removed by the next spill (see `remove_old_files`).
+
+requires: pip install duckdb
+"""
+
+import os
+import json
+from time import time
+from threading import get_ident
+from collections import Counter
+from numpy import nan
+from pandas import to_numeric
+from data_access import fetch_change_token, fetch_eating_data, fetch_symptoms_data
+from data_processing import clean_eating_data, clean_symptoms_data, regex_foodstuff_name, MEAL_OF_TIMING
+from data_filtering import make_sql_filter
+from data_cancellation import check_cancelled
+from table_toolkit import MAPPING
+from constants import ERR_PREFIX, OUT_OF_CORE_DIR, OUT_OF_CORE_CHUNKSIZE, OUT_OF_CORE_MEMORY_LIMIT, OUT_OF_CORE_MAX_AGE
+from constants import (COLUMN_ACCOUNT_ID, COLUMN_DATE, COLUMN_MEAL_ID, COLUMN_MEAL, COLUMN_NAME, COLUMN_FOODSTUFF_ID,
+                       COLUMN_TIMING, COLUMN_SYMPTOM, COLUMN_GRADE, COLUMN_WEEKDAY, COLUMN_NAME_REGEX,
+                       COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY, COLUMN_SYMPTOMS, COLUMN_AVG_GRADE)
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+# The tables of an account's file (and their columns as they are spilled)
+EATING = 'eating'
+SYMPTOMS = 'symptoms'
+TOKEN = 'token'
+COLUMN_ROW_NO = 'row_no'           # the order of the rows as fetched (the order of the df's in memory)
+COLUMN_DIARY_MEAL = 'diary_meal'   # the meal of the diary table the symptoms belong to (see MAPPING on table_toolkit.py)
+
+EATING_RAW_SCHEMA = {COLUMN_ACCOUNT_ID: 'BIGINT', COLUMN_DATE: 'TIMESTAMP', COLUMN_MEAL_ID: 'BIGINT', COLUMN_MEAL: 'VARCHAR',
+                     COLUMN_NAME: 'VARCHAR', COLUMN_FOODSTUFF_ID: 'BIGINT', COLUMN_NAME_REGEX: 'VARCHAR', COLUMN_ROW_NO: 'BIGINT'}
+SYMPTOMS_SCHEMA = {COLUMN_ACCOUNT_ID: 'BIGINT', COLUMN_DATE: 'TIMESTAMP', COLUMN_TIMING: 'VARCHAR', COLUMN_SYMPTOM: 'VARCHAR',
+                   COLUMN_GRADE: 'DOUBLE', COLUMN_MEAL: 'VARCHAR', COLUMN_DIARY_MEAL: 'VARCHAR', COLUMN_ROW_NO: 'BIGINT'}
+
+
+
+def _get_path(account_id, directory):
+    return os.path.join(directory, f"{int(account_id)}.duckdb")
+
+
+
+def _connect(path, read_only=True):
+    """A DuckDB connection to the file, with the memory limit of the mode"""
+    if duckdb is None:
+        raise ImportError(f"{ERR_PREFIX}the out-of-core mode (OUT_OF_CORE_DIR) requires duckdb: pip install duckdb")
+    config = {'memory_limit': OUT_OF_CORE_MEMORY_LIMIT,
+              'temp_directory': os.path.join(os.path.dirname(path) or '.', '.tmp')}   # the spilled intermediate results
+    return duckdb.connect(path, read_only=read_only, config=config)
+
+
+
+def _query(account_id, sql, params=None, directory=OUT_OF_CORE_DIR):
+    """Runs the query on the file of the account (read-only), returns pandas.DataFrame"""
+    path = _get_path(account_id, directory)
+    if not os.path.exists(path):   # e.g. removed by `remove_old_files` while a session still shows the account
+        _restore_file(account_id, directory)
+    with _connect(path) as connection:
+        df = connection.execute(sql, params or {}).df()
+    _touch(path)
+    # a column of NULL's only comes as object (None's), NaN's as in the columns of the df's
+    return df.assign(**{column: df[column].fillna(nan) for column in df.columns
+                        if df[column].dtype == object and df[column].isna().all()})
+
+
+
+def spill_account(account_id, engine=None, directory=OUT_OF_CORE_DIR, chunksize=OUT_OF_CORE_CHUNKSIZE,
+                  max_age=OUT_OF_CORE_MAX_AGE):
+    """
+    Writes the data of the account into its DuckDB file (unless the file is up to date),
+    the eating data is fetched and cleaned chunk by chunk (i.e. the peak memory is bound by the chunk size).
+    The file is written into a temporary file first and then renamed (atomic),
+    so that the units (other threads or processes) never read a half-written file.
+
+    The files of the other accounts which haven't been used for max_age seconds are removed afterwards.
+
+    Returns:
+        status: as returned by `fetch_change_token` on data_access.py (ValueError, None, False or True)
+    """
+    # Has the data of the account changed?
+    status, token = fetch_change_token(account_id, engine)  # in data_access.py
+    if status is not True:
+        return status
+
+    account_id = int(account_id)
+    path = _get_path(account_id, directory)
+    if read_token(account_id, directory) == list(token):   # (touches the file)
+        remove_old_files(directory, max_age)
+        return True
+
+    def spill(connection):
+        _spill_eating_data(connection, account_id, engine, chunksize)
+        _spill_symptoms_data(connection, account_id, engine)
+        _add_engineered_columns(connection)
+        connection.execute(f"INSERT INTO {TOKEN} VALUES ($token)", {'token': json.dumps(list(token))})
+
+    _write_file(path, spill)
+    remove_old_files(directory, max_age)
+    return True
+
+
+
+def _write_file(path, spill):
+    """
+    Creates the tables in a temporary file, fills them with spill (function: connection -> None),
+    then renames the file (atomic)
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    path_temp = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+    try:
+        with _connect(path_temp, read_only=False) as connection:
+            _create_tables(connection)
+            spill(connection)
+            connection.execute("CHECKPOINT")
+        os.replace(path_temp, path)
+    finally:
+        for path_left in (path_temp, f"{path_temp}.wal"):   # e.g. cancelled by a newer search
+            if os.path.exists(path_left):
+                os.remove(path_left)
+
+
+
+def _restore_file(account_id, directory=OUT_OF_CORE_DIR):
+    """
+    Writes the missing file of an account shown by a session again (see `spill_account`),
+    an empty one (no token) if the account has no data anymore, i.e. the units then show no data
+    """
+    if spill_account(account_id, directory=directory) is not True:
+        _write_file(_get_path(account_id, directory), _add_engineered_columns)
+
+
+
+def remove_old_files(directory=OUT_OF_CORE_DIR, max_age=OUT_OF_CORE_MAX_AGE):
+    """
+    Removes the files of the accounts (and the temporary files left e.g. by a killed process)
+    which haven't been used for max_age seconds (by modification time, every query touches the file), None = keep all.
+    A session still showing such an account has to search for it again.
+
+    Returns:
+        the number of removed files
+    """
+    if max_age is None or not os.path.isdir(directory):
+        return 0
+    n_removed = 0
+    time_oldest = time() - max_age
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and '.duckdb' in entry.name and entry.stat().st_mtime < time_oldest:
+                os.remove(entry.path)
+                n_removed += 1
+        except FileNotFoundError:  # removed by another process
+            pass
+    return n_removed
+
+
+
+def _touch(path):
+    """Sets the modification time of the file to now (used, see `remove_old_files`)"""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+
+def read_token(account_id, directory=OUT_OF_CORE_DIR):
+    """The change token the file of the account was written with (as a list), None if there is no file"""
+    if not os.path.exists(_get_path(account_id, directory)):
+        return None
+    try:
+        return json.loads(_query(account_id, f"SELECT value FROM {TOKEN}", directory=directory)['value'].iloc[0])
+    except (duckdb.Error, IndexError):   # e.g. a file of an older version
+        return None
+
+
+
+def _create_tables(connection):
+    """The (typed) tables of an account's file, the eating data is spilled into 'eating_raw' first"""
+    for table, schema in [(f"{EATING}_raw", EATING_RAW_SCHEMA), (SYMPTOMS, SYMPTOMS_SCHEMA)]:
+        connection.execute(f"CREATE TABLE {table} ({', '.join(f'{k} {v}' for k, v in schema.items())})")
+    connection.execute(f"CREATE TABLE {TOKEN} (value VARCHAR)")
+
+
+
+def _spill_eating_data(connection, account_id, engine, chunksize):
+    """Streams the eating data into 'eating_raw', each chunk cleaned as in `stream_eating_data` on data_processing.py"""
+    n_rows = 0
+    for df in fetch_eating_data(account_id, engine, chunksize or OUT_OF_CORE_CHUNKSIZE):  # in data_access.py
+        check_cancelled()  # between the chunks (see data_cancellation.py)
+        df = clean_eating_data(df)
+        if COLUMN_NAME_REGEX not in df.columns:  # not selected from the foodstuff_name table
+            df = df.assign(**{COLUMN_NAME_REGEX: regex_foodstuff_name(df[COLUMN_NAME])})
+        chunk = df.assign(**{COLUMN_ROW_NO: range(n_rows, n_rows + len(df))})
+        connection.register('chunk', chunk)
+        connection.execute(f"INSERT INTO {EATING}_raw SELECT {', '.join(EATING_RAW_SCHEMA)} FROM chunk")
+        connection.unregister('chunk')
+        n_rows += len(df)
+
+
+
+def _spill_symptoms_data(connection, account_id, engine):
+    """The symptoms (one query, they are far fewer than the eating rows) with the meals they refer to"""
+    df = clean_symptoms_data(fetch_symptoms_data(account_id, engine))  # in data_access.py
+    df = df.assign(**{COLUMN_GRADE: to_numeric(df[COLUMN_GRADE]),
+                      COLUMN_MEAL: df[COLUMN_TIMING].map(MEAL_OF_TIMING),
+                      COLUMN_DIARY_MEAL: df[COLUMN_TIMING].map(MAPPING),
+                      COLUMN_ROW_NO: range(len(df))})
+    connection.register('chunk', df)
+    connection.execute(f"INSERT INTO {SYMPTOMS} SELECT {', '.join(SYMPTOMS_SCHEMA)} FROM chunk")
+    connection.unregister('chunk')
+
+
+
+def _add_engineered_columns(connection):
+    """
+    The 'eating' table: 'eating_raw' without the duplicated rows (the first one is kept, as in `drop_duplicated_rows`)
+    and with the engineered columns of `add_columns_to_eating_data` (both on data_processing.py)
+    """
+    connection.execute(f"""
+CREATE TABLE {EATING} AS
+WITH eating_rows AS (
+	SELECT * FROM {EATING}_raw
+	QUALIFY ROW_NUMBER() OVER (PARTITION BY {COLUMN_ACCOUNT_ID}, {COLUMN_DATE}, {COLUMN_MEAL_ID}, {COLUMN_MEAL}, {COLUMN_NAME}
+	                           ORDER BY {COLUMN_ROW_NO}) = 1
+),
+symptom_days AS (
+	SELECT DISTINCT CAST({COLUMN_DATE} AS DATE) AS day FROM {SYMPTOMS} WHERE {COLUMN_DATE} IS NOT NULL
+),
+symptoms_by_meal AS (
+	SELECT CAST({COLUMN_DATE} AS DATE) AS day, {COLUMN_MEAL},
+		STRING_AGG({COLUMN_SYMPTOM}, ', ' ORDER BY {COLUMN_ROW_NO}) AS {COLUMN_SYMPTOMS},
+		AVG({COLUMN_GRADE}) AS {COLUMN_AVG_GRADE}
+	FROM {SYMPTOMS}
+	WHERE {COLUMN_DATE} IS NOT NULL AND {COLUMN_MEAL} IS NOT NULL
+	GROUP BY 1, 2
+)
+SELECT e.{COLUMN_ACCOUNT_ID}, e.{COLUMN_DATE}, e.{COLUMN_MEAL_ID}, e.{COLUMN_MEAL}, e.{COLUMN_NAME}, e.{COLUMN_FOODSTUFF_ID},
+	CAST(ISODOW(e.{COLUMN_DATE}) - 1 AS INTEGER) AS {COLUMN_WEEKDAY},
+	e.{COLUMN_NAME_REGEX},
+	COALESCE(CAST(e.{COLUMN_DATE} AS DATE) IN (SELECT day FROM symptom_days), FALSE) AS {COLUMN_SYMPTOM_SAME_DAY},
+	COALESCE(CAST(e.{COLUMN_DATE} AS DATE) + 1 IN (SELECT day FROM symptom_days), FALSE) AS {COLUMN_SYMPTOM_NEXT_DAY},
+	s.{COLUMN_SYMPTOMS}, s.{COLUMN_AVG_GRADE},
+	e.{COLUMN_ROW_NO}
+FROM eating_rows e LEFT JOIN symptoms_by_meal s ON CAST(e.{COLUMN_DATE} AS DATE) = s.day AND e.{COLUMN_MEAL} = s.{COLUMN_MEAL}
+ORDER BY e.{COLUMN_ROW_NO}
+""")
+    connection.execute(f"DROP TABLE {EATING}_raw")
+
+
+
+def read_date_range(account_id, directory=OUT_OF_CORE_DIR):
+    """The min and max dates of the account's meals and symptoms (as `get_dates_range` on computations.py)"""
+    df = _query(account_id, f"""
+SELECT MIN({COLUMN_DATE}) AS min_date, MAX({COLUMN_DATE}) AS max_date
+FROM (SELECT {COLUMN_DATE} FROM {EATING} UNION ALL SELECT {COLUMN_DATE} FROM {SYMPTOMS})
+""", directory=directory)
+    return (df['min_date'].iloc[0].to_pydatetime(), df['max_date'].iloc[0].to_pydatetime())
+
+
+
+def read_eating_data(account_id, start_date=None, end_date=None, limit=None, directory=OUT_OF_CORE_DIR, **selectors):
+    """
+    The rows of the eating data within the dates and selected by the selectors (see `make_sql_filter`),
+    e.g. for the debugging tables (limit: the first rows only)
+    """
+    condition, params = make_sql_filter(start_date, end_date, **selectors)
+    columns = ', '.join(column for column in EATING_RAW_SCHEMA if column != COLUMN_ROW_NO)
+    columns += f", {COLUMN_WEEKDAY}, {COLUMN_SYMPTOM_SAME_DAY}, {COLUMN_SYMPTOM_NEXT_DAY}, {COLUMN_SYMPTOMS}, {COLUMN_AVG_GRADE}"
+    return _query(account_id, f"""
+SELECT {columns} FROM {EATING} WHERE {condition} ORDER BY {COLUMN_ROW_NO} {f'LIMIT {int(limit)}' if limit else ''}
+""", params, directory)
+
+
+
+def read_statistics(account_id, start_date=None, end_date=None, directory=OUT_OF_CORE_DIR):
+    """
+    The numbers of the statistics table (unit_2) as `make_statistics_table` on table_toolkit.py computes them,
+    the keys as `fetch_statistics` on data_access.py returns them (see `make_statistics_table_from_counts`)
+
+    Returns:
+        dict or None (no data within the dates)
+    """
+    condition, params = make_sql_filter(start_date, end_date)
+    df = _query(account_id, f"""
+WITH eating_days AS (
+	SELECT {COLUMN_DATE},
+		MAX(CASE WHEN {COLUMN_MEAL} = 'BREAKFAST' THEN 1 ELSE 0 END) AS breakfast,
+		MAX(CASE WHEN {COLUMN_MEAL} = 'LUNCH' THEN 1 ELSE 0 END) AS lunch,
+		MAX(CASE WHEN {COLUMN_MEAL} = 'DINNER' THEN 1 ELSE 0 END) AS dinner
+	FROM {EATING}
+	WHERE {COLUMN_DATE} IS NOT NULL AND {condition}
+	GROUP BY {COLUMN_DATE}
+),
+symptom_days AS (
+	SELECT {COLUMN_DATE}, COUNT(*) AS n_symptoms
+	FROM {SYMPTOMS}
+	WHERE {COLUMN_DATE} IS NOT NULL AND {condition}
+	GROUP BY {COLUMN_DATE}
+),
+eating_weeks AS (
+	SELECT DISTINCT WEEK({COLUMN_DATE}) AS week_no FROM eating_days
+),
+symptom_weeks AS (
+	SELECT WEEK({COLUMN_DATE}) AS week_no, COUNT(*) AS n_days FROM symptom_days GROUP BY 1
+)
+SELECT
+	(SELECT COUNT(*) FROM (SELECT {COLUMN_DATE} FROM eating_days UNION SELECT {COLUMN_DATE} FROM symptom_days)) AS usage_days,
+	(SELECT CAST(COALESCE(SUM(n_symptoms), 0) AS BIGINT) FROM symptom_days) AS symptom_count,
+	(SELECT COUNT(*) FROM symptom_days) AS symptom_days,
+	(SELECT AVG(s.n_days) FROM eating_weeks w JOIN symptom_weeks s ON w.week_no = s.week_no) AS avg_symptom_days_per_week,
+	(SELECT COUNT(*) FROM eating_days) AS eating_days,
+	(SELECT CAST(COALESCE(SUM(breakfast), 0) AS BIGINT) FROM eating_days) AS breakfast_days,
+	(SELECT CAST(COALESCE(SUM(lunch), 0) AS BIGINT) FROM eating_days) AS lunch_days,
+	(SELECT CAST(COALESCE(SUM(dinner), 0) AS BIGINT) FROM eating_days) AS dinner_days
+""", params, directory)
+
+    statistics = {column: df[column].iloc[0].item() for column in df.columns}
+    if statistics['avg_symptom_days_per_week'] != statistics['avg_symptom_days_per_week']:   # NaN -> None (no weeks)
+        statistics['avg_symptom_days_per_week'] = None
+    if not statistics['usage_days']:
+        return None
+    return statistics
+
+
+
+def read_diary(account_id, start_date=None, end_date=None, mapping=MAPPING, directory=OUT_OF_CORE_DIR):
+    """
+    The diary within the dates aggregated as by `_aggregate_diary` on table_toolkit.py
+    (i.e. before its meals and grades are translated/formatted, see `finish_diary_table`)
+
+    Args:
+        mapping: the timings of the symptoms -> the meals of the diary (MAPPING on table_toolkit.py), for the order of the meals
+    """
+    condition, params = make_sql_filter(start_date, end_date)
+    meals = list(mapping.values())
+    return _query(account_id, f"""
+WITH eating_agg AS (
+	SELECT {COLUMN_DATE}, {COLUMN_MEAL}, STRING_AGG({COLUMN_NAME}, ', ' ORDER BY {COLUMN_ROW_NO}) AS {COLUMN_NAME}
+	FROM {EATING}
+	WHERE {COLUMN_DATE} IS NOT NULL AND {COLUMN_MEAL} IS NOT NULL AND {condition}
+	GROUP BY 1, 2
+),
+symptoms_agg AS (
+	SELECT {COLUMN_DATE}, {COLUMN_DIARY_MEAL} AS {COLUMN_MEAL},
+		STRING_AGG({COLUMN_SYMPTOM}, ', ' ORDER BY {COLUMN_ROW_NO}) AS {COLUMN_SYMPTOM}, AVG({COLUMN_GRADE}) AS {COLUMN_GRADE}
+	FROM {SYMPTOMS}
+	WHERE {COLUMN_DATE} IS NOT NULL AND {COLUMN_DIARY_MEAL} IS NOT NULL AND {condition}
+	GROUP BY 1, 2
+)
+SELECT {COLUMN_DATE}, {COLUMN_MEAL}, e.{COLUMN_NAME}, s.{COLUMN_SYMPTOM}, s.{COLUMN_GRADE}
+FROM symptoms_agg s FULL OUTER JOIN eating_agg e USING ({COLUMN_DATE}, {COLUMN_MEAL})
+ORDER BY {COLUMN_DATE}, LIST_POSITION($meals, {COLUMN_MEAL}) NULLS LAST, {COLUMN_MEAL}
+""", {**params, 'meals': meals}, directory)
+
+
+
+def read_timeline(account_id, start_date=None, end_date=None, directory=OUT_OF_CORE_DIR):
+    """
+    The data of the timeline (unit_3, `make_figure_3` on plotting_toolkit.py): one row per date and meal
+    with its foodstuffs concatenated (as the plot shows them) and the dates with symptoms
+
+    Returns:
+        (df_eating, df_symptoms)
+    """
+    condition, params = make_sql_filter(start_date, end_date)
+    df_eating = _query(account_id, f"""
+SELECT {COLUMN_DATE}, {COLUMN_MEAL}, STRING_AGG({COLUMN_NAME_REGEX}, ', ' ORDER BY {COLUMN_ROW_NO}) AS {COLUMN_NAME_REGEX}
+FROM {EATING}
+WHERE {condition}
+GROUP BY 1, 2
+ORDER BY MIN({COLUMN_ROW_NO})
+""", params, directory)
+    df_symptoms = _query(account_id, f"""
+SELECT DISTINCT {COLUMN_DATE} FROM {SYMPTOMS} WHERE {condition} ORDER BY 1
+""", params, directory)
+    return (df_eating, df_symptoms)
+
+
+
+def read_foodstuff_counts(account_id, start_date=None, end_date=None, top_n=10, directory=OUT_OF_CORE_DIR, **selectors):
+    """
+    The most common foodstuffs (the regex'ed names) of the selected rows (units 4, 5),
+    as `value_counts().head(top_n)` (the ties in the order of their first row)
+
+    Returns:
+        pandas.Series: name -> count
+    """
+    condition, params = make_sql_filter(start_date, end_date, **selectors)
+    df = _query(account_id, f"""
+SELECT {COLUMN_NAME_REGEX}, COUNT(*) AS count
+FROM {EATING}
+WHERE {COLUMN_NAME_REGEX} IS NOT NULL AND {condition}
+GROUP BY 1
+ORDER BY 2 DESC, MIN({COLUMN_ROW_NO})
+LIMIT {int(top_n)}
+""", params, directory)
+    return df.set_index(COLUMN_NAME_REGEX)['count']
+
+
+
+def read_meal_counts(account_id, start_date=None, end_date=None, top_n=3, directory=OUT_OF_CORE_DIR, **selectors):
+    """
+    The most common meals (unit_6): the selected rows grouped by date and meal,
+    each meal as the set of its foodstuffs (the regex'ed names), counted (the ties in the order of the meals)
+
+    Returns:
+        collections.Counter: frozenset of names -> count (the most common first)
+    """
+    condition, params = make_sql_filter(start_date, end_date, **selectors)
+    df = _query(account_id, f"""
+WITH meals AS (
+	SELECT LIST_SORT(LIST_DISTINCT(LIST({COLUMN_NAME_REGEX}))) AS names,
+		ROW_NUMBER() OVER (ORDER BY {COLUMN_DATE}, {COLUMN_MEAL}) AS meal_no
+	FROM {EATING}
+	WHERE {COLUMN_DATE} IS NOT NULL AND {COLUMN_MEAL} IS NOT NULL AND {condition}
+	GROUP BY {COLUMN_DATE}, {COLUMN_MEAL}
+)
+SELECT names, COUNT(*) AS count
+FROM meals
+GROUP BY 1
+ORDER BY 2 DESC, MIN(meal_no)
+LIMIT {int(top_n)}
+""", params, directory)
+    return Counter({frozenset(names): count for names, count in zip(df['names'], df['count'])})
+
+
+
+def read_combination_counts(account_id, n_components=2, start_date=None, end_date=None, top_n=5,
+                            directory=OUT_OF_CORE_DIR, **selectors):
+    """
+    The most common combinations of n_components foodstuffs within a meal (unit_7),
+    as `compute_combination_occurrence` on computations.py counts them: the number of the meals with the combination
+    (a self-join of the foodstuffs of each meal, the combinations of a name with itself or in another order are excluded)
+
+    Returns:
+        collections.Counter: tuple of names (sorted) -> count (the most common first, the ties by the names)
+    """
+    n = int(n_components)
+    condition, params = make_sql_filter(start_date, end_date, **selectors)
+    names = [f"f{i}.name" for i in range(n)]
+    joins = "\n\t".join(f"JOIN foodstuffs f{i} ON f{i}.meal_no = f0.meal_no AND f{i}.name > f{i - 1}.name" for i in range(1, n))
+    df = _query(account_id, f"""
+WITH foodstuffs AS (
+	SELECT DISTINCT DENSE_RANK() OVER (ORDER BY {COLUMN_DATE}, {COLUMN_MEAL}) AS meal_no, {COLUMN_NAME_REGEX} AS name
+	FROM {EATING}
+	WHERE {COLUMN_DATE} IS NOT NULL AND {COLUMN_MEAL} IS NOT NULL AND {COLUMN_NAME_REGEX} IS NOT NULL AND {condition}
+)
+SELECT [{', '.join(names)}] AS names, COUNT(*) AS count
+FROM foodstuffs f0
+	{joins}
+GROUP BY {', '.join(names)}
+ORDER BY 2 DESC, 1
+LIMIT {int(top_n)}
+""", params, directory)
+    return Counter({tuple(names): count for names, count in zip(df['names'], df['count'])})
+
+
+
+def read_foodstuff_flags(account_id, directory=OUT_OF_CORE_DIR):
+    """
+    The numbers of `make_probably_bad_foods_table_from_counts` on table_toolkit.py (unit_8) per foodstuff
+    (the regex'ed names) of the whole history
+
+    Returns:
+        pandas.DataFrame indexed by the names (sorted)
+    """
+    df = _query(account_id, f"""
+SELECT {COLUMN_NAME_REGEX},
+	CAST(SUM(CAST({COLUMN_SYMPTOM_SAME_DAY} AS INTEGER)) AS BIGINT) AS {COLUMN_SYMPTOM_SAME_DAY},
+	CAST(SUM(CAST({COLUMN_SYMPTOM_NEXT_DAY} AS INTEGER)) AS BIGINT) AS {COLUMN_SYMPTOM_NEXT_DAY},
+	BOOL_OR({COLUMN_SYMPTOM_SAME_DAY}) AS eaten_on_symptom_days,
+	BOOL_OR(NOT {COLUMN_SYMPTOM_SAME_DAY}) AS eaten_on_symptom_free_days
+FROM {EATING}
+WHERE {COLUMN_NAME_REGEX} IS NOT NULL
+GROUP BY 1
+ORDER BY 1
+""", directory=directory)
+    return df.set_index(COLUMN_NAME_REGEX)
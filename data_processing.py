@@ -4,70 +4,399 @@ helper functions for data processing
 """
 
 import re
-from pandas import to_datetime, Timedelta
-from data_access import make_sqlalchemy_engine, fetch_eating_data, fetch_symptoms_data
-from constants import DEBUG, ERR_PREFIX, MEALS_MAPPING
-from constants import (COLUMN_ACCOUNT_ID, COLUMN_DATE, COLUMN_MEAL_ID, COLUMN_MEAL, 
+from threading import Lock
+from itertools import islice
+from time import perf_counter
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+from pandas import Series, DataFrame, Index, CategoricalDtype, to_datetime, to_numeric, concat, factorize
+from data_access import (get_sqlalchemy_engine, load_account, check_account, fetch_eating_data, fetch_symptoms_data,
+                         fetch_change_token, fetch_daily_summary, fetch_foodstuffs_by_ids)
+from data_caching import dataframes_cache, FoodstuffDictionary
+from data_snapshots import load_account_from_snapshot, TIMINGS_ORDER
+from data_cancellation import check_cancelled
+import polars_engine
+from constants import DEBUG, ERR_PREFIX, MEALS_MAPPING, FETCH_CHUNKSIZE, CONCURRENT_FETCH, POOL_SIZE, SNAPSHOT_DIR
+from constants import FOODSTUFF_DICTIONARY, FOODSTUFF_DICTIONARY_MAX_AGE, NAME_MEMO_MAX_SIZE, COMPACT_SCHEMA, ENGINE
+from constants import (COLUMN_ACCOUNT_ID, COLUMN_DATE, COLUMN_MEAL_ID, COLUMN_MEAL, COLUMN_FOODSTUFF_ID, COLUMN_REPORT_ID,
                        COLUMN_NAME, COLUMN_TIMING, COLUMN_SYMPTOM, COLUMN_GRADE, COLUMN_NAME,
                        COLUMN_WEEKDAY, COLUMN_SYMPTOMS, COLUMN_AVG_GRADE, COLUMN_NAME_REGEX,
-                       COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY)
+                       COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY, COLUMN_SYMPTOM_COUNT, COLUMN_FOODSTUFF_IDS)
 
 
-def get_dataframes(account_id, engine=None):
+# Thread pool for `load_dataframes_concurrently` (3 tasks per account load, each holds a connection)
+_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='fetch')
+
+# The foodstuff names of the meals fetched as ids (FOODSTUFF_DICTIONARY), the regex is applied once per distinct name
+foodstuff_dictionary = (FoodstuffDictionary(FOODSTUFF_DICTIONARY_MAX_AGE, normalize=lambda sr: regex_foodstuff_name(sr))
+                        if FOODSTUFF_DICTIONARY else None)
+
+# The meal a symptom refers to (by the timing of the report), e.g. AFTER_LUNCH -> LUNCH (see `add_columns_to_eating_data`)
+MEAL_OF_TIMING = {f"AFTER_{meal}": meal for meal in MEALS_MAPPING}
+
+# Max size of the table for the lookups of the days / (day, meal) keys, above it they are binary searched
+LOOKUP_TABLE_MAX_SIZE = 10_000_000
+
+# The compact dtypes of the df's (COMPACT_SCHEMA, see `apply_compact_schema`)
+ORDERED_CATEGORIES = {COLUMN_MEAL: list(MEALS_MAPPING), COLUMN_TIMING: TIMINGS_ORDER}   # in the order of the day
+CATEGORIES = [COLUMN_NAME, COLUMN_NAME_REGEX, COLUMN_SYMPTOM, COLUMN_SYMPTOMS]
+IDS = [COLUMN_ACCOUNT_ID, COLUMN_MEAL_ID, COLUMN_FOODSTUFF_ID, COLUMN_REPORT_ID]   # the smallest int type which fits
+FLOATS = [COLUMN_GRADE, COLUMN_AVG_GRADE]   # float32 (grade 1-10, missing if the timing is unknown)
+
+
+
+def get_dataframes(account_id, engine=None, chunksize=FETCH_CHUNKSIZE, concurrent=CONCURRENT_FETCH, 
+                   cache=dataframes_cache, snapshots=SNAPSHOT_DIR, start_date=None, end_date=None, columns=None):
     """
     TODO: docs
 
-    Two queries to make and retrieve two tables from the SQL database.
+    One query (see `load_account` on data_access.py) checks the account and
+    retrieves two tables from the SQL database.
     Both are LONG tables, i.e. no aggregating is done.
     The necessary aggregation will be done by an individual plotting function.
+
+    If chunksize is given (for very long account histories), the account is checked first and
+    the eating data is streamed in chunks, which are cleaned as they arrive (see `stream_eating_data`).
+    If concurrent is True, the account check and the two tables are fetched at the same time
+    on separate connections (see `load_dataframes_concurrently`).
+
+    If a cache is given (see data_caching.py), a tiny query fetches the change token of the account first,
+    and the cached df's are returned if the data of the account hasn't changed since they were cached.
+    If snapshots (a directory) is given, the data comes from the local snapshot of the account,
+    only the rows added since the snapshot was taken are fetched (see data_snapshots.py).
+    If start_date/end_date are given, only the data within these dates is fetched (the WHERE clause in SQL),
+    e.g. the most recent weeks first, see LAZY_HISTORY on constants.py.
+    If columns (a list of the engineered columns of the eating data, see ENGINEERED_COLUMNS) is given,
+    only these are computed - and kept in the cache for the next calls (see `LazyEatingData`, LAZY_COLUMNS on constants.py),
+    otherwise all of them are computed on the load.
     
     Returns:
-        two df's: pandas.DataFrame object otherwise (empty or not)
+        (df_eating, df_symptoms, status)
+        two df's: pandas.DataFrame objects (None if status is not True)
+        status: ValueError (bad input), None (account not found), False (no data) or True
     """
 
-    # Start an sqlalchemy engine
-    engine = engine or make_sqlalchemy_engine()
+    # The (pooled) sqlalchemy engine of this process
+    engine = engine or get_sqlalchemy_engine()
+
+    # Only the data within these dates
+    dates = (start_date, end_date)
+
+    # The engineered columns on demand
+    lazy = columns is not None
+
+    if cache is None:
+        *dataframes, status = load_dataframes(account_id, engine, chunksize, concurrent, snapshots, dates=dates, lazy=lazy)
+    else:
+        # Has the data changed since it was cached?
+        status, token = fetch_change_token(account_id, engine)  # in data_access.py
+
+        if status is not True:
+            return (None, None, status)
+
+        key = (int(account_id), *(str(date)[:10] if date else None for date in dates)) + (('lazy',) if lazy else ())
+        dataframes = cache.get(key, token)
+
+        if dataframes is None:
+            *dataframes, status = load_dataframes(account_id, engine, chunksize, concurrent, snapshots, token, dates, lazy)
+            if status is True:
+                cache.put(key, token, dataframes)
+
+    # Only the columns asked for (computed now unless computed already for an earlier call)
+    if lazy and status is True:
+        lazy_eating, df_symptoms = dataframes
+        computed = lazy_eating.computed_columns
+        dataframes = (lazy_eating.get(columns), df_symptoms)
+
+        # The cached entry has grown by the columns computed now
+        if cache is not None and lazy_eating.computed_columns != computed:
+            cache.resize(key)
+
+    # Return two df's (and the status of the account)
+    return (*dataframes, status)
+
+
+
+def load_dataframes(account_id, engine, chunksize=None, concurrent=False, snapshots=None, token=None, 
+                    dates=(None, None), lazy=False):
+    """
+    Fetches, cleans and processes the data of the account (see `get_dataframes`).
 
-    # Fetch data
-    df_eating = fetch_eating_data(account_id, engine)     # in data_access.py
-    df_symptoms = fetch_symptoms_data(account_id, engine) # in data_access.py
-    del engine    # not really necessary (according to sqlalchemy docs)
+    Args:
+        token: the change token of the account if it was fetched already (used for the snapshots)
+        dates: (start_date, end_date) - each can be None
+        lazy: if True, df_eating is a `LazyEatingData` (the engineered columns are not computed yet)
+
+    Returns:
+        (df_eating, df_symptoms, status)
+    """
+    # Check the account, fetch and clean data
+    if snapshots:
+        status, df_eating, df_symptoms = load_account_from_snapshot(account_id, engine, token, snapshots)
+        if status is True:  # the snapshot holds the whole history
+            df_eating = subset_by_dates(clean_eating_data(df_eating), *dates)
+            df_symptoms = subset_by_dates(clean_symptoms_data(df_symptoms), *dates)
+    elif concurrent:
+        status, df_eating, df_symptoms = load_dataframes_concurrently(account_id, engine, chunksize, dates)
+    elif chunksize:
+        status = check_account(account_id, engine)  # in data_access.py
+        if status is True:
+            df_eating = stream_eating_data(account_id, engine, chunksize, dates)  # cleaned already
+            df_symptoms = clean_symptoms_data(fetch_symptoms_data(account_id, engine, *dates))
+    elif foodstuff_dictionary is not None:
+        status, df_eating, df_symptoms = load_account(account_id, engine, start_date=dates[0], end_date=dates[1],
+                                                      ids_only=True)
+        if status is True:
+            df_eating = clean_eating_ids(df_eating, account_id, engine)
+            df_symptoms = clean_symptoms_data(df_symptoms)
+    else:
+        status, df_eating, df_symptoms = load_account(account_id, engine, start_date=dates[0], end_date=dates[1])
+        if status is True:
+            df_eating = clean_eating_data(df_eating)
+            df_symptoms = clean_symptoms_data(df_symptoms)
+
+    if status is not True:
+        return (None, None, status)
+
+    # Superseded by a newer load of the session? (see data_cancellation.py)
+    check_cancelled()
+
+    # Add "engineered features" (i.e. columns), if lazy only when asked for (see `LazyEatingData`)
+    if not lazy:
+        df_eating = add_columns_to_eating_data(df_eating, df_symptoms)
+    df_symptoms = add_columns_to_symptoms_data(df_eating, df_symptoms)  # the meal
+    check_cancelled()
+
+    # Compact dtypes (e.g. less memory in the cache)
+    if COMPACT_SCHEMA:
+        df_eating, df_symptoms = apply_compact_schema(df_eating), apply_compact_schema(df_symptoms)
+
+    if lazy:
+        df_eating = LazyEatingData(df_eating, df_symptoms)
+
+    # Return two df's (and the status of the account)
+    return (df_eating, df_symptoms, status)
+
+
+
+def load_dataframes_concurrently(account_id, engine, chunksize=None, dates=(None, None)):
+    """
+    Runs the account check and the two fetch queries at the same time (in a thread pool),
+    each on its own connection from the pool of the engine.
+    Each df is cleaned in its thread as soon as its query has returned,
+    so an account load takes as long as the slowest query (rather than the sum of all of them).
+    The timings of the tasks are printed in the DEBUG mode (to see the overlap).
+
+    Returns:
+        (status, df_eating, df_symptoms) - the df's are cleaned (None if status is not True)
+    """
+    # Bad input -> ValueError (as returned by `check_account`), no need to query anything
+    try:
+        account_id = int(account_id)
+    except (TypeError, ValueError):
+        return (ValueError, None, None)
+
+    def fetch_and_clean_eating_data():
+        if chunksize:
+            return stream_eating_data(account_id, engine, chunksize, dates)
+        if foodstuff_dictionary is not None:
+            df = fetch_eating_data(account_id, engine, start_date=dates[0], end_date=dates[1], ids_only=True)
+            return clean_eating_ids(df, account_id, engine)
+        return clean_eating_data(fetch_eating_data(account_id, engine, start_date=dates[0], end_date=dates[1]))
+
+    def fetch_and_clean_symptoms_data():
+        return clean_symptoms_data(fetch_symptoms_data(account_id, engine, *dates))
+
+    tasks = {'check_account': lambda: check_account(account_id, engine),
+             'eating data': fetch_and_clean_eating_data,
+             'symptoms data': fetch_and_clean_symptoms_data}
+
+    time_start = perf_counter()
+    # copy_context: the tasks belong to the current load (see data_cancellation.py)
+    futures = {name: _executor.submit(copy_context().run, _run_timed, func) for name, func in tasks.items()}
+    status, *_ = futures['check_account'].result()
+
+    # Account not found or no data -> the queries not started yet are cancelled, the running ones are waited for
+    # (none of them outlives the load, their errors are raised)
+    if status is not True:
+        for future in futures.values():
+            if not future.cancel():
+                future.result()
+        return (status, None, None)
+
+    wait(futures.values())   # an error is raised once all tasks are done
+    results = {name: future.result() for name, future in futures.items()}
+    time_total = perf_counter() - time_start
+
+    if DEBUG:
+        print(f"account {account_id} loaded concurrently in {time_total:.3f} s "
+              f"(sum of the tasks: {sum(end - start for _, start, end in results.values()):.3f} s)")
+        for name, (_, start, end) in results.items():
+            print(f"  {name:<15} {start - time_start:7.3f} s -> {end - time_start:7.3f} s")
+
+    return (status, results['eating data'][0], results['symptoms data'][0])
+
+
+
+def _run_timed(func):
+    """Returns (result, start time, end time) of func()"""
+    time_start = perf_counter()
+    result = func()
+    return (result, time_start, perf_counter())
+
+
+
+def stream_eating_data(account_id, engine, chunksize, dates=(None, None)):
+    """
+    Fetches the eating data in chunks (server-side cursor) and cleans each chunk as it arrives,
+    the regex'ed name column is added to each chunk too.
+    So the peak memory is bound by the chunk size rather than by the length of the history
+    (only the cleaned chunks are kept).
+
+    Returns:
+        pandas.DataFrame (as returned by `clean_eating_data` plus the 'name_regex' column)
+    """
+    ids_only = foodstuff_dictionary is not None
 
-    # Clean data
-    df_eating = clean_eating_data(df_eating)
-    df_symptoms = clean_symptoms_data(df_symptoms)
+    chunks = []
+    for df in fetch_eating_data(account_id, engine, chunksize, *dates, ids_only=ids_only):  # in data_access.py
+        check_cancelled()  # between the chunks (see data_cancellation.py)
+        if ids_only:
+            df = clean_eating_ids(df, account_id, engine)  # with the regex'ed names
+        else:
+            df = clean_eating_data(df)
+            if COLUMN_NAME_REGEX not in df.columns:  # not selected from the foodstuff_name table
+                df[COLUMN_NAME_REGEX] = regex_foodstuff_name(df[COLUMN_NAME])
+        chunks.append(df)
 
-    # Add "engineered features" (i.e. columns)
-    df_eating = add_columns_to_eating_data(df_eating, df_symptoms)
-    df_symptoms = add_columns_to_symptoms_data(df_eating, df_symptoms)  # no cols are added - just for visual consistency
+    # The rows of one meal can be split between two chunks
+    return drop_duplicated_rows(concat(chunks, ignore_index=True))
 
-    # Return two df's
+
+
+def get_timeline_data(account_id, engine=None, start_date=None, end_date=None):
+    """
+    The data of the timeline (unit_3, `make_figure_3` on plotting_toolkit.py) from the daily_summary table
+    (DAILY_SUMMARY on constants.py, see daily_summary.py) instead of the eating data:
+    one row per date and meal with its regex'ed foodstuff names concatenated (as the plot shows them)
+    and the dates with symptoms, as `read_timeline` on data_out_of_core.py.
+    The names come from the foodstuff dictionary (FOODSTUFF_DICTIONARY) or are fetched for the ids of the summary.
+
+    Returns:
+        (df_eating, df_symptoms) - (None, None) if the account_id is bad
+    """
+    df = fetch_daily_summary(account_id, engine, start_date, end_date)  # in data_access.py
+    if df is ValueError:
+        return (None, None)
+    dates = to_datetime(df[COLUMN_DATE])
+
+    # One row per date and meal (of the meals logged on the date) with the list of its foodstuff ids
+    df_eating = concat([DataFrame({COLUMN_DATE: dates, COLUMN_MEAL: meal,
+                                   COLUMN_FOODSTUFF_IDS: df[f"{meal.lower()}_{COLUMN_FOODSTUFF_IDS}"]})[df[meal.lower()] == 1]
+                        for meal in MEALS_MAPPING], ignore_index=True)
+
+    # The regex'ed names of the ids
+    ids = Series(sorted({i for foodstuff_ids in df_eating[COLUMN_FOODSTUFF_IDS] for i in foodstuff_ids}), dtype='int64')
+    if foodstuff_dictionary is not None:
+        names_regex = foodstuff_dictionary.resolve(ids, engine)[2]
+    else:
+        df_names = fetch_foodstuffs_by_ids(ids, engine) if len(ids) else DataFrame(columns=[COLUMN_FOODSTUFF_ID, COLUMN_NAME])
+        names_regex = ids.map(dict(zip(df_names[COLUMN_FOODSTUFF_ID], regex_foodstuff_name(df_names[COLUMN_NAME].astype(object)))))
+    name_of = {i: name for i, name in zip(ids.tolist(), names_regex) if isinstance(name, str)}
+
+    # The names concatenated (a few hundred meals per account: plain python is faster than a groupby)
+    df_eating[COLUMN_NAME_REGEX] = [", ".join(name_of[i] for i in foodstuff_ids if i in name_of)
+                                    for foodstuff_ids in df_eating.pop(COLUMN_FOODSTUFF_IDS)]
+    df_symptoms = DataFrame({COLUMN_DATE: dates[df[COLUMN_SYMPTOM_COUNT] > 0]}).reset_index(drop=True)
     return (df_eating, df_symptoms)
 
 
 
+def subset_by_dates(df, start_date=None, end_date=None):
+    """
+    Only the rows within the dates (inclusive), each date can be None.
+    (unlike `subset_data_by_dates` on data_filtering.py, which is used for the selectors, both dates are optional)
+    """
+    mask = Series(True, index=df.index)
+    if start_date:
+        mask &= df[COLUMN_DATE] >= to_datetime(str(start_date)[:10])
+    if end_date:
+        mask &= df[COLUMN_DATE] <= to_datetime(str(end_date)[:10])
+    return df[mask]
+
+
+
 def clean_eating_data(df):
     """
     note: name will not be cleaned here
     but a new column 'name_regex' will be added
+    (if the stored 'name_regex' was fetched (STORED_FOODSTUFF_NAMES), only its missing values are filled in here)
     """
 
-    # Clean
-    df.columns = df.columns.str.lower().str.replace(' ', '_')
-    df[COLUMN_DATE] = to_datetime(df[COLUMN_DATE])   # pandas.to_datetime
+    # Clean (new df's: the df passed in stays as it is, no data is copied with Copy-on-Write)
+    df = df.set_axis(df.columns.str.lower().str.replace(' ', '_'), axis=1)
+    df = df.assign(**{COLUMN_DATE: to_datetime(df[COLUMN_DATE])})   # pandas.to_datetime
 
     # Drop duplicated rows (based on the subset of cols)
+    df = drop_duplicated_rows(df)
+
+    # The foodstuffs not yet processed by foodstuff_names.py
+    if COLUMN_NAME_REGEX in df.columns:
+        df = fill_name_regex(df)
+    return df
+
+
+
+def fill_name_regex(df):
+    """Applies the regex to the names whose stored 'name_regex' is missing (e.g. new foodstuffs)"""
+    names_regex = df[COLUMN_NAME_REGEX]
+    missing = names_regex.isna() & df[COLUMN_NAME].notna()
+    if missing.any():
+        names_regex = names_regex.astype(object).mask(missing, regex_foodstuff_name(df.loc[missing, COLUMN_NAME]))
+    return df.assign(**{COLUMN_NAME_REGEX: names_regex.astype(df[COLUMN_NAME].dtype)})
+
+
+
+def clean_eating_ids(df, account_id, engine=None):
+    """
+    Same as `clean_eating_data` for the meals fetched as ids only (see FOODSTUFF_DICTIONARY on constants.py),
+    but the 'name_regex' column is added too.
+    The names are resolved from the foodstuff dictionary and the duplicated rows are dropped
+    on the integer codes of the names (the meal_id stands for the account, date and meal).
+
+    Returns:
+        pandas.DataFrame with the columns of `fetch_eating_data` plus 'name_regex'
+    """
+    df = df.set_axis(df.columns.str.lower().str.replace(' ', '_'), axis=1)
+    codes, names, names_regex = foodstuff_dictionary.resolve(df[COLUMN_FOODSTUFF_ID], engine)
+
+    # Drop duplicated rows (the same meal and the same name)
+    mask = ~DataFrame({COLUMN_MEAL_ID: df[COLUMN_MEAL_ID].to_numpy(), COLUMN_NAME: codes}).duplicated(keep='first').to_numpy()
+
+    df = df[mask]
+    df.insert(0, COLUMN_ACCOUNT_ID, int(account_id))
+    df.insert(4, COLUMN_NAME, Series(names[mask], index=df.index))
+    df[COLUMN_NAME_REGEX] = Series(names_regex[mask], index=df.index)
+    df[COLUMN_DATE] = to_datetime(df[COLUMN_DATE])   # pandas.to_datetime
+    return df[[COLUMN_ACCOUNT_ID, COLUMN_DATE, COLUMN_MEAL_ID, COLUMN_MEAL, COLUMN_NAME, COLUMN_FOODSTUFF_ID, COLUMN_NAME_REGEX]]
+
+
+
+def drop_duplicated_rows(df):
+    """Drops the duplicated rows of the eating data (based on the subset of cols)"""
     columns = [COLUMN_ACCOUNT_ID, COLUMN_DATE, COLUMN_MEAL_ID, COLUMN_MEAL, COLUMN_NAME]
+    if ENGINE == 'polars':
+        return df[polars_engine.mask_first_rows(df, columns)]
     mask_duplicated = df.duplicated(subset=columns, keep='first')
     return df[~mask_duplicated]
 
 
 
 def clean_symptoms_data(df):
-    """TODO"""
-    df.columns = df.columns.str.lower().str.replace(' ', '_')
-    df[COLUMN_DATE] = to_datetime(df[COLUMN_DATE])   # pandas.to_datetime
-    return df
+    """TODO (a new df, as `clean_eating_data`)"""
+    df = df.set_axis(df.columns.str.lower().str.replace(' ', '_'), axis=1)
+    return df.assign(**{COLUMN_DATE: to_datetime(df[COLUMN_DATE])})   # pandas.to_datetime
 
 
 
@@ -80,60 +409,288 @@ def add_columns_to_eating_data(df_eating, df_symptoms):
     symptom_next_day
     symptoms 
     avg_grade
+    (each by its function on ENGINEERED_COLUMNS, see `LazyEatingData` for the columns on demand)
+    With ENGINE = 'polars' all but name_regex come from one Polars query (see polars_engine.py).
+    Returns a new df, neither df passed in is changed.
     """
-    
-    # Add Weekday (Monday=0, Sunday=6)
-    df_eating[COLUMN_WEEKDAY] = df_eating[COLUMN_DATE].dt.weekday
-
-    # Add regex'ed name -> "name_regex" (keep the original)
-    df_eating[COLUMN_NAME_REGEX] = regex_foodstuff_name(df_eating[COLUMN_NAME])
+    # All columns, each function once (the regex'ed name added already, e.g. chunk by chunk, is moved to its place)
+    columns, shared = {}, {}
+    if ENGINE == 'polars':
+        columns = polars_engine.make_engineered_columns(df_eating, df_symptoms, MEAL_OF_TIMING)
+        columns.update(_make_name_regex(df_eating, df_symptoms, shared))
+        columns = {column: columns[column] for column in ENGINEERED_COLUMNS}   # in the order of ENGINEERED_COLUMNS
+    else:
+        for make_columns in dict.fromkeys(ENGINEERED_COLUMNS.values()):
+            columns.update(make_columns(df_eating, df_symptoms, shared))
+    df_eating = df_eating.drop(columns=COLUMN_NAME_REGEX, errors='ignore').assign(**columns)
 
     # rearrange columns for visual appeal (in debug mode only)
     if DEBUG:
-        columns = df_eating.columns.to_list()
-        columns.insert(5, columns.pop())   # 2 = the index, where to put the new columns
-        columns.insert(2, columns.pop())
-        df_eating = df_eating.reindex(columns=columns)
-
-    # Add columns (with data from df_symptoms)
-    df_eating[COLUMN_SYMPTOM_SAME_DAY] = df_eating[COLUMN_DATE].isin(df_symptoms[COLUMN_DATE])
-    df_eating[COLUMN_SYMPTOM_NEXT_DAY] = (df_eating[COLUMN_DATE] + Timedelta(1, unit='D')).isin(df_symptoms[COLUMN_DATE])
-    
-    unique_values = tuple(df_symptoms[COLUMN_TIMING].unique())
-    meal_names = sorted(MEALS_MAPPING.keys())
+        df_eating = _rearrange_columns(df_eating)
+    return df_eating.reset_index(drop=True)
 
-    try: # dynamicaly
-        mapping = {[unique_values[i] for i,v in enumerate(unique_values) if e.lower() in v.lower()][0]:e for e in meal_names}
-    except: # fallback
-        mapping = {'AFTER_BREAKFAST': 'BREAKFAST', 'AFTER_DINNER': 'DINNER', 'AFTER_LUNCH': 'LUNCH'}
 
-    df_symptoms[COLUMN_MEAL] = df_symptoms[COLUMN_TIMING].map(mapping)  # by ref
-    df_symptoms_agg = (df_symptoms[[COLUMN_DATE, COLUMN_MEAL, COLUMN_SYMPTOM, COLUMN_GRADE]].groupby([COLUMN_DATE, COLUMN_MEAL])
-                       .agg({COLUMN_SYMPTOM: ", ".join, COLUMN_GRADE: 'mean'}).reset_index())
-    
-    # 'symptoms' is concatenated
-    df_symptoms_agg.columns = [COLUMN_DATE, COLUMN_MEAL, COLUMN_SYMPTOMS, COLUMN_AVG_GRADE]
-    
-    # 5 new columns appended
-    return df_eating.merge(df_symptoms_agg, how='left', on=[COLUMN_DATE, COLUMN_MEAL])
 
+def _shared(shared, key, func, *args):
+    """func(*args) once for all column functions (e.g. the day numbers), kept in the dict shared"""
+    if key not in shared:
+        shared[key] = func(*args)
+    return shared[key]
 
 
-def add_columns_to_symptoms_data(df_eating, df_symptoms):
-    return df_symptoms  # no columns are added - just for consistency
 
+def _make_weekday(df_eating, df_symptoms, shared):
+    """Weekday (Monday=0, Sunday=6), from the day numbers (1970-01-01 was a Thursday)"""
+    days, valid_days = _shared(shared, 'days', _to_day_numbers, df_eating[COLUMN_DATE])
+    if valid_days.all():
+        return {COLUMN_WEEKDAY: ((days + 3) % 7).astype('int32')}
+    return {COLUMN_WEEKDAY: df_eating[COLUMN_DATE].dt.weekday}
 
 
-def regex_foodstuff_name(sr):
+
+def _make_name_regex(df_eating, df_symptoms, shared):
+    """Regex'ed name -> "name_regex" (keep the original), unless added already (e.g. chunk by chunk)"""
+    if COLUMN_NAME_REGEX in df_eating.columns:
+        return {COLUMN_NAME_REGEX: df_eating[COLUMN_NAME_REGEX]}
+    return {COLUMN_NAME_REGEX: regex_foodstuff_name(df_eating[COLUMN_NAME])}
+
+
+
+def _make_symptom_flags(df_eating, df_symptoms, shared):
+    """Symptoms on the day of the meal / on the next day: the days of the meals are looked up in the days with symptoms"""
+    days, valid_days = _shared(shared, 'days', _to_day_numbers, df_eating[COLUMN_DATE])
+    symptom_days, valid_symptom_days = _to_day_numbers(df_symptoms[COLUMN_DATE])
+    symptom_days = np.unique(symptom_days[valid_symptom_days])
+    return {COLUMN_SYMPTOM_SAME_DAY: valid_days & (_lookup(symptom_days, days) >= 0),
+            COLUMN_SYMPTOM_NEXT_DAY: valid_days & (_lookup(symptom_days, days + 1) >= 0)}
+
+
+
+def _make_symptoms(df_eating, df_symptoms, shared):
+    """The symptoms after a meal, concatenated in the order of the rows (NaN for the meals without symptoms afterwards)"""
+    i, valid_symptoms, order, starts = _shared(shared, 'groups', _group_symptoms_by_meal, df_eating, df_symptoms)
+    symptoms = df_symptoms[COLUMN_SYMPTOM].to_numpy(dtype=object)[valid_symptoms][order]
+
+    dtype = df_symptoms[COLUMN_SYMPTOM].dtype
+    symptoms_agg = Series([", ".join(group) for group in np.split(symptoms, starts[1:])] if len(starts) else [],
+                          dtype=dtype.categories.dtype if isinstance(dtype, CategoricalDtype) else dtype)
+    return {COLUMN_SYMPTOMS: Series(symptoms_agg.array.take(i, allow_fill=True), index=df_eating.index)}
+
+
+
+def _make_avg_grade(df_eating, df_symptoms, shared):
+    """The mean grade of the symptoms after a meal (NaN for the meals without symptoms afterwards)"""
+    i, valid_symptoms, order, starts = _shared(shared, 'groups', _group_symptoms_by_meal, df_eating, df_symptoms)
+    grades = to_numeric(df_symptoms[COLUMN_GRADE]).to_numpy(dtype='float64', na_value=np.nan)[valid_symptoms][order]
+
+    has_grade = ~np.isnan(grades)
+    sums = np.add.reduceat(np.where(has_grade, grades, 0), starts) if len(starts) else np.zeros(0)
+    counts = np.add.reduceat(has_grade.astype('int64'), starts) if len(starts) else np.zeros(0)
+    grades_agg = np.divide(sums, counts, out=np.full(len(sums), np.nan), where=counts > 0)
+    return {COLUMN_AVG_GRADE: np.where(i >= 0, np.append(grades_agg, np.nan)[i], np.nan)}
+
+
+
+def _group_symptoms_by_meal(df_eating, df_symptoms):
     """
-    Regex for the foodstuff name column
+    The symptoms keyed by (day, meal code) - i.e. no merge of the whole df.
 
-    Arguments:
-        sr: pandas.Series
     Returns:
-        pandas.Series
+        (the group of each eating row (-1: none), mask of the symptoms with a key, their order by key, the starts of the groups)
+    """
+    if COLUMN_MEAL not in df_symptoms.columns:
+        df_symptoms = df_symptoms.assign(**{COLUMN_MEAL: df_symptoms[COLUMN_TIMING].map(MEAL_OF_TIMING)})
+    keys_symptoms, valid_symptoms = _make_day_meal_keys(df_symptoms)
+    keys_eating, valid_eating = _make_day_meal_keys(df_eating)
+
+    order = np.argsort(keys_symptoms[valid_symptoms], kind='stable')
+    unique_keys, starts = np.unique(keys_symptoms[valid_symptoms][order], return_index=True)
+    i = np.where(valid_eating, _lookup(unique_keys, keys_eating), -1)
+    return (i, valid_symptoms, order, starts)
+
+
+
+# The engineered columns of the eating data (in this order) and the functions which make them
+# (a function can make several columns, the intermediate results of a load are shared, see `_shared`)
+ENGINEERED_COLUMNS = {COLUMN_WEEKDAY: _make_weekday,
+                      COLUMN_NAME_REGEX: _make_name_regex,
+                      COLUMN_SYMPTOM_SAME_DAY: _make_symptom_flags,
+                      COLUMN_SYMPTOM_NEXT_DAY: _make_symptom_flags,
+                      COLUMN_SYMPTOMS: _make_symptoms,
+                      COLUMN_AVG_GRADE: _make_avg_grade}
+
+
+
+def _rearrange_columns(df_eating):
+    """weekday and name_regex next to date and name (for visual appeal in the debug tables)"""
+    columns = [column for column in df_eating.columns if column not in (COLUMN_WEEKDAY, COLUMN_NAME_REGEX)]
+    if COLUMN_NAME_REGEX in df_eating.columns:
+        columns.insert(5, COLUMN_NAME_REGEX)   # 5 = the index, where to put the new column
+    if COLUMN_WEEKDAY in df_eating.columns:
+        columns.insert(2, COLUMN_WEEKDAY)
+    return df_eating.reindex(columns=columns)
+
+
+
+class LazyEatingData():
+    """
+    The eating data whose engineered columns (ENGINEERED_COLUMNS) are computed on demand (LAZY_COLUMNS on constants.py):
+    each the first time it is asked for by `get`, then kept for the next callers (e.g. in the cache).
+    So an account load only costs what the units of the layout display (see UNIT_COLUMNS on units.py).
+
+    The kept columns are never changed (`get` returns a new df each time),
+    so the object can be shared by the callbacks (threads), `copy` returns the object itself.
+    """
+
+    def __init__(self, df_eating, df_symptoms):
+        df_eating = df_eating.reset_index(drop=True)
+        self._columns = {}                 # column -> values (the index of self.df)
+        self._lock = Lock()                # the callbacks can run in threads
+
+        # The regex'ed names fetched/added already (see `clean_eating_data`) count as computed
+        if COLUMN_NAME_REGEX in df_eating.columns:
+            self._columns[COLUMN_NAME_REGEX] = df_eating.pop(COLUMN_NAME_REGEX)
+
+        self.df = df_eating                # without engineered columns
+        self.df_symptoms = df_symptoms
+
+    def get(self, columns=None):
+        """
+        Returns the eating data with the engineered columns (in the order of ENGINEERED_COLUMNS), None = all of them.
+        The columns not computed yet are computed now.
+        Raises KeyError for the columns which are not engineered columns.
+        """
+        columns = list(ENGINEERED_COLUMNS) if columns is None else columns
+        unknown = [column for column in columns if column not in ENGINEERED_COLUMNS]
+        if unknown:
+            raise KeyError(f"{ERR_PREFIX}not engineered columns: {unknown}")
+
+        with self._lock:
+            shared = {}
+            for make_columns in dict.fromkeys(ENGINEERED_COLUMNS[column] for column in columns
+                                              if column not in self._columns):
+                self._compute(make_columns, shared)
+            df_eating = self.df.assign(**{column: self._columns[column] for column in ENGINEERED_COLUMNS
+                                          if column in columns})
+
+        # rearrange columns for visual appeal (in debug mode only)
+        return _rearrange_columns(df_eating) if DEBUG else df_eating
+
+    def _compute(self, make_columns, shared):
+        df = DataFrame(make_columns(self.df, self.df_symptoms, shared), index=self.df.index)
+        if COMPACT_SCHEMA:
+            df = apply_compact_schema(df)
+        self._columns.update(df.items())
+
+    @property
+    def computed_columns(self):
+        with self._lock:
+            return [column for column in ENGINEERED_COLUMNS if column in self._columns]
+
+    def copy(self, deep=True):
+        return self
+
+    def memory_usage(self, deep=True):
+        """The bytes of the columns (as pandas.DataFrame.memory_usage), including the engineered columns computed so far"""
+        with self._lock:
+            memory = {column: sr.memory_usage(index=False, deep=deep) for column, sr in self._columns.items()}
+        return concat([self.df.memory_usage(deep=deep), Series(memory, dtype='int64')])
+
+    def __getstate__(self):   # pickled (e.g. CACHE_DIR) without the lock
+        return {key: value for key, value in self.__dict__.items() if key != '_lock'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self.df)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self)} rows, computed: {self.computed_columns})"
+
+
+
+def _to_day_numbers(sr):
+    """Returns (days since 1970-01-01 as int64, mask of the valid dates) of a datetime column"""
+    days = sr.to_numpy(dtype='datetime64[D]')
+    valid = ~np.isnat(days)
+    return (np.where(valid, days.view('int64'), 0), valid)
+
+
+
+def _lookup(sorted_values, values):
+    """
+    The position of each value in sorted_values (unique integers), -1 if not found - no hashing:
+    a table over the range of sorted_values (days, i.e. small), or a binary search if the range is too wide
     """
+    if len(sorted_values) == 0:
+        return np.full(len(values), -1)
+
+    low, high = sorted_values[0], sorted_values[-1]
+    if high - low < LOOKUP_TABLE_MAX_SIZE:
+        table = np.full(high - low + 1, -1)
+        table[sorted_values - low] = np.arange(len(sorted_values))
+        inside = (values >= low) & (values <= high)
+        return np.where(inside, table[np.where(inside, values - low, 0)], -1)
+
+    i = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return np.where(sorted_values[i] == values, i, -1)
+
+
+
+def _make_day_meal_keys(df):
+    """Returns (day * 4 + meal code, mask of the valid keys), i.e. one integer for (date, meal) of each row"""
+    days, valid = _to_day_numbers(df[COLUMN_DATE])
+    codes, meals = factorize(df[COLUMN_MEAL])   # each distinct meal hashed once, then its position on MEALS_MAPPING
+    codes = np.where(codes >= 0, np.append(Index(list(MEALS_MAPPING)).get_indexer(meals), -1)[codes], -1)   # -1: no meal
+    return (days * 4 + codes, valid & (codes >= 0))
+
+
+
+def add_columns_to_symptoms_data(df_eating, df_symptoms):
+    """The meal the symptoms refer to (a new df)"""
+    return df_symptoms.assign(**{COLUMN_MEAL: df_symptoms[COLUMN_TIMING].map(MEAL_OF_TIMING)})
+
+
 
+def apply_compact_schema(df):
+    """
+    Returns the df with compact dtypes (see COMPACT_SCHEMA on constants.py):
+    meal and timing as ordered categoricals (in the order of the day, unknown values are appended),
+    the names and symptoms as categoricals, the ids as the smallest int type which fits (Int32 etc. with missing values),
+    weekday as int8, grade and avg_grade as float32 (not int8: they have missing values)
+    """
+    columns = {}
+    for column in df.columns:
+        sr = df[column]
+        if column in ORDERED_CATEGORIES:
+            known = ORDERED_CATEGORIES[column]
+            extra = sorted(set(sr.dropna().unique()).difference(known))
+            columns[column] = sr.astype(CategoricalDtype(known + extra, ordered=True))
+        elif column in CATEGORIES:
+            columns[column] = sr.astype('category')
+        elif column in IDS:
+            columns[column] = _downcast_ids(sr)
+        elif column == COLUMN_WEEKDAY:
+            columns[column] = sr.astype('int8')
+        elif column in FLOATS:
+            columns[column] = sr.astype('float32')
+    return df.assign(**columns)
+
+
+
+def _downcast_ids(sr):
+    """The ids as the smallest (signed) int type which fits, nullable (Int8 ... Int64) if there are missing values"""
+    if sr.isna().any():
+        dtype = to_numeric(sr.dropna(), downcast='integer').dtype if sr.notna().any() else np.dtype('int8')
+        return sr.astype(dtype.name.capitalize())   # e.g. int16 -> Int16
+    return to_numeric(sr, downcast='integer')
+
+
+
+def _make_foodstuff_name_pattern():
+    """The regex for the foodstuff name column (quantities, measure words etc. at the start of the name)"""
     measure_words = (r"((Tasse|Scheibe|Flasche|Dose|Kanne|Prise|Kugel|Tüte)n?)|((Packung|Verpackung|Portion)(en)?)|"
                      r"Glass|Glas|Gläser|Becher|Teller|Esslöffel|Teelöffel|Stück|Stücke|Schluck|Schlücke|Handvoll|Hand|"
                      r"Kilogramm|Kilogram|Milligramm|Milligram|Miligramm|Miligram|Gramm|Gram|Kilo|Liter|Litre")
@@ -145,5 +702,50 @@ def regex_foodstuff_name(sr):
     p += r"|((halb|klein|groß)(es|er|en|e)\s)"
     p += r"|(%s)" % measure_words
     
-    precompiled_pattern = re.compile(p, re.IGNORECASE)
-    return sr.str.strip().str.replace(precompiled_pattern, '', regex=True).str.strip().str.lower().str.title()
+    return re.compile(p, re.IGNORECASE)
+
+
+# Compiled once (see `regex_foodstuff_name`)
+FOODSTUFF_NAME_PATTERN = _make_foodstuff_name_pattern()
+
+# Process-wide memo of the regex'ed names: raw name -> regex'ed name (shared by all accounts and threads)
+# the oldest names are dropped when it holds more than NAME_MEMO_MAX_SIZE names
+_name_memo = {}
+_name_memo_lock = Lock()
+
+
+
+def regex_foodstuff_name(sr):
+    """
+    Regex for the foodstuff name column
+
+    The regex runs once per distinct name (factorize), and only for the names which are not in the memo yet
+    (an account has a few hundred distinct names on thousands of rows, most of them known from other accounts).
+
+    Arguments:
+        sr: pandas.Series
+    Returns:
+        pandas.Series (same index and dtype as sr, a categorical sr: new categories of the regex'ed names)
+    """
+    codes, uniques = factorize(sr)   # NaN -> -1
+    uniques = list(uniques)
+
+    with _name_memo_lock:
+        cleaned = [_name_memo.get(name) for name in uniques]
+    missing = [name for name, value in zip(uniques, cleaned) if value is None]
+
+    if missing:
+        values = (Series(missing, dtype=object).str.strip().str.replace(FOODSTUFF_NAME_PATTERN, '', regex=True)
+                  .str.strip().str.lower().str.title().tolist())
+        new = dict(zip(missing, values))
+        cleaned = [new[name] if value is None else value for name, value in zip(uniques, cleaned)]
+
+        with _name_memo_lock:
+            _name_memo.update(new)
+            for name in list(islice(_name_memo, max(0, len(_name_memo) - NAME_MEMO_MAX_SIZE))):
+                del _name_memo[name]
+
+    values = np.array(cleaned + [np.nan], dtype=object)[codes]   # -1 -> the last item (NaN)
+    if isinstance(sr.dtype, CategoricalDtype):   # COMPACT_SCHEMA: the regex'ed names aren't among the categories
+        return Series(values, index=sr.index, name=sr.name, dtype='category')
+    return Series(values, index=sr.index, name=sr.name, dtype=sr.dtype if sr.dtype != object else object)
@@ -0,0 +1,166 @@
+"""
+Local snapshots of the accounts' data on disk (one Feather file per account and table)
+
+The long tables are stored as they are fetched from the database (i.e. before cleaning).
+On a load only the meals and reports added since the snapshot was taken are fetched
+(ids above the snapshot's high-water marks) and appended to the snapshot.
+The snapshots are read memory-mapped (uncompressed Arrow IPC files),
+i.e. the numeric columns are not copied into memory.
+
+requires: pip install pyarrow
+"""
+
+import os
+import json
+from threading import get_ident
+from pandas import DataFrame, concat, to_datetime
+from data_access import load_account, fetch_change_token
+from constants import ERR_PREFIX, SNAPSHOT_DIR, MEALS_MAPPING
+from constants import COLUMN_DATE, COLUMN_MEAL, COLUMN_MEAL_ID, COLUMN_FOODSTUFF_ID, COLUMN_TIMING
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:
+    pa = feather = None
+
+
+# Names of the two tables of an account (used in the file names)
+EATING = 'eating'
+SYMPTOMS = 'symptoms'
+
+# The order of the rows within a day (as in the ORDER BY of the queries on data_access.py)
+TIMINGS_ORDER = ['AFTER_GETTING_UP', 'AFTER_BREAKFAST', 'AFTER_LUNCH', 'AFTER_DINNER', 'UNKNOWN']
+
+
+
+def load_account_from_snapshot(account_id, engine=None, token=None, directory=SNAPSHOT_DIR):
+    """
+    Same as `load_account` on data_access.py, but the data comes from the local snapshot
+    which is synchronized with the database first:
+     - the snapshot is up to date (the same change token) -> no data is fetched
+     - meals/reports were added -> only the new rows are fetched and appended
+     - anything else (no snapshot, rows deleted or foodstuffs added to an old meal) -> everything is fetched
+
+    Args:
+        token: the change token of the account if it was fetched already (see `fetch_change_token`)
+
+    Returns:
+        (status, df_eating, df_symptoms) as returned by `load_account`
+    """
+    if feather is None:
+        raise ImportError(f"{ERR_PREFIX}the snapshots (SNAPSHOT_DIR) require pyarrow: pip install pyarrow")
+
+    # Has the data of the account changed?
+    if token is None:
+        status, token = fetch_change_token(account_id, engine)  # in data_access.py
+        if status is not True:
+            return (status, None, None)
+
+    account_id = int(account_id)
+    snapshot = read_snapshot(account_id, directory)  # None or (token, df_eating, df_symptoms)
+
+    # Up to date
+    if snapshot and snapshot[0] == token:
+        return (True, *snapshot[1:])
+
+    # Append the rows added since the snapshot was taken (None if not possible)
+    dataframes = _fetch_and_append_delta(account_id, engine, snapshot, token) if snapshot else None
+
+    # Fetch everything
+    if dataframes is None:
+        status, *dataframes = load_account(account_id, engine)  # in data_access.py
+        if status is not True:
+            return (status, None, None)
+
+    write_snapshot(account_id, token, *dataframes, directory=directory)
+    return (True, *dataframes)
+
+
+
+def _fetch_and_append_delta(account_id, engine, snapshot, token):
+    """
+    Fetches the meals/reports with ids above the high-water marks of the snapshot (up to the marks of the token)
+    and appends them to the snapshot's df's.
+    Returns None if rows other than new meals/reports have changed (i.e. the counts don't add up).
+    """
+    (n_meals_old, max_meal_id_old, n_meal_foodstuffs_old, n_reports_old, max_report_id_old), df_eating, df_symptoms = snapshot
+    n_meals, max_meal_id, n_meal_foodstuffs, n_reports, max_report_id = token
+
+    status, df_eating_delta, df_symptoms_delta = load_account(account_id, engine,
+                                                             meal_id_range=(max_meal_id_old or 0, max_meal_id or 0),
+                                                             report_id_range=(max_report_id_old or 0, max_report_id or 0))
+    # No new rows
+    if status is not True:
+        df_eating_delta, df_symptoms_delta = df_eating.iloc[:0], df_symptoms.iloc[:0]
+
+    # Only rows added? (otherwise the counts in the token won't add up)
+    counts = (n_meals_old + df_eating_delta[COLUMN_MEAL_ID].nunique(),
+              n_meal_foodstuffs_old + int(df_eating_delta[COLUMN_FOODSTUFF_ID].notna().sum()),
+              n_reports_old + len(df_symptoms_delta))
+    if counts != (n_meals, n_meal_foodstuffs, n_reports):
+        return None
+
+    # infer_objects: a column with NULL's only (object) gets the type of the new values
+    df_eating = concat([df_eating, df_eating_delta], ignore_index=True).infer_objects()
+    df_symptoms = concat([df_symptoms, df_symptoms_delta], ignore_index=True).infer_objects()
+
+    # New entries can be back-dated -> sort (stable, i.e. the older ids stay first within a meal/timing)
+    df_eating = _sort_rows(df_eating, COLUMN_MEAL, list(MEALS_MAPPING.keys()))
+    df_symptoms = _sort_rows(df_symptoms, COLUMN_TIMING, TIMINGS_ORDER)
+    return (df_eating, df_symptoms)
+
+
+
+def _sort_rows(df, column, order):
+    """Sorts the rows by date and by the order of the values in the column (as in the ORDER BY of the queries)"""
+    keys = DataFrame({COLUMN_DATE: to_datetime(df[COLUMN_DATE]),
+                      column: df[column].map({value: i for i, value in enumerate(order)}).fillna(len(order))})
+    return df.loc[keys.sort_values([COLUMN_DATE, column], kind='stable').index].reset_index(drop=True)
+
+
+
+def _get_path(account_id, table, directory):
+    return os.path.join(directory, f"{account_id}_{table}.feather")
+
+
+
+def read_snapshot(account_id, directory=SNAPSHOT_DIR):
+    """
+    Reads the snapshot of the account (memory-mapped).
+
+    Returns:
+        (token, df_eating, df_symptoms) or None (no snapshot or the two files are from different syncs)
+    """
+    tokens, dataframes = [], []
+    for table in (EATING, SYMPTOMS):
+        try:
+            arrow_table = feather.read_table(_get_path(account_id, table, directory), memory_map=True)
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        tokens.append(json.loads(arrow_table.schema.metadata[b'token']))
+        dataframes.append(arrow_table.to_pandas(split_blocks=True))   # split_blocks: avoids consolidating (copying) the columns
+
+    if tokens[0] != tokens[1]:
+        return None
+    return (tuple(tokens[0]), *dataframes)
+
+
+
+def write_snapshot(account_id, token, df_eating, df_symptoms, directory=SNAPSHOT_DIR):
+    """
+    Writes the snapshot of the account, the change token is stored in the metadata of each file.
+    Each file is written into a temporary file first and then renamed (atomic),
+    so that the readers (other threads or processes) never see a half-written file.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    for table, df in [(EATING, df_eating), (SYMPTOMS, df_symptoms)]:
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = {**(arrow_table.schema.metadata or {}), b'token': json.dumps(list(token)).encode()}
+        arrow_table = arrow_table.replace_schema_metadata(metadata)
+
+        path = _get_path(account_id, table, directory)
+        path_temp = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+        feather.write_feather(arrow_table, path_temp, compression='uncompressed')  # uncompressed -> memory-mappable
+        os.replace(path_temp, path)
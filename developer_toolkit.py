@@ -65,7 +65,20 @@ def get_dash_components_from_unit(unit):
     
 
 
-def get_callback_args(unit, parent):
+def get_columns_needed(unit_columns, units=None):
+    """
+    The engineered columns of the eating data which the units need (without duplicates)
+
+    Args:
+        unit_columns: dict (the id of a unit -> list of columns), see UNIT_COLUMNS on units.py
+        units: the units (e.g. the layout of the app), None = all units of unit_columns
+    """
+    ids = unit_columns.keys() if units is None else [getattr(unit, 'id', None) for unit in units]
+    return list(dict.fromkeys(column for id in ids for column in unit_columns.get(id, [])))
+
+
+
+def get_callback_args(unit, parent, stores=None):
     """
     A helper function to make the decorating of a callback function easy.
 
@@ -88,12 +101,15 @@ def get_callback_args(unit, parent):
     Arguments:
         unit: ...
         parent: unit or None
+        stores: ids of the "store" dash-components (None = the three df's)
     """
 
+    stores = stores or ['store_1',   # df_eating
+                        'store_2',   # df_symptomreprot
+                        'store_3']   # df_diary
+
     collector = [[], 
-                 [Input(component_id='store_1', component_property='data'),  # df_eating
-                  Input(component_id='store_2', component_property='data'),  # df_symptomreprot
-                  Input(component_id='store_3', component_property='data')], # df_diary
+                 [Input(component_id=store, component_property='data') for store in stores],
                  [], []]
     
     for e in get_dash_components_from_unit(unit):
@@ -126,19 +142,21 @@ def get_callback_args(unit, parent):
 
 
 
-def make_handy_namespace(components):
+def make_handy_namespace(components, stores=None):
     """
     collections.namedtuple or typing.NamedTuple
     won't do the job - not possible to create them dynamically AND use indexing AND be mutable
+
+    stores: the attribute names of the "store" dash-components (None = the three json's, see `get_callback_args`)
     """
 
     class Components():
         def __init__(self, components):
             self.__dict__['list'] = list(components)
-            attributes = [
+            attributes = (stores or [
                   "json_eating",   # comment
                   "json_symptomreport",  # comment
-                  "json_diary",
+                  "json_diary"]) + [
                   "start_date", 
                   "end_date", 
                   "timespan_dropdown",  # comment
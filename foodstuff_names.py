@@ -0,0 +1,134 @@
+"""
+The foodstuff_name table: the regex'ed name of each foodstuff stored in the database
+(see `regex_foodstuff_name` on data_processing.py), so that the account loads select it
+instead of running the regex over every eating row (STORED_FOODSTUFF_NAMES on constants.py, see `fetch_eating_data`).
+
+The refresh is incremental: the name the regex was applied to is stored along with the result,
+only the foodstuffs which are new or whose name differs are processed (each distinct name once).
+Note: after a change of the regex run a full refresh.
+
+$ python foodstuff_names.py --create     # create the table (once)
+$ python foodstuff_names.py              # process the new/changed foodstuffs (e.g. every few minutes from cron)
+$ python foodstuff_names.py --full       # reprocess all foodstuffs
+"""
+
+from time import perf_counter
+from argparse import ArgumentParser
+from sqlalchemy import text, bindparam
+from pandas import DataFrame
+from data_access import get_sqlalchemy_engine, pooled_connection
+from data_processing import regex_foodstuff_name
+from constants import DEBUG, SCHEMA, TABLE_FOODSTUFF, TABLE_FOODSTUFF_NAME
+from constants import COLUMN_FOODSTUFF_ID, COLUMN_NAME, COLUMN_NAME_REGEX
+
+
+# Foodstuffs written per transaction
+REFRESH_BATCH_SIZE = 10_000
+
+
+
+def create_table(engine=None):
+    """Creates the foodstuff_name table (if it doesn't exist)"""
+    with pooled_connection(engine) as connection:
+        connection.execute(text(f"""
+CREATE TABLE IF NOT EXISTS {SCHEMA}.{TABLE_FOODSTUFF_NAME} (
+	{COLUMN_FOODSTUFF_ID} INTEGER PRIMARY KEY,
+	{COLUMN_NAME} TEXT,
+	{COLUMN_NAME_REGEX} TEXT,
+	refreshed_at TIMESTAMP NOT NULL
+)"""))
+        connection.commit()
+
+
+
+def fetch_changed_foodstuffs(connection, full=False):
+    """
+    The foodstuffs which haven't been processed or whose name differs from the name stored at their last refresh.
+    All foodstuffs if full is True.
+
+    Returns:
+        pandas.DataFrame with the columns foodstuff_id, name
+    """
+    # All foodstuffs or only the changed ones
+    where = "" if full else \
+        f"WHERE s.{COLUMN_FOODSTUFF_ID} IS NULL OR s.{COLUMN_NAME} IS DISTINCT FROM f.{COLUMN_NAME}"
+    query = f"""
+SELECT f.{COLUMN_FOODSTUFF_ID}, f.{COLUMN_NAME}
+FROM {SCHEMA}.{TABLE_FOODSTUFF} f
+LEFT JOIN {SCHEMA}.{TABLE_FOODSTUFF_NAME} s ON s.{COLUMN_FOODSTUFF_ID} = f.{COLUMN_FOODSTUFF_ID}
+{where}
+ORDER BY f.{COLUMN_FOODSTUFF_ID}
+;"""
+    rows = connection.execute(text(query)).all()
+    return DataFrame(rows, columns=[COLUMN_FOODSTUFF_ID, COLUMN_NAME])
+
+
+
+def refresh_foodstuffs(connection, df):
+    """
+    Stores the regex'ed names of the foodstuffs (one transaction), the regex runs once per distinct name.
+
+    Args:
+        df: the foodstuffs as returned by `fetch_changed_foodstuffs`
+    """
+    names = df[COLUMN_NAME].dropna().drop_duplicates()
+    df = df.assign(**{COLUMN_NAME_REGEX: df[COLUMN_NAME].map(dict(zip(names, regex_foodstuff_name(names))))})
+    rows = df.astype(object).where(df.notna(), None).to_dict('records')   # NaN -> NULL
+
+    # Bound parameters (expanding: foodstuff_id IN (...))
+    user_input = {'foodstuff_ids': df[COLUMN_FOODSTUFF_ID].tolist()}
+    foodstuff_ids = bindparam('foodstuff_ids', expanding=True)
+
+    connection.execute(text(f"DELETE FROM {SCHEMA}.{TABLE_FOODSTUFF_NAME} WHERE {COLUMN_FOODSTUFF_ID} IN :foodstuff_ids")
+                       .bindparams(foodstuff_ids), user_input)
+    connection.execute(text(f"""INSERT INTO {SCHEMA}.{TABLE_FOODSTUFF_NAME}
+                                    ({COLUMN_FOODSTUFF_ID}, {COLUMN_NAME}, {COLUMN_NAME_REGEX}, refreshed_at)
+                                VALUES (:{COLUMN_FOODSTUFF_ID}, :{COLUMN_NAME}, :{COLUMN_NAME_REGEX}, CURRENT_TIMESTAMP)"""),
+                       rows)  # executemany
+
+
+
+def refresh_foodstuff_names(engine=None, full=False, batch_size=REFRESH_BATCH_SIZE):
+    """
+    Refreshes the foodstuff_name table for the foodstuffs which are new or have been renamed since the last refresh
+    (all foodstuffs if full is True), batch_size foodstuffs per transaction.
+    The rows of deleted foodstuffs are deleted.
+
+    Returns:
+        the number of refreshed foodstuffs
+    """
+    engine = engine or get_sqlalchemy_engine()
+
+    with pooled_connection(engine) as connection:
+        df = fetch_changed_foodstuffs(connection, full)
+
+        connection.execute(text(f"""DELETE FROM {SCHEMA}.{TABLE_FOODSTUFF_NAME} WHERE {COLUMN_FOODSTUFF_ID} NOT IN
+                                    (SELECT {COLUMN_FOODSTUFF_ID} FROM {SCHEMA}.{TABLE_FOODSTUFF})"""))
+        connection.commit()
+
+    for i in range(0, len(df), batch_size):
+        with pooled_connection(engine) as connection:
+            refresh_foodstuffs(connection, df.iloc[i:i+batch_size])
+            connection.commit()
+
+        if DEBUG:
+            print(f"foodstuff_name: {min(i + batch_size, len(df))}/{len(df)} foodstuffs refreshed")
+
+    return len(df)
+
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description="creates/refreshes the foodstuff_name table")
+    parser.add_argument('--create', action='store_true', help="create the table (if it doesn't exist)")
+    parser.add_argument('--full', action='store_true', help="reprocess all foodstuffs")
+    parser.add_argument('--batch-size', type=int, default=REFRESH_BATCH_SIZE, help="foodstuffs per transaction")
+    args = parser.parse_args()
+
+    if args.create:
+        create_table()
+
+    time_start = perf_counter()
+    n = refresh_foodstuff_names(full=args.full, batch_size=args.batch_size)
+    print(f"foodstuff_name: {n} foodstuffs refreshed in {perf_counter() - time_start:.1f} s")
@@ -0,0 +1,174 @@
+"""
+Index advisor: checks the indexes in SCHEMA against the access paths of the queries on data_access.py
+and makes the missing ones (the migration DDL).
+
+The queries filter by account_id and sort by date (the CASE on meal/timing only sorts the rows within a day),
+the eating data joins meal_foodstuff and foodstuff on their ids.
+A composite index (account_id, date) serves the WHERE and the ORDER BY (and MIN/MAX of the dates) at once,
+the INCLUDE columns make it covering on postgres, i.e. an index-only scan (the table itself is not read).
+sqlite (the stand-in database on benchmarks.py) has no INCLUDE, the columns are appended to the key instead.
+
+$ python index_advisor.py            # reports the missing indexes
+$ python index_advisor.py --sql      # prints the migration DDL (e.g. > migration.sql)
+$ python index_advisor.py --create   # makes the missing indexes (CONCURRENTLY on postgres, i.e. without locking the tables)
+"""
+
+from argparse import ArgumentParser
+from sqlalchemy import inspect, text
+from data_access import get_sqlalchemy_engine
+from constants import SCHEMA
+from constants import TABLE_ACCOUNT, TABLE_MEAL, TABLE_MEAL_FOODSTUFF, TABLE_FOODSTUFF, TABLE_REPORT, TABLE_DAILY_SUMMARY
+from constants import TABLE_FOODSTUFF_NAME, COLUMN_NAME_REGEX
+from constants import (COLUMN_ACCOUNT_ID, COLUMN_MEAL_ID, COLUMN_DATE, COLUMN_MEAL, COLUMN_FOODSTUFF_ID,
+                       COLUMN_REPORT_ID, COLUMN_SYMPTOM, COLUMN_GRADE, COLUMN_TIMING)
+
+
+# The indexes the queries rely on: key columns (in this order), included columns (covering) and what they serve
+# A primary key or any index which starts with the key columns will do
+INDEXES = [
+    {'name': 'ix_account_account_id', 'table': TABLE_ACCOUNT,
+     'columns': [COLUMN_ACCOUNT_ID], 'include': [],
+     'queries': "check_account, fetch_change_token"},
+    {'name': 'ix_meal_account_date', 'table': TABLE_MEAL,
+     'columns': [COLUMN_ACCOUNT_ID, COLUMN_DATE], 'include': [COLUMN_MEAL_ID, COLUMN_MEAL],
+     'queries': "fetch_eating_data, load_account, fetch_date_range, fetch_statistics, fetch_change_token"},
+    {'name': 'ix_meal_foodstuff_meal_foodstuff', 'table': TABLE_MEAL_FOODSTUFF,
+     'columns': [COLUMN_MEAL_ID, COLUMN_FOODSTUFF_ID], 'include': [],
+     'queries': "the join of fetch_eating_data/load_account, fetch_change_token"},
+    {'name': 'ix_foodstuff_foodstuff_id', 'table': TABLE_FOODSTUFF,
+     'columns': [COLUMN_FOODSTUFF_ID], 'include': [],
+     'queries': "the join of fetch_eating_data/load_account"},
+    {'name': 'ix_report_account_date', 'table': TABLE_REPORT,
+     'columns': [COLUMN_ACCOUNT_ID, COLUMN_DATE], 'include': [COLUMN_TIMING, COLUMN_SYMPTOM, COLUMN_GRADE, COLUMN_REPORT_ID],
+     'queries': "fetch_symptoms_data, load_account, fetch_date_range, fetch_statistics, fetch_change_token"},
+    {'name': 'ix_foodstuff_name_foodstuff_id', 'table': TABLE_FOODSTUFF_NAME,
+     'columns': [COLUMN_FOODSTUFF_ID], 'include': [COLUMN_NAME_REGEX],
+     'queries': "the join of fetch_eating_data/load_account (STORED_FOODSTUFF_NAMES)"},
+    {'name': 'ix_daily_summary_account_date', 'table': TABLE_DAILY_SUMMARY,
+     'columns': [COLUMN_ACCOUNT_ID, COLUMN_DATE], 'include': [],
+     'queries': "fetch_daily_summary, fetch_statistics (DAILY_SUMMARY)"},
+]
+
+# The status of an index (see `check_indexes`)
+OK = 'ok'
+NOT_COVERING = 'not covering'   # an index with the key columns exists, but without the included columns
+MISSING = 'missing'
+NO_TABLE = 'no table'           # e.g. daily_summary or foodstuff_name hasn't been created
+
+# The migration DDL
+SQL_CREATE_INDEX = {'postgresql': "CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {schema}.{table} ({columns}){include};",
+                    'sqlite': "CREATE INDEX IF NOT EXISTS {schema}.{name} ON {table} ({columns});"}
+
+
+
+def _get_existing_indexes(inspector, table):
+    """Returns a list of (name, key columns, included columns) of the primary key and the indexes of the table"""
+    existing = []
+
+    primary_key = inspector.get_pk_constraint(table, schema=SCHEMA)
+    if primary_key.get('constrained_columns'):
+        existing.append((primary_key.get('name') or 'primary key', primary_key['constrained_columns'], []))
+
+    for index in inspector.get_indexes(table, schema=SCHEMA):
+        include = index.get('dialect_options', {}).get('postgresql_include', [])
+        existing.append((index['name'], [column for column in index['column_names'] if column], include))
+    return existing
+
+
+
+def check_indexes(engine=None, indexes=INDEXES):
+    """
+    Checks which of the indexes exist in SCHEMA (by their columns, not by their names).
+
+    Returns:
+        list of (index, status, name of the existing index or None) in the order of indexes
+        status: OK, NOT_COVERING, MISSING or NO_TABLE
+    """
+    engine = engine or get_sqlalchemy_engine()
+    inspector = inspect(engine)
+
+    report = []
+    for index in indexes:
+        if not inspector.has_table(index['table'], schema=SCHEMA):
+            report.append((index, NO_TABLE, None))
+            continue
+
+        status, match = MISSING, None
+        n = len(index['columns'])
+        for name, columns, include in _get_existing_indexes(inspector, index['table']):
+            if columns[:n] != index['columns']:
+                continue
+            # The included columns can be key columns too (e.g. on sqlite)
+            if set(index['include']) <= set(columns) | set(include):
+                status, match = OK, name
+                break
+            status, match = NOT_COVERING, name
+        report.append((index, status, match))
+    return report
+
+
+
+def _make_create_index_sql(dialect_name, index):
+    if dialect_name == 'postgresql':
+        columns, include = index['columns'], index['include']
+    else:
+        columns, include = index['columns'] + index['include'], []
+
+    sql = SQL_CREATE_INDEX.get(dialect_name, SQL_CREATE_INDEX['postgresql'])
+    return sql.format(name=index['name'], schema=SCHEMA, table=index['table'], columns=", ".join(columns),
+                      include=f" INCLUDE ({', '.join(include)})" if include else "")
+
+
+
+def make_migration_sql(dialect_name, indexes=INDEXES):
+    """Returns the DDL which makes the indexes (for the dialect, e.g. 'postgresql')"""
+    return "".join(f"-- {index['queries']}\n{_make_create_index_sql(dialect_name, index)}\n" for index in indexes)
+
+
+
+def create_indexes(engine=None, indexes=None):
+    """
+    Makes the missing (and the not covering) indexes.
+    On postgres CONCURRENTLY, i.e. outside of a transaction (AUTOCOMMIT) and without blocking writes.
+
+    Returns:
+        list of the indexes made
+    """
+    engine = engine or get_sqlalchemy_engine()
+
+    if indexes is None:
+        indexes = [index for index, status, _ in check_indexes(engine) if status in (MISSING, NOT_COVERING)]
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        for index in indexes:
+            connection.execute(text(_make_create_index_sql(connection.dialect.name, index)))
+    return indexes
+
+
+
+def print_index_report(engine=None):
+    """Prints the indexes which are missing or not covering (e.g. on the app's start in the DEBUG mode)"""
+    for index, status, match in check_indexes(engine):
+        if status == MISSING:
+            print(f"index missing: {index['table']} ({', '.join(index['columns'])}) - for {index['queries']}")
+        elif status == NOT_COVERING:
+            print(f"index not covering: {match} on {index['table']} without {', '.join(index['include'])}")
+
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description="checks the indexes in SCHEMA for the queries on data_access.py")
+    parser.add_argument('--sql', action='store_true', help="print the migration DDL")
+    parser.add_argument('--dialect', help="the dialect of the DDL (default: of the database)")
+    parser.add_argument('--create', action='store_true', help="make the missing indexes")
+    args = parser.parse_args()
+
+    if args.sql:
+        print(make_migration_sql(args.dialect or get_sqlalchemy_engine().dialect.name), end="")
+    elif args.create:
+        for index in create_indexes():
+            print(f"index made: {index['name']}")
+    else:
+        for index, status, match in check_indexes():
+            print(f"{index['table'] + ' (' + ', '.join(index['columns']) + ')':<45} {status:<14} {match or ''}")
@@ -21,6 +21,10 @@ from constants import COLUMN_NAME, COLUMN_NAME_REGEX, COLUMN_DATE, COLUMN_MEAL
 px.defaults.color_discrete_sequence = px.colors.qualitative.T10  #https://plotly.com/python/discrete-color/
 px.defaults.color_continuous_scale = px.colors.sequential.Jet    #https://plotly.com/python/builtin-colorscales/
 
+# The number of items (foodstuffs, meals, combinations) on the plots of the units 4-7
+# (also the LIMIT of the queries in the out-of-core mode, see data_out_of_core.py)
+UNIT_TOP_N = {4: 10, 5: 10, 6: 3, 7: 5}
+
 
 
 def make_figure(unit, *args, **kwargs):
@@ -32,7 +36,7 @@ def make_figure(unit, *args, **kwargs):
     """
     
     # Get int from the client's input 'unit'
-    unit_number = int(str.join('', (c for c in str(unit.id if hasattr(unit, 'id') else unit) if c.isdecimal())))
+    unit_number = _get_unit_number(unit)
 
     mapping = {3: make_figure_3,
                4: make_figure_4,
@@ -43,6 +47,38 @@ def make_figure(unit, *args, **kwargs):
     func = mapping.get(unit_number, make_figure_test)
     return func(*args, **kwargs)
 
+
+
+def make_figure_from_counts(unit, counts, color=None, debugging_info=None):
+    """
+    dispatcher function as `make_figure`, for the counts aggregated elsewhere, e.g. in SQL (see data_out_of_core.py)
+    Arguments:
+        unit: int, str or unit object
+        counts: units 4, 5: pandas.Series, the foodstuffs -> their number (the top ones, the most common first)
+                unit 6: collections.Counter, the meals (sets of foodstuffs) -> their number (the most common first)
+                unit 7: collections.Counter, the combinations of foodstuffs -> the number of meals with them
+    """
+    unit_number = _get_unit_number(unit)
+
+    if unit_number == 6:
+        return _make_typical_meals_plot(counts, color, debugging_info)
+    if unit_number == 7:
+        return _make_combinations_plot(counts, color, debugging_info)
+
+    # units 4, 5
+    if counts is None or len(counts)==0:
+        return no_data_available()
+
+    fig = make_tiles_plot(items=counts.index, values=counts.values, color=color)
+    fig.update_layout(title=get_figure_title(debugging_info))
+    return fig
+
+
+
+def _get_unit_number(unit):
+    """int from a unit (e.g. dash.html.Div with id='unit_3'), its id or its number"""
+    return int(str.join('', (c for c in str(unit.id if hasattr(unit, 'id') else unit) if c.isdecimal())))
+
     
 
 
@@ -231,7 +267,7 @@ def make_figure_3(df_eating, df_symptoms, debugging_info=None):
     for i, meal, mahlzeit, color in zip(range(3, 0, -1), 
                                             *zip(*list(MEALS_MAPPING.items())), 
                                             COLORS):
-        df_temp = df_eating.loc[df_eating[COLUMN_MEAL] == meal, [COLUMN_DATE,  COLUMN_NAME]].groupby(COLUMN_DATE).agg(list).sort_index()
+        df_temp = df_eating.loc[df_eating[COLUMN_MEAL] == meal, [COLUMN_DATE,  COLUMN_NAME]].astype({COLUMN_NAME: object}).groupby(COLUMN_DATE).agg(list).sort_index()
         df_temp[COLUMN_NAME] = df_temp[COLUMN_NAME].apply(", ".join)
         df_temp['bar_height'] = i - 0.5   
         trace = go.Scatter(x=df_temp.index, y=df_temp['bar_height'], 
@@ -260,13 +296,14 @@ def make_figure_4(df, color=None, debugging_info=None):
     # Foodstuff name
     COLUMN_NAME = COLUMN_NAME_REGEX if COLUMN_NAME_REGEX in df.columns else COLUMN_NAME
     
-    TOP_N = 10
+    TOP_N = UNIT_TOP_N[4]
 
     # no data -> no plot
     if df is None or len(df)==0:
         return no_data_available()
     
-    df = df[COLUMN_NAME].value_counts().head(TOP_N).to_frame().reset_index()
+    sr = df[COLUMN_NAME].value_counts()
+    df = sr[sr > 0].head(TOP_N).to_frame().reset_index()   # a categorical counts its unused names too (0)
 
     fig = make_tiles_plot(items=df[COLUMN_NAME], 
                           values=df['count'],  # generic name by pandas value_counts()
@@ -283,13 +320,14 @@ def make_figure_5(df, color=None, debugging_info=None):
     # Foodstuff name
     COLUMN_NAME = COLUMN_NAME_REGEX if COLUMN_NAME_REGEX in df.columns else COLUMN_NAME
 
-    TOP_N = 10
+    TOP_N = UNIT_TOP_N[5]
 
     # no data -> no plot
     if df is None or len(df)==0:
         return no_data_available()
 
-    sr = df[COLUMN_NAME].value_counts().head(TOP_N)
+    sr = df[COLUMN_NAME].value_counts()
+    sr = sr[sr > 0].head(TOP_N)   # a categorical counts its unused names too (0)
 
     # just in case
     if sr is None or len(sr)==0:
@@ -308,17 +346,26 @@ def make_figure_6(df, color=None, debugging_info=None):
     # Foodstuff name
     COLUMN_NAME = COLUMN_NAME_REGEX if COLUMN_NAME_REGEX in df.columns else COLUMN_NAME
 
-    TOP_N = 3   # can choose any TOP_N from 1
-
     # no data -> no plot
     if df is None or len(df)==0:
         return no_data_available()
 
-    arr = df[[COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME]].groupby([COLUMN_DATE, COLUMN_MEAL]).agg(list).values.ravel()
+    # the names as object (a categorical can't hold lists), observed=True: only the meals which occur
+    arr = (df[[COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME]].astype({COLUMN_NAME: object})
+           .groupby([COLUMN_DATE, COLUMN_MEAL], observed=True).agg(list).values.ravel())
     sets = [frozenset(e) for e in arr]
+    return _make_typical_meals_plot(Counter(sets), color, debugging_info)
+
+
+
+def _make_typical_meals_plot(counter, color=None, debugging_info=None):
+    """The plot of `make_figure_6` from the numbers of the meals (collections.Counter of the sets of foodstuffs)"""
+
+    TOP_N = UNIT_TOP_N[6]   # can choose any TOP_N from 1
+
     list_of_lists = [sorted(array)      # array = a set representing a meal
                      for array,count in 
-                     sorted(Counter(sets).most_common(TOP_N), 
+                     sorted(counter.most_common(TOP_N), 
                             key=lambda t: (t[1], -len(t[0])), # -len() puts shorter sets (of the same rank)
                             reverse=True)                     # first because a shorter one can be a subset
                      if count>1]                              # of a longer one by chance
@@ -341,16 +388,24 @@ def make_figure_7(df, n_components, color=None, debugging_info=None):
     # Foodstuff name
     COLUMN_NAME = COLUMN_NAME_REGEX if COLUMN_NAME_REGEX in df.columns else COLUMN_NAME
 
-    TOP_N = 5 # number of tiles on the treemap-plot
-
     # no data -> no plot
     if df is None or len(df)==0:
         return no_data_available()
 
-    df_aggregated = df[[COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME]].groupby([COLUMN_DATE, COLUMN_MEAL]).agg(tuple)
+    df_aggregated = (df[[COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME]].astype({COLUMN_NAME: object})
+                     .groupby([COLUMN_DATE, COLUMN_MEAL], observed=True).agg(tuple))   # as in `make_figure_6`
     meals = [frozenset(tuple(e[0])) for e in df_aggregated.values.tolist()]
     
     counter = compute_combination_occurrence(meals, cardinality=n_components)
+    return _make_combinations_plot(counter, color, debugging_info)
+
+
+
+def _make_combinations_plot(counter, color=None, debugging_info=None):
+    """The plot of `make_figure_7` from the numbers of the combinations (collections.Counter of the sets of foodstuffs)"""
+
+    TOP_N = UNIT_TOP_N[7] # number of tiles on the treemap-plot
+
     df_for_plot = DataFrame([(", ".join(e[0]), e[1]) for e in counter.most_common(TOP_N)], columns=["combination", "count"])
     
     # if no data - just in case
@@ -0,0 +1,226 @@
+"""
+The Polars engine (ENGINE = 'polars' on constants.py, requires: pip install polars):
+the heavy parts of the cleaning, the engineered columns, the filters and the aggregations of the tables
+run as Polars (lazy, multi-threaded) queries - e.g. for the accounts with long histories.
+
+The functions take pandas df's and return what the pandas engine needs to finish the job:
+boolean masks of the rows (applied with df[mask], i.e. the index and the dtypes stay as they are),
+the engineered columns as arrays, the aggregated (small) tables and the numbers of the statistics.
+So the callers (data_processing.py, data_filtering.py, table_toolkit.py) return the same df's with either engine,
+check it with: $ python benchmarks.py polars
+"""
+
+import numpy as np
+from pandas import Series, DataFrame, CategoricalDtype, Timestamp, to_numeric
+from constants import ERR_PREFIX, MEALS_MAPPING
+from constants import (COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME, COLUMN_TIMING, COLUMN_SYMPTOM, COLUMN_GRADE,
+                       COLUMN_WEEKDAY, COLUMN_SYMPTOMS, COLUMN_AVG_GRADE, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY)
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+
+# Temporary columns of the queries
+DAY = '_day'
+SORTING = '_sorting'
+MASK = '_mask'
+
+
+
+def _to_polars(df, columns, **numbers):
+    """
+    The columns of a pandas df as a polars LazyFrame (the arrow-backed strings aren't copied),
+    the meal as plain strings (a categorical with COMPACT_SCHEMA), numbers: further columns as float arrays
+    """
+    if pl is None:
+        raise ImportError(f"{ERR_PREFIX}ENGINE = 'polars' requires polars: pip install polars")
+
+    lf = pl.from_pandas(df[columns]).lazy()
+    if COLUMN_MEAL in columns:
+        lf = lf.with_columns(pl.col(COLUMN_MEAL).cast(pl.String))
+    if numbers:
+        lf = lf.with_columns(pl.Series(name, values).fill_nan(None) for name, values in numbers.items())
+    return lf
+
+
+
+def _to_mask(lf, expression):
+    """The boolean mask of the rows (missing values -> False) as a numpy array"""
+    return lf.with_columns(expression.fill_null(False).alias(MASK)).select(MASK).collect().to_series().to_numpy()
+
+
+
+def _to_strings(sr, dtype=None, index=None):
+    """A polars string column as a pandas Series of the dtype (None: inferred), the missing values as NaN (as pandas makes them)"""
+    values = sr.to_numpy().astype(object)
+    values[sr.is_null().to_numpy()] = np.nan
+    return Series(values, index=index, dtype=dtype)
+
+
+
+def _to_date_type(*dfs):
+    """
+    The dtype of the dates of the df's together (the finest unit, as pandas merges/concats them)
+    and the polars type to hold them (no seconds in polars)
+    """
+    dtype = np.result_type(*[df[COLUMN_DATE].dtype for df in dfs])
+    unit, _ = np.datetime_data(dtype)
+    return (dtype, pl.Datetime(unit if unit in ('ms', 'us', 'ns') else 'ms'))
+
+
+
+def _to_grades(sr):
+    """The grades as floats (the grade is an object column if there are missing ones)"""
+    return to_numeric(sr).to_numpy(dtype='float64', na_value=np.nan)
+
+
+
+def mask_first_rows(df, columns):
+    """The first row of each combination of the values of the columns (~pandas.DataFrame.duplicated(keep='first'))"""
+    return _to_mask(_to_polars(df, columns), pl.struct(columns).is_first_distinct())
+
+
+
+def mask_dates(df, column_date, start_date, end_date):
+    """The rows within the dates (inclusive, str as in the pandas query)"""
+    return _to_mask(_to_polars(df, [column_date]), pl.col(column_date).is_between(Timestamp(start_date), Timestamp(end_date)))
+
+
+
+def mask_selector_values(df, meal_values=None, symptom_values=None, next_day=False, min_grade=None):
+    """
+    The rows of the meals in meal_values, with the same day flag in symptom_values (or the next day flag, if next_day)
+    and the mean grade of min_grade or higher (None = no condition), see `subset_data_by_selector_values`
+    """
+    columns = [COLUMN_MEAL, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY, COLUMN_AVG_GRADE]
+    conditions = [pl.lit(True)]
+    if meal_values is not None:
+        conditions.append(pl.col(COLUMN_MEAL).is_in(meal_values))
+    if next_day:
+        conditions.append(pl.col(COLUMN_SYMPTOM_NEXT_DAY) == True)
+    elif symptom_values is not None:
+        conditions.append(pl.col(COLUMN_SYMPTOM_SAME_DAY).is_in(symptom_values))
+    if min_grade is not None:
+        conditions.append(pl.col(COLUMN_AVG_GRADE) >= min_grade)
+    return _to_mask(_to_polars(df, [column for column in columns if column in df.columns]),
+                    pl.all_horizontal(condition.fill_null(False) for condition in conditions))
+
+
+
+def make_engineered_columns(df_eating, df_symptoms, meal_of_timing):
+    """
+    The engineered columns weekday, symptom_same_day, symptom_next_day, symptoms, avg_grade
+    (see ENGINEERED_COLUMNS on data_processing.py, the regex'ed names come from the pandas engine)
+
+    Returns:
+        dict: column -> values (in the order of the rows of df_eating)
+    """
+    symptoms = (_to_polars(df_symptoms, [COLUMN_DATE, COLUMN_TIMING, COLUMN_SYMPTOM],
+                           **{COLUMN_GRADE: _to_grades(df_symptoms[COLUMN_GRADE])})
+                .with_columns(pl.col(COLUMN_DATE).dt.date().alias(DAY),
+                              pl.col(COLUMN_TIMING).cast(pl.String).replace_strict(meal_of_timing, default=None)
+                              .alias(COLUMN_MEAL)))
+    symptom_days = symptoms.select(pl.col(DAY).drop_nulls().unique()).collect().to_series()
+
+    # The symptoms after each meal of a day, concatenated in the order of the rows
+    groups = (symptoms.drop_nulls([DAY, COLUMN_MEAL])
+              .group_by([DAY, COLUMN_MEAL])
+              .agg(pl.col(COLUMN_SYMPTOM).cast(pl.String).str.join(", ").alias(COLUMN_SYMPTOMS),
+                   pl.col(COLUMN_GRADE).mean().alias(COLUMN_AVG_GRADE)))
+
+    df = (_to_polars(df_eating, [COLUMN_DATE, COLUMN_MEAL])
+          .with_columns(pl.col(COLUMN_DATE).dt.date().alias(DAY))
+          .with_columns((pl.col(COLUMN_DATE).dt.weekday() - 1).cast(pl.Int32).alias(COLUMN_WEEKDAY),
+                        pl.col(DAY).is_in(symptom_days.implode()).fill_null(False).alias(COLUMN_SYMPTOM_SAME_DAY),
+                        pl.col(DAY).dt.offset_by('1d').is_in(symptom_days.implode()).fill_null(False)
+                        .alias(COLUMN_SYMPTOM_NEXT_DAY))
+          .join(groups, on=[DAY, COLUMN_MEAL], how='left', maintain_order='left')
+          .collect())
+
+    # As by the pandas engine: strings of the dtype of the symptoms, missing grades / weekdays (NaT) as NaN
+    dtype = df_symptoms[COLUMN_SYMPTOM].dtype
+    return {COLUMN_WEEKDAY: df[COLUMN_WEEKDAY].to_numpy(),
+            COLUMN_SYMPTOM_SAME_DAY: df[COLUMN_SYMPTOM_SAME_DAY].to_numpy(),
+            COLUMN_SYMPTOM_NEXT_DAY: df[COLUMN_SYMPTOM_NEXT_DAY].to_numpy(),
+            COLUMN_SYMPTOMS: _to_strings(df[COLUMN_SYMPTOMS], dtype.categories.dtype if isinstance(dtype, CategoricalDtype) else dtype,
+                                         df_eating.index),
+            COLUMN_AVG_GRADE: df[COLUMN_AVG_GRADE].to_numpy().astype('float64')}
+
+
+
+def aggregate_diary(df_eating, df_symptomreport, mapping):
+    """
+    The diary (see `make_diary_table` on table_toolkit.py) before its meals and grades are translated/formatted:
+    one row per date and meal with the foodstuffs, the symptoms (concatenated) and the mean grade,
+    sorted by the date and the meals in the order of mapping (the values: the meals of the timings)
+
+    Returns:
+        pandas.DataFrame with the columns date, meal, name, symptom, grade
+    """
+    date_dtype, date_type = _to_date_type(df_eating, df_symptomreport)
+    eating = (_to_polars(df_eating, [COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME])
+              .with_columns(pl.col(COLUMN_DATE).cast(date_type))
+              .drop_nulls([COLUMN_DATE, COLUMN_MEAL])
+              .group_by([COLUMN_DATE, COLUMN_MEAL])
+              .agg(pl.col(COLUMN_NAME).cast(pl.String).str.join(", ")))
+    symptoms = (_to_polars(df_symptomreport, [COLUMN_DATE, COLUMN_TIMING, COLUMN_SYMPTOM],
+                           **{COLUMN_GRADE: _to_grades(df_symptomreport[COLUMN_GRADE])})
+                .with_columns(pl.col(COLUMN_DATE).cast(date_type),
+                              pl.col(COLUMN_TIMING).cast(pl.String).replace_strict(mapping, default=None).alias(COLUMN_MEAL))
+                .drop_nulls([COLUMN_DATE, COLUMN_MEAL])
+                .group_by([COLUMN_DATE, COLUMN_MEAL])
+                .agg(pl.col(COLUMN_SYMPTOM).cast(pl.String).str.join(", "), pl.col(COLUMN_GRADE).mean()))
+
+    # The meals which aren't in mapping come last (by their names)
+    order = {meal: i for i, meal in enumerate(dict.fromkeys(mapping.values()))}
+    df = (symptoms.join(eating, on=[COLUMN_DATE, COLUMN_MEAL], how='full', coalesce=True)
+          .with_columns(pl.col(COLUMN_MEAL).replace_strict(order, default=None, return_dtype=pl.Int64).alias(SORTING))
+          .sort([COLUMN_DATE, SORTING, COLUMN_MEAL], nulls_last=True)
+          .select(COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME, COLUMN_SYMPTOM, COLUMN_GRADE)
+          .collect())
+
+    return DataFrame({COLUMN_DATE: df[COLUMN_DATE].to_numpy().astype(date_dtype),
+                      COLUMN_MEAL: df[COLUMN_MEAL].to_numpy().astype(object),
+                      COLUMN_NAME: _to_strings(df[COLUMN_NAME]),
+                      COLUMN_SYMPTOM: _to_strings(df[COLUMN_SYMPTOM]),
+                      COLUMN_GRADE: df[COLUMN_GRADE].to_numpy().astype('float64')})
+
+
+
+def count_statistics(df_eating, df_symptomreport):
+    """
+    The numbers of the statistics table (see `make_statistics_table` on table_toolkit.py), of the same types
+    as with pandas (the percentages are rounded by the caller: numpy's round differs from python's round for some halves)
+
+    Returns:
+        dict with the keys symptom_count, symptom_days, usage_days, symptom_days_per_week (the mean, not rounded),
+        eating_days and the days of each meal of MEALS_MAPPING (e.g. BREAKFAST)
+    """
+    _, date_type = _to_date_type(df_eating, df_symptomreport)
+    symptoms = _to_polars(df_symptomreport, [COLUMN_DATE]).with_columns(pl.col(COLUMN_DATE).cast(date_type)).drop_nulls()
+    eating = (_to_polars(df_eating, [COLUMN_DATE, COLUMN_MEAL]).with_columns(pl.col(COLUMN_DATE).cast(date_type))
+              .drop_nulls([COLUMN_DATE]))
+
+    # The days with symptoms in each (ISO) week of eating data
+    weeks = (eating.select(pl.col(COLUMN_DATE).dt.week().unique().alias('week_no'))
+             .join(symptoms.group_by(pl.col(COLUMN_DATE).dt.week().alias('week_no')).agg(pl.col(COLUMN_DATE).n_unique()),
+                   on='week_no', how='left'))
+
+    counts = pl.collect_all([
+        symptoms.select(symptom_count=pl.len(), symptom_days=pl.col(COLUMN_DATE).n_unique()),
+        pl.concat([eating.select(COLUMN_DATE), symptoms]).select(usage_days=pl.col(COLUMN_DATE).n_unique()),
+        weeks.select(symptom_days_per_week=pl.col(COLUMN_DATE).mean()),
+        eating.select(pl.col(COLUMN_DATE).n_unique().alias('eating_days'),
+                      *[pl.col(COLUMN_DATE).filter(pl.col(COLUMN_MEAL) == meal).n_unique().alias(meal)
+                        for meal in MEALS_MAPPING]),
+        ])
+    counts = {key: value for df in counts for key, value in df.row(0, named=True).items()}
+
+    # The types of the pandas engine: the counts of rows as numpy ints, the distinct values as ints
+    symptom_days_per_week = counts['symptom_days_per_week']
+    return {**counts,
+            'symptom_count': np.int64(counts['symptom_count']),
+            'symptom_days_per_week': np.float64(np.nan if symptom_days_per_week is None else symptom_days_per_week),
+            **{meal: np.int64(counts[meal]) for meal in MEALS_MAPPING}}
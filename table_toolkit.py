@@ -6,12 +6,14 @@ table generation and conversion functions for table generation
 
 
 from collections import OrderedDict
+import numpy as np
 import pandas as pd
 from io import StringIO
 from dash import html
 from dash.dash_table import DataTable
 
-from constants import (DEBUG, MEALS_MAPPING, COLUMN_NAME, COLUMN_NAME_REGEX, COLUMN_DATE, COLUMN_TIMING, 
+import polars_engine
+from constants import (DEBUG, ENGINE, MEALS_MAPPING, COLUMN_NAME, COLUMN_NAME_REGEX, COLUMN_DATE, COLUMN_TIMING, 
                       COLUMN_SYMPTOM, COLUMN_GRADE, COLUMN_MEAL,COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY)
 
 
@@ -67,53 +69,81 @@ def instantiate_debug_table(id=None):
 
 
 
+# The timings of the symptom reports -> the meals of the diary (in this order)
+MAPPING = OrderedDict([
+    ('AFTER_GETTING_UP', 'GETTING_UP'),
+    ('AFTER_BREAKFAST', 'BREAKFAST' ),
+    ('AFTER_LUNCH', 'LUNCH'),
+    ('AFTER_DINNER', 'DINNER'),
+    ('UNKNOWN', 'UNKNOWN')
+])
+
+
+
 def make_diary_table(df_eating, df_symptomreport):
     """
     TODO
     """
 
-    # Column names and column values
-    COLUMN_TEMP = 'sorting'
+    # The same table aggregated by one Polars query (see polars_engine.py), translated/formatted below
+    if ENGINE == 'polars':
+        df_diary = polars_engine.aggregate_diary(df_eating, df_symptomreport, MAPPING)
+    else:
+        df_diary = _aggregate_diary(df_eating, df_symptomreport)
+    return finish_diary_table(df_diary)
+
+
+
+def finish_diary_table(df_diary):
+    """
+    Translates/formats the meals and grades of the aggregated diary
+    (of `_aggregate_diary`, `aggregate_diary` on polars_engine.py or `read_diary` on data_out_of_core.py)
+    """
+
+    # Column values
     UNKNOWN = "Unbekannt"
     AFTER_GETTING_UP = "Nach dem Aufstehen"
 
-    MAPPING = OrderedDict([
-        ('AFTER_GETTING_UP', 'GETTING_UP'),
-        ('AFTER_BREAKFAST', 'BREAKFAST' ),
-        ('AFTER_LUNCH', 'LUNCH'),
-        ('AFTER_DINNER', 'DINNER'),
-        ('UNKNOWN', 'UNKNOWN')
-    ])
+    mapping = {k:v for k,v in 
+               zip( MAPPING.values(), 
+                    ([AFTER_GETTING_UP] + list(MEALS_MAPPING.values()) + [UNKNOWN]))}
+
+    df_diary[COLUMN_MEAL] = df_diary[COLUMN_MEAL].map(mapping)
+    df_diary[COLUMN_GRADE] = df_diary[COLUMN_GRADE].apply(lambda v: str(round(v)) if not pd.isnull(v) else '')
+    df_diary.reset_index(inplace=True, drop=True)
+    return df_diary
+
+
+
+def _aggregate_diary(df_eating, df_symptomreport):
+    """The diary of `make_diary_table` before its meals and grades are translated/formatted (pandas engine)"""
+
+    # Column names
+    COLUMN_TEMP = 'sorting'
 
     # try these functions to make the table pretty (foodstuffs list)
     func_to_aggregate_strings = ", ".join   # try: list, tuple, set, "\n".join , ", ".join  to push it into plotly-datatable and get beautiful repr
-    df_eating_agg = (df_eating[[COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME]]
-                        .groupby([COLUMN_DATE, COLUMN_MEAL])
+    # observed=True: only the meals which occur (the meal can be a categorical, see COMPACT_SCHEMA on constants.py)
+    # the strings as object: a categorical (or arrow) column is materialized once, not once per group
+    df_eating_agg = (df_eating[[COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME]].astype({COLUMN_NAME: object})
+                        .groupby([COLUMN_DATE, COLUMN_MEAL], observed=True)
                         .agg(func_to_aggregate_strings)
                         .reset_index())
 
-    df_symptomreport[COLUMN_MEAL] = df_symptomreport[COLUMN_TIMING].map(MAPPING)
-    df_symptomreport_agg = (df_symptomreport[[COLUMN_DATE, COLUMN_MEAL, COLUMN_SYMPTOM, COLUMN_GRADE]]
-                        .groupby([COLUMN_DATE, COLUMN_MEAL])
+    # the meal on a new df (the df's passed in are not changed, e.g. shared by the units)
+    df_symptomreport = df_symptomreport.assign(**{COLUMN_MEAL: df_symptomreport[COLUMN_TIMING].map(MAPPING)})
+    df_symptomreport_agg = (df_symptomreport[[COLUMN_DATE, COLUMN_MEAL, COLUMN_SYMPTOM, COLUMN_GRADE]].astype({COLUMN_SYMPTOM: object})
+                        .groupby([COLUMN_DATE, COLUMN_MEAL], observed=True)
                         .agg({COLUMN_SYMPTOM: func_to_aggregate_strings, COLUMN_GRADE: 'mean'})
                         .reset_index())
 
     values_list = list(MAPPING.values()) + list(set(df_symptomreport_agg[COLUMN_MEAL].unique()).difference(set(MAPPING.values()))) # to be on the safe side
     
     df_diary = df_symptomreport_agg.merge(df_eating_agg, how='outer', on=[COLUMN_DATE, COLUMN_MEAL])
-    df_diary[COLUMN_TEMP] = df_diary[COLUMN_MEAL].apply(lambda v: values_list.index(v))
+    df_diary[COLUMN_TEMP] = df_diary[COLUMN_MEAL].map({v: i for i, v in enumerate(values_list)})
     df_diary = df_diary.sort_values([COLUMN_DATE, COLUMN_TEMP]).drop(COLUMN_TEMP, axis=1)
 
-    df_diary = df_diary.reindex(columns=[COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME, COLUMN_SYMPTOM, COLUMN_GRADE])
-
-    mapping = {k:v for k,v in 
-               zip( MAPPING.values(), 
-                    ([AFTER_GETTING_UP] + list(MEALS_MAPPING.values()) + [UNKNOWN]))}
-
-    df_diary[COLUMN_MEAL] = df_diary[COLUMN_MEAL].map(mapping)
-    df_diary[COLUMN_GRADE] = df_diary[COLUMN_GRADE].apply(lambda v: str(round(v)) if not pd.isnull(v) else '')
-    df_diary.reset_index(inplace=True, drop=True)
-    return df_diary
+    return df_diary.reindex(columns=[COLUMN_DATE, COLUMN_MEAL, COLUMN_NAME, COLUMN_SYMPTOM, COLUMN_GRADE])
 
 
 
@@ -121,12 +151,12 @@ def prettify_diary_table(df_diary):
     """
     workaround to make this table look nicer
     if put into the `make_diary_table` -> doesnt work
+    (returns a new df)
     """
-    df_diary[COLUMN_DATE] = df_diary[COLUMN_DATE].dt.strftime(r'%d/%m/%Y')
-    df_diary.loc[df_diary[COLUMN_DATE].duplicated(), COLUMN_DATE] = ''
-    df_diary[COLUMN_DATE] = df_diary[COLUMN_DATE].astype(str)
-    df_diary.columns = ["Datum", "Zeit", "Lebensmittel", "Symptome", "Symptomstärke"]
-    return df_diary
+    dates = df_diary[COLUMN_DATE].dt.strftime(r'%d/%m/%Y')
+    dates = dates.mask(dates.duplicated(), '').astype(str)
+    return (df_diary.assign(**{COLUMN_DATE: dates})
+            .set_axis(["Datum", "Zeit", "Lebensmittel", "Symptome", "Symptomstärke"], axis=1))
 
 
 
@@ -159,20 +189,40 @@ def make_probably_bad_foods_table(df):
     # Foodstuff name
     COLUMN_NAME = COLUMN_NAME_REGEX if COLUMN_NAME_REGEX in df.columns else COLUMN_NAME
 
+    # per foodstuff: the days (rows) with a symptom on that day / on the next day, eaten on a day with / without a symptom
+    df_counts = (df[[COLUMN_NAME, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY]]
+                 .assign(eaten_on_symptom_days=df[COLUMN_SYMPTOM_SAME_DAY]==True,         # yes symptom on that day
+                         eaten_on_symptom_free_days=df[COLUMN_SYMPTOM_SAME_DAY]==False)   # no symptom on that day
+                 .groupby(COLUMN_NAME, observed=True)
+                 .agg({COLUMN_SYMPTOM_SAME_DAY: 'sum', COLUMN_SYMPTOM_NEXT_DAY: 'sum',
+                       'eaten_on_symptom_days': 'any', 'eaten_on_symptom_free_days': 'any'}))
+    return make_probably_bad_foods_table_from_counts(df_counts)
+
+
+
+def make_probably_bad_foods_table_from_counts(df_counts):
+    """
+    The same table as `make_probably_bad_foods_table` from its numbers per foodstuff
+    (e.g. aggregated in SQL, see `read_foodstuff_flags` on data_out_of_core.py)
+
+    Args:
+        df_counts: pandas.DataFrame indexed by the foodstuffs (sorted) with the columns
+                   symptom_same_day, symptom_next_day (sums), eaten_on_symptom_days, eaten_on_symptom_free_days (bool)
+    """
+
     # Top n of "potentially bad" foodstuffs
     TOP_N = 5
 
-    set_true = set(df.loc[df[COLUMN_SYMPTOM_SAME_DAY]==True, COLUMN_NAME])   # yes symptom on that day
-    set_false = set(df.loc[df[COLUMN_SYMPTOM_SAME_DAY]==False, COLUMN_NAME]) # no symptom on that day
+    set_true = set(df_counts.index[df_counts['eaten_on_symptom_days']])        # yes symptom on that day
+    set_false = set(df_counts.index[df_counts['eaten_on_symptom_free_days']])  # no symptom on that day
     set_potentially_bad = set_true.difference(set_false)
 
     # make a ranking
-    sr = (df[[COLUMN_NAME, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY]]
-     .groupby(COLUMN_NAME).sum()
+    sr = (df_counts[[COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY]]
      .sort_values([COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY], ascending=[False, False])
-     .sum(axis=1).replace({0:None}).dropna().reset_index()[COLUMN_NAME])
+     .sum(axis=1).replace({0:None}).dropna().index)
     
-    ranking = {foodstuff: rank for rank, foodstuff in sr.items()}
+    ranking = {foodstuff: rank for rank, foodstuff in enumerate(sr)}
 
     return (pd.DataFrame(set_potentially_bad or set_true)  # if set_potentially_bad is empty
             .assign(ranking=lambda df: df.squeeze().map(ranking)).dropna()
@@ -182,52 +232,83 @@ def make_probably_bad_foods_table(df):
 
 
 
+def make_counts_table(counts):
+    """
+    The counts of a plot (e.g. queried in the out-of-core mode, see data_out_of_core.py) as a df for the debugging tables
+    counts: pandas.Series or collections.Counter (the keys: names or sets/tuples of names)
+    """
+    return pd.DataFrame([(k if isinstance(k, str) else ", ".join(sorted(k)), v) for k, v in dict(counts).items()],
+                        columns=[COLUMN_NAME_REGEX, 'count'])
+
+
+
 def make_statistics_table(df_eating, df_symptomreport):
     """
     TODO
     """
+    # The same numbers from Polars queries (see polars_engine.py), rounded as below
+    if ENGINE == 'polars':
+        counts = polars_engine.count_statistics(df_eating, df_symptomreport)
+        symptom_days_perc = round(counts['symptom_days']*100/counts['usage_days'],1)
+        avg_symptom_days_per_week = round(counts['symptom_days_per_week'],1)
+        breakfast_perc, lunch_perc, dinner_perc = [round(counts[meal]*100/counts['eating_days'],1)
+                                                   for meal in ('BREAKFAST', 'LUNCH', 'DINNER')]
+        return _make_statistics_dataframe(counts['usage_days'], counts['symptom_count'], counts['symptom_days'], symptom_days_perc,
+                                          avg_symptom_days_per_week, breakfast_perc, lunch_perc, dinner_perc)
+
     # Calculations
     #total number of symptoms
     symptom_count = df_symptomreport['date'].count()
     #total number of days with symptoms
     symptom_days = df_symptomreport['date'].nunique()
-    #days of usage
-    df = df_eating.merge(df_symptomreport, on= 'date', how= 'outer')
-    usage_days= df['date'].nunique()
+    #days of usage (the days with eating data or symptoms)
+    usage_days = pd.concat([df_eating['date'], df_symptomreport['date']], ignore_index=True).nunique()
     #relation days with symptoms/days of usage
     symptom_days_perc= round(symptom_days*100/usage_days,1)
     #avg number of days with symptoms per week of usage
-    df_symptomreport["week_no"]=pd.to_datetime(df_symptomreport['date']).dt.isocalendar().week
-    symptoms= df_symptomreport.groupby('week_no')['date'].nunique().to_frame().reset_index()
-    df_eating['week_no'] = pd.to_datetime(df_eating['date']).dt.isocalendar().week
-    weeks = pd.DataFrame(df_eating['week_no'].unique())
+    #(the week numbers as Series, i.e. the df's passed in are not changed)
+    symptom_weeks = pd.to_datetime(df_symptomreport['date']).dt.isocalendar().week.rename('week_no')
+    symptoms= df_symptomreport['date'].groupby(symptom_weeks).nunique().to_frame().reset_index()
+    eating_weeks = pd.to_datetime(df_eating['date']).dt.isocalendar().week
+    weeks = pd.DataFrame(eating_weeks.unique())
     weeks.columns = ['week_no']
     symptoms_days_per_week = weeks.merge(symptoms, how='left', left_on='week_no', right_on='week_no')
     avg_symptom_days_per_week = round(symptoms_days_per_week['date'].mean(),1)
     #comparing breakfast, lunch and dinner (e.g. breakfast was documented only 55% of the time, but lunch 87% ...)
-    df = df_eating[['date', 'meal']].groupby('date')[['meal']].sum().reset_index()
-    def detect_breakfast(df_aggregate):
-        if 'BREAKFAST' in df_aggregate['meal']:
-            return 1
-        else:
-            return 0
-    def detect_lunch(df_aggregate):
-        if 'LUNCH' in df_aggregate['meal']:
-            return 1
-        else:
-            return 0
-    def detect_dinner(df_aggregate):
-        if 'DINNER' in df_aggregate['meal']:
-            return 1
-        else:
-            return 0
-    df['breakfast'] = df.apply(detect_breakfast, axis=1)
-    df['lunch'] = df.apply(detect_lunch, axis=1)
-    df['dinner'] = df.apply(detect_dinner, axis=1)
-    breakfast_perc=round(df['breakfast'].sum()*100/df['breakfast'].count(),1)
-    lunch_perc=round(df['lunch'].sum()*100/df['breakfast'].count(),1)
-    dinner_perc=round(df['dinner'].sum()*100/df['breakfast'].count(),1)
+    #the distinct (day, meal) pairs, i.e. no string concatenation per day (the meal can be a categorical)
+    df = df_eating[['date', 'meal']].dropna(subset=['date']).drop_duplicates()
+    eating_days = df['date'].nunique()
+    breakfast_perc, lunch_perc, dinner_perc = [round((df['meal'] == meal).sum()*100/eating_days,1)
+                                               for meal in ('BREAKFAST', 'LUNCH', 'DINNER')]
     # generating dataframe for table
+    return _make_statistics_dataframe(usage_days, symptom_count, symptom_days, symptom_days_perc, avg_symptom_days_per_week,
+                                      breakfast_perc, lunch_perc, dinner_perc)
+
+
+
+def make_statistics_table_from_counts(statistics):
+    """
+    The same table as `make_statistics_table` from the numbers computed in the database
+    (see `fetch_statistics` on data_access.py), i.e. without the long tables.
+    """
+    NAN = float('nan')
+    usage_days, eating_days = statistics['usage_days'], statistics['eating_days']
+    avg_symptom_days_per_week = statistics['avg_symptom_days_per_week']
+
+    # Rounded as in `make_statistics_table` (numpy's round differs from python's round for some halves, e.g. 1.95)
+    symptom_days_perc = round(statistics['symptom_days']*100/usage_days,1) if usage_days else NAN
+    avg_symptom_days_per_week = np.round(avg_symptom_days_per_week,1) if avg_symptom_days_per_week is not None else NAN
+    breakfast_perc, lunch_perc, dinner_perc = [np.round(statistics[key]*100/eating_days,1) if eating_days else NAN
+                                               for key in ('breakfast_days', 'lunch_days', 'dinner_days')]
+
+    return _make_statistics_dataframe(usage_days, statistics['symptom_count'], statistics['symptom_days'], symptom_days_perc,
+                                      avg_symptom_days_per_week, breakfast_perc, lunch_perc, dinner_perc)
+
+
+
+def _make_statistics_dataframe(usage_days, symptom_count, symptom_days, symptom_days_perc, avg_symptom_days_per_week,
+                               breakfast_perc, lunch_perc, dinner_perc):
+    """The statistics table (unit_2) from its eight numbers"""
     data = {'Überschrift': ['Dokumentierte Tage','Dokumentierte Symptome (Anzahl)','Tage mit Symptomen (Anzahl)','Tage mit Symptomen (Anteil)','Tage mit Symptomen pro Woche (⌀)','Häufigkeit Frühstück','Häufigkeit Mittagessen', 'Häufigkeit Abendessen'],
             'Werte': [usage_days, symptom_count, symptom_days,str(symptom_days_perc) + '%', avg_symptom_days_per_week, str(breakfast_perc ) + '%', str(lunch_perc) + '%', str(dinner_perc) + '%']}
     return pd.DataFrame(data)
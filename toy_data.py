@@ -0,0 +1,236 @@
+"""
+Synthetic toy data: accounts with meals, foodstuffs and symptom reports (German foodstuff names, the enums of the database)
+written into a local SQLite or DuckDB file, so that the app and benchmarks.py can run without the production database
+(set DRIVER = 'sqlite' or 'duckdb' and LOCAL_DATABASE in constants.py, see `make_local_engine` on data_access.py).
+
+The shape follows assets/toy_data.zip: ~3 meals per diary day, ~4 foodstuffs per meal (mostly the account's favourites),
+symptoms on about a third of the days, most reports without timing and grade.
+The number of rows scales with --accounts and --days (days per account, on average),
+meal_foodstuff (the largest table) gets about 8.5 rows per account and day:
+    $ python toy_data.py toy_data.db --accounts 1 --days 12          # ~100 rows
+    $ python toy_data.py toy_data.db --accounts 100 --days 80        # ~70k rows (as assets/toy_data.zip)
+    $ python toy_data.py toy_data.db --accounts 12000 --days 100     # ~10M rows
+    $ python toy_data.py toy_data.duckdb --accounts 1000             # DuckDB (requires: pip install duckdb duckdb-engine)
+
+SQLite: the tables are in the main schema of the file (the file is attached under the name of SCHEMA)
+DuckDB: the tables are in the schema SCHEMA of the file
+"""
+
+import os
+import sqlite3
+from time import perf_counter
+from datetime import date
+from argparse import ArgumentParser
+import numpy as np
+import pandas as pd
+from constants import ERR_PREFIX, SCHEMA, MEALS_MAPPING
+from constants import TABLE_ACCOUNT, TABLE_MEAL, TABLE_MEAL_FOODSTUFF, TABLE_FOODSTUFF, TABLE_REPORT
+from constants import (COLUMN_ACCOUNT_ID, COLUMN_MEAL_ID, COLUMN_DATE, COLUMN_MEAL, COLUMN_FOODSTUFF_ID,
+                       COLUMN_NAME, COLUMN_REPORT_ID, COLUMN_SYMPTOM, COLUMN_GRADE, COLUMN_TIMING)
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+# The building blocks of the foodstuff names (as the users type them, incl. the quantities removed by the regex)
+FOODS = ["Brötchen", "Vollkornbrot", "Toast", "Butter", "Marmelade", "Honig", "Käse", "Gouda", "Frischkäse", "Salami",
+         "Schinken", "Ei", "Rührei", "Müsli", "Haferflocken", "Joghurt", "Naturjoghurt", "Quark", "Milch", "Hafermilch",
+         "Kaffee", "Tee", "Pfefferminztee", "Fencheltee", "Orangensaft", "Apfelsaft", "Wasser", "Apfel", "Banane", "Birne",
+         "Erdbeeren", "Weintrauben", "Kiwi", "Nudeln", "Spaghetti Bolognese", "Reis", "Kartoffeln", "Bratkartoffeln",
+         "Pommes", "Kartoffelbrei", "Hähnchenbrust", "Schnitzel", "Bratwurst", "Frikadelle", "Lachs", "Fischstäbchen",
+         "Thunfisch", "Tofu", "Linsen", "Kichererbsen", "Salat", "Gurke", "Tomate", "Paprika", "Möhren", "Brokkoli",
+         "Zucchini", "Spinat", "Zwiebeln", "Pizza", "Lasagne", "Gemüsesuppe", "Eintopf", "Döner", "Burger", "Sushi",
+         "Curry", "Schokolade", "Kekse", "Kuchen", "Apfelstrudel", "Eis", "Gummibärchen", "Chips", "Nüsse", "Mandeln",
+         "Cola", "Bier", "Wein", "Brezel", "Croissant", "Pfannkuchen", "Kartoffelsalat", "Sauerkraut", "Rotkohl", "Knödel"]
+ADJECTIVES = ["", "", "", "frische ", "vegane ", "laktosefreie ", "selbstgemachte ", "gekochte ", "glutenfreie "]
+QUANTITIES = ["", "", "", "", "1 ", "2 ", "1 Tasse ", "2 Scheiben ", "1 Glas ", "1 Portion ", "halbe ", "kleine ",
+              "0,5 l ", "100g ", "1 EL ", "1 Stück ", "mit ", "Teller ", "1 Handvoll "]
+
+# The enums of the database
+MEALS = np.array(list(MEALS_MAPPING.keys()))   # BREAKFAST, LUNCH, DINNER
+TIMINGS = np.array(['AFTER_GETTING_UP', 'AFTER_BREAKFAST', 'AFTER_LUNCH', 'AFTER_DINNER'])
+TIMING_UNKNOWN = 'UNKNOWN'
+SYMPTOMS = np.array(["Bauchschmerzen", "Bauchkrämpfe", "Bauchgrummeln", "Darmgeräusche", "Appetitlosigkeit", "Übelkeit",
+                     "Völlegefühl", "Blähungen", "Durchfall", "Schwellung im Mund", "Geschwollene Haut", "Laufende Nase"])
+
+# The shape of the data (see the module's docstring)
+FIRST_ACCOUNT_ID = 101
+FIRST_DATE, LAST_DATE = date(2020, 1, 1), date(2024, 12, 31)
+ACTIVITY = 0.4                # share of the days within an account's history with diary entries
+MEAL_PROBABILITY = 0.85       # of each of the 3 meals on a diary day
+FOODSTUFFS_PER_MEAL = 0.3     # parameter of the geometric distribution (mean ~3.3)
+FAVOURITES = 60               # foodstuffs an account eats most of the time
+FAVOURITE_SHARE = 0.8
+SYMPTOM_DAY_PROBABILITY = 0.3
+TIMING_UNKNOWN_SHARE = 0.86   # reports without timing (and without grade)
+ACCOUNTS_PER_BATCH = 1000     # written at once
+
+
+
+def make_foodstuffs(n, rng):
+    """Returns the foodstuff table (n rows, some names occur more than once as in the real data)"""
+    names = (rng.choice(QUANTITIES, n) + rng.choice(ADJECTIVES, n).astype(object) + rng.choice(FOODS, n)).astype(object)
+    lower = rng.random(n) < 0.2   # typed in lower case
+    names[lower] = [name.lower() for name in names[lower]]
+    return pd.DataFrame({COLUMN_FOODSTUFF_ID: np.arange(1, n + 1), COLUMN_NAME: names})
+
+
+
+def make_accounts(account_ids, n_foodstuffs, days, rng, first_meal_id=1, first_report_id=1):
+    """
+    Returns the tables (account, meal, meal_foodstuff, report) of the accounts as df's.
+    The foodstuffs are drawn with a Zipf-like popularity, each account has its favourites.
+    """
+    popularity = 1 / np.arange(1, n_foodstuffs + 1) ** 1.1
+    popularity /= popularity.sum()
+    n_span = (LAST_DATE - FIRST_DATE).days
+
+    accounts, meals, meal_foodstuffs, reports = [], [], [], []
+    meal_id, report_id = first_meal_id, first_report_id
+
+    for account_id in account_ids:
+        # The diary days
+        n_days = int(min(max(1, rng.lognormal(np.log(days) - 0.7**2 / 2, 0.7)), n_span * ACTIVITY))
+        span = min(int(n_days / ACTIVITY) + 1, n_span)
+        start = rng.integers(0, n_span - span + 1)
+        dates = np.datetime64(FIRST_DATE) + start + np.sort(rng.choice(span, n_days, replace=False))
+        accounts.append((account_id, dates[0] - rng.integers(0, 30)))
+
+        # Meals
+        i_day, i_meal = np.nonzero(rng.random((n_days, len(MEALS))) < MEAL_PROBABILITY)
+        meal_ids = np.arange(meal_id, meal_id + len(i_day))
+        meal_id += len(i_day)
+        meals.append(pd.DataFrame({COLUMN_MEAL_ID: meal_ids, COLUMN_ACCOUNT_ID: account_id,
+                                   COLUMN_DATE: dates[i_day], COLUMN_MEAL: MEALS[i_meal]}))
+
+        # Foodstuffs of the meals (mostly the favourites)
+        n_items = np.minimum(rng.geometric(FOODSTUFFS_PER_MEAL, len(meal_ids)), 20)
+        n_total = int(n_items.sum())
+        favourites = rng.choice(n_foodstuffs, FAVOURITES, p=popularity)
+        foodstuff_ids = np.where(rng.random(n_total) < FAVOURITE_SHARE,
+                                 rng.choice(favourites, n_total),
+                                 rng.choice(n_foodstuffs, n_total, p=popularity)) + 1
+        meal_foodstuffs.append(pd.DataFrame({COLUMN_MEAL_ID: np.repeat(meal_ids, n_items),
+                                             COLUMN_FOODSTUFF_ID: foodstuff_ids}))
+
+        # Symptom reports (each account has its typical symptoms)
+        symptom_days = dates[rng.random(n_days) < SYMPTOM_DAY_PROBABILITY]
+        n_reports = np.minimum(rng.geometric(0.6, len(symptom_days)), 9)
+        n_total = int(n_reports.sum())
+        unknown = rng.random(n_total) < TIMING_UNKNOWN_SHARE
+        reports.append(pd.DataFrame({COLUMN_REPORT_ID: np.arange(report_id, report_id + n_total),
+                                     COLUMN_ACCOUNT_ID: account_id,
+                                     COLUMN_DATE: np.repeat(symptom_days, n_reports),
+                                     COLUMN_SYMPTOM: rng.choice(rng.choice(SYMPTOMS, 4, replace=False), n_total),
+                                     COLUMN_GRADE: np.where(unknown, np.nan, rng.integers(1, 11, n_total)),
+                                     COLUMN_TIMING: np.where(unknown, TIMING_UNKNOWN, rng.choice(TIMINGS, n_total))}))
+        report_id += n_total
+
+    df_accounts = pd.DataFrame(accounts, columns=[COLUMN_ACCOUNT_ID, 'created_date'])
+    tables = {TABLE_ACCOUNT: df_accounts,
+              TABLE_MEAL: pd.concat(meals, ignore_index=True),
+              TABLE_MEAL_FOODSTUFF: pd.concat(meal_foodstuffs, ignore_index=True),
+              TABLE_REPORT: pd.concat(reports, ignore_index=True)}
+
+    # The dates as in the csv files of assets/toy_data.zip
+    for df in tables.values():
+        for column in (COLUMN_DATE, 'created_date'):
+            if column in df.columns:
+                df[column] = df[column].astype('datetime64[s]').dt.strftime('%Y-%m-%d')
+    return tables, meal_id, report_id
+
+
+
+class _Writer():
+    """Appends df's to the tables of a local SQLite or DuckDB file"""
+
+    def __init__(self, path, driver):
+        self.driver = driver
+        if driver == 'duckdb':
+            if duckdb is None:
+                raise ImportError(f"{ERR_PREFIX}DuckDB files require: pip install duckdb duckdb-engine")
+            self.connection = duckdb.connect(path)
+            self.connection.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+        else:
+            self.connection = sqlite3.connect(path)
+        self.created = set()
+
+    def append(self, table, df):
+        if self.driver == 'duckdb':
+            self.connection.register('df', df)
+            if table in self.created:
+                self.connection.execute(f"INSERT INTO {SCHEMA}.{table} SELECT * FROM df")
+            else:
+                self.connection.execute(f"CREATE OR REPLACE TABLE {SCHEMA}.{table} AS SELECT * FROM df")
+            self.connection.unregister('df')
+        else:
+            df.to_sql(table, self.connection, index=False, if_exists='append' if table in self.created else 'replace')
+        self.created.add(table)
+
+    def finish(self):
+        """Makes the indexes which the production database has (primary keys and foreign keys)"""
+        schema = f"{SCHEMA}." if self.driver == 'duckdb' else ""
+        for table, column, unique in [(TABLE_ACCOUNT, COLUMN_ACCOUNT_ID, True), (TABLE_FOODSTUFF, COLUMN_FOODSTUFF_ID, True),
+                                      (TABLE_MEAL, COLUMN_MEAL_ID, True), (TABLE_REPORT, COLUMN_REPORT_ID, True),
+                                      (TABLE_MEAL, COLUMN_ACCOUNT_ID, False), (TABLE_REPORT, COLUMN_ACCOUNT_ID, False),
+                                      (TABLE_MEAL_FOODSTUFF, COLUMN_MEAL_ID, False)]:
+            self.connection.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS ix_{table}_{column} "
+                                    f"ON {schema}{table} ({column})")
+        self.connection.commit()
+        self.connection.close()
+
+
+
+def make_toy_database(path, n_accounts=100, days=80, n_foodstuffs=None, driver=None, seed=0):
+    """
+    Writes the synthetic toy data into a local database file (replaces its tables).
+
+    Args:
+        days: diary days per account (on average)
+        n_foodstuffs: rows of the foodstuff table (None = depending on the number of accounts)
+        driver: 'sqlite' or 'duckdb' (None = by the file extension: .duckdb -> DuckDB)
+
+    Returns:
+        dict: table name -> number of rows
+    """
+    driver = driver or ('duckdb' if path.endswith('.duckdb') else 'sqlite')
+    n_foodstuffs = n_foodstuffs or int(min(50_000, 2_000 + 100 * n_accounts))
+    rng = np.random.default_rng(seed)
+
+    writer = _Writer(path, driver)
+    writer.append(TABLE_FOODSTUFF, make_foodstuffs(n_foodstuffs, rng))
+    n_rows = {TABLE_FOODSTUFF: n_foodstuffs}
+
+    meal_id = report_id = 1
+    for first in range(0, n_accounts, ACCOUNTS_PER_BATCH):
+        account_ids = range(FIRST_ACCOUNT_ID + first, FIRST_ACCOUNT_ID + min(first + ACCOUNTS_PER_BATCH, n_accounts))
+        tables, meal_id, report_id = make_accounts(account_ids, n_foodstuffs, days, rng, meal_id, report_id)
+        for table, df in tables.items():
+            writer.append(table, df)
+            n_rows[table] = n_rows.get(table, 0) + len(df)
+
+    writer.finish()
+    return n_rows
+
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description="writes synthetic toy data into a local SQLite or DuckDB file")
+    parser.add_argument('path', help="e.g. toy_data.db (SQLite) or toy_data.duckdb (DuckDB)")
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--days', type=float, default=80, help="diary days per account (on average)")
+    parser.add_argument('--foodstuffs', type=int, help="rows of the foodstuff table (default: by the number of accounts)")
+    parser.add_argument('--driver', choices=['sqlite', 'duckdb'], help="default: by the file extension")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        print(f"{args.path} exists, its tables are replaced")
+
+    time_start = perf_counter()
+    n_rows = make_toy_database(args.path, args.accounts, args.days, args.foodstuffs, args.driver, args.seed)
+    print(f"{args.path}: {', '.join(f'{table} {n:,}' for table, n in n_rows.items())} rows "
+          f"({sum(n_rows.values()):,} in total) in {perf_counter() - time_start:.1f} s")
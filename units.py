@@ -19,6 +19,7 @@ from constants import (DEBUG, BANNER_PATH, MIN_DATE, MAX_DATE, MEALS_MAPPING, AC
                        TITLE_UNIT_6, TITLE_UNIT_7, TITLE_UNIT_8,
                        TEXT_UNIT_0, TEXT_UNIT_1, TEXT_UNIT_5, TEXT_UNIT_7, TEXT_FOOTER,
                        A, B, C, D, E, css)
+from constants import COLUMN_NAME_REGEX, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY, COLUMN_AVG_GRADE
 
 
 
@@ -43,7 +44,9 @@ unit_0 = html.Div([
         html.H1("", id="unit_0_message_2", style={'textAlign':'center'}),  # "Informationen über..."
         dcc.Store(id="store_1"),   # df_eating (the merged table)
         dcc.Store(id="store_2"),   # df_symptomreport
-        dcc.Store(id="store_3")    # df_diary
+        dcc.Store(id="store_3"),   # df_diary
+        dcc.Store(id="store_4"),   # the loaded dates of the account's history (LAZY_HISTORY mode)
+        dcc.Store(id="store_session", storage_type='session')   # the id of the browser session (see `init_session` on app.py)
     ], id='unit_0')
 
 
@@ -211,6 +214,19 @@ unit_8 = html.Div([
     ], id='unit_8')
 
 
+# The engineered columns of the eating data (see ENGINEERED_COLUMNS on data_processing.py) which each unit reads
+# (unit_8: the "Probably bad foods table" made on the search), with LAZY_COLUMNS only these are computed
+UNIT_COLUMNS = {
+    'unit_2': [],
+    'unit_3': [COLUMN_NAME_REGEX],
+    'unit_4': [COLUMN_NAME_REGEX, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY],
+    'unit_5': [COLUMN_NAME_REGEX, COLUMN_AVG_GRADE],
+    'unit_6': [COLUMN_NAME_REGEX, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY],
+    'unit_7': [COLUMN_NAME_REGEX, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY],
+    'unit_8': [COLUMN_NAME_REGEX, COLUMN_SYMPTOM_SAME_DAY, COLUMN_SYMPTOM_NEXT_DAY],
+}
+
+
 # Footer
 footer = html.Div([  
         html.Br(), html.Hr(),
@@ -0,0 +1,126 @@
+"""
+Warm-up of the cache (see data_caching.py) for the accounts which will be reviewed, e.g. before clinic hours,
+so that the first "Suchen" click for each of them is a cache hit.
+
+The accounts are loaded and processed (as on a search in the app) in a process pool,
+at most --db-concurrency connections to the database are in use at the same time (the processing isn't limited).
+The app's processes cannot see each other's memory, the results are shared via CACHE_DIR (must be set in constants.py).
+
+$ python warm_up.py 101 102 103
+$ python warm_up.py --recent 50 --processes 8 --db-concurrency 4
+"""
+
+import os
+from time import perf_counter
+from argparse import ArgumentParser
+from collections import Counter
+from multiprocessing import Semaphore
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import event
+import data_access
+from data_access import get_sqlalchemy_engine, fetch_date_range, fetch_recently_active_accounts
+from data_processing import get_dataframes
+from computations import get_dates_range
+from developer_toolkit import get_columns_needed
+from units import UNIT_COLUMNS
+from constants import ERR_PREFIX, CACHE_DIR, LAZY_HISTORY, RECENT_WINDOW_DAYS, LAZY_COLUMNS, DEBUG
+
+
+# Max number of connections to the database in use at the same time (over all processes)
+DB_CONCURRENCY = 4
+
+# The engine of a worker process (see `_init_worker`)
+_engine = None
+
+
+
+def _init_worker(semaphore, make_engine):
+    global _engine
+    if make_engine:
+        _engine = make_engine()
+    else:
+        # The connections inherited from the parent process (forked) must not be used in this process
+        if data_access._engine is not None:
+            data_access._engine.dispose(close=False)
+        _engine = get_sqlalchemy_engine()
+
+    # A connection checked out of the pool holds the semaphore until it is returned, i.e. only the database access
+    # is limited (the cleaning and processing of the processes run at the same time)
+    event.listen(_engine, 'checkout', lambda *args: semaphore.acquire())
+    event.listen(_engine, 'checkin', lambda *args: semaphore.release())
+
+
+
+def warm_up_account(account_id):
+    """
+    Loads and processes the data of the account as a search in the app does (see `update_unit_0` on app.py),
+    the df's are written into the cache by `get_dataframes` (the tables of a search are made from them in the app,
+    they aren't cached).
+
+    Returns:
+        (account_id, status, seconds)
+    """
+    time_start = perf_counter()
+
+    # The same dates as a search in the app (i.e. the same cache key)
+    start_date = None
+    if LAZY_HISTORY:
+        _, max_date = fetch_date_range(account_id, _engine)
+        if max_date:
+            start_date, _ = get_dates_range(max_date, RECENT_WINDOW_DAYS)
+
+    # The same engineered columns as the app (i.e. the same cache entry)
+    columns = get_columns_needed(UNIT_COLUMNS) if LAZY_COLUMNS and not DEBUG else None
+    _, _, status = get_dataframes(account_id, _engine, start_date=start_date, columns=columns)
+
+    return (account_id, status, perf_counter() - time_start)
+
+
+
+def warm_up_accounts(account_ids, processes=None, db_concurrency=DB_CONCURRENCY, make_engine=None):
+    """
+    Warms up the cache for the accounts in a process pool.
+
+    Args:
+        processes: number of processes (None = number of CPUs)
+        db_concurrency: max number of connections to the database in use at the same time
+        make_engine: function which returns a sqlalchemy engine (called once in each process),
+                     None = the engine of the process (see `get_sqlalchemy_engine` on data_access.py)
+
+    Returns:
+        list of (account_id, status, seconds) in the order of account_ids
+    """
+    semaphore = Semaphore(db_concurrency)
+
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(semaphore, make_engine)) as executor:
+        return list(executor.map(warm_up_account, account_ids))
+
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description="loads the accounts into the cache (CACHE_DIR) before they are searched for")
+    parser.add_argument('account_ids', nargs='*', type=int)
+    parser.add_argument('--recent', type=int, metavar='N', help="the N most recently active accounts")
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--db-concurrency', type=int, default=DB_CONCURRENCY)
+    args = parser.parse_args()
+
+    if not CACHE_DIR:
+        parser.error(f"{ERR_PREFIX}CACHE_DIR is not set in constants.py (the app's processes would not see the results)")
+
+    account_ids = args.account_ids
+    if args.recent:
+        account_ids = account_ids + fetch_recently_active_accounts(args.recent)
+
+    if not account_ids:
+        parser.error("no accounts given (account ids or --recent N)")
+
+    time_start = perf_counter()
+    results = warm_up_accounts(account_ids, args.processes, args.db_concurrency)
+    seconds = perf_counter() - time_start
+
+    statuses = Counter({True: 'loaded', False: 'no data', None: 'not found', ValueError: 'bad id'}[status]
+                       for _, status, _ in results)
+    print(f"{len(results)} accounts in {seconds:.1f} s ({len(results) / seconds:.1f} accounts/s): {dict(statuses)}")
+    print(f"slowest: {', '.join(f'{account_id} ({t:.2f} s)' for account_id, _, t in sorted(results, key=lambda r: -r[2])[:5])}")